@@ -0,0 +1,437 @@
+# This file is the controller side action plugin of the aws_emr module.
+#
+# With a local connection the module logic runs in a helper process on the controller instead of being packaged,
+# copied and started for every task. The helper keeps the aws_emr module imported and one warm EMR client (and its
+# HTTPS connection pool) per region, credential set and task environment, and serves the tasks of all forks of one
+# ansible-playbook run over a unix socket. It exits with that run, or earlier after being idle for
+# aws_emr_helper_idle_timeout seconds, so its clients and their credentials do not outlive the playbook.
+#
+# The task arguments are validated by AnsibleModule like in the module itself. The task environment is not applied to
+# os.environ, which the threads of the helper share: its AWS_* variables become botocore session variables and its
+# proxy variables the proxies of the client config.
+#
+# Task variables:
+#   aws_emr_helper: true (default) uses the helper, false runs the module logic in the fork itself
+#   aws_emr_helper_idle_timeout: seconds the helper is kept alive without tasks, 60 by default
+#
+# The module is executed the usual way for other connections, check mode, async and traced tasks (trace_path or
+# AWS_EMR_TRACE_DIR), tasks with an ansible_python_interpreter other than the controller's python, tasks setting AWS_*
+# variables not listed in SESSION_ENVIRONMENT or CREDENTIAL_ENVIRONMENT, or when aws_emr.py or botocore cannot be
+# loaded by the controller's python.
+
+import errno
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import traceback
+from time import sleep, time
+
+from ansible.module_utils.basic import AnsibleModule, remove_values
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.module_utils.six import string_types
+from ansible.plugins.action import ActionBase
+
+HELPER_DIR = os.path.expanduser('~/.ansible/tmp/aws_emr_helper')
+HELPER_IDLE_TIMEOUT = 60
+HELPER_START_TIMEOUT = 10
+
+# Task environment variables and the botocore session variables they set, in botocore's order of precedence
+SESSION_ENVIRONMENT = [
+    ('AWS_DEFAULT_PROFILE', 'profile'),
+    ('AWS_PROFILE', 'profile'),
+    ('AWS_CONFIG_FILE', 'config_file'),
+    ('AWS_SHARED_CREDENTIALS_FILE', 'credentials_file'),
+    ('AWS_CA_BUNDLE', 'ca_bundle'),
+    ('AWS_DEFAULT_REGION', 'region'),
+    ('AWS_METADATA_SERVICE_TIMEOUT', 'metadata_service_timeout'),
+    ('AWS_METADATA_SERVICE_NUM_ATTEMPTS', 'metadata_service_num_attempts'),
+]
+# Used when the task has no aws_access_key, like botocore's environment credentials
+CREDENTIAL_ENVIRONMENT = ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_SECURITY_TOKEN')
+PROXY_ENVIRONMENT = ('http_proxy', 'https_proxy', 'no_proxy')
+
+loaded_modules = {}
+
+
+def load_aws_emr_module(path):
+    if path in loaded_modules:
+        return loaded_modules[path]
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        module = imp.load_source('ansible_aws_emr_module', path)
+    else:
+        spec = importlib.util.spec_from_file_location('ansible_aws_emr_module', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    loaded_modules[path] = module
+    return module
+
+
+def to_json_value(value):
+    # Results go back as JSON like the output of AnsibleModule.exit_json, with dates in ISO format
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def send_json(conn, value):
+    conn.send_bytes(json.dumps(value, default=to_json_value).encode('utf-8'))
+
+
+def recv_json(conn):
+    return json.loads(conn.recv_bytes().decode('utf-8'))
+
+
+class ModuleExit(Exception):
+    def __init__(self, result):
+        super(ModuleExit, self).__init__(result.get('msg'))
+        self.result = result
+
+
+class HelperUnavailable(Exception):
+    pass
+
+
+class InProcessModule(AnsibleModule):
+    # AnsibleModule validating the task arguments it is given instead of reading them from stdin or the
+    # _ANSIBLE_ARGS global, which the threads of the helper share. Exits raise ModuleExit.
+
+    def __init__(self, argument_spec, module_args):
+        self.module_args = module_args
+        super(InProcessModule, self).__init__(argument_spec=argument_spec, supports_check_mode=True)
+
+    def _load_params(self):
+        self.params = dict(self.module_args)
+
+    def _log_invocation(self):
+        # The controller logs the task, there is no module run to log on a target
+        pass
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs['failed'] = True
+        kwargs['msg'] = msg
+        raise ModuleExit(kwargs)
+
+
+class ModuleRunner(object):
+    # Runs aws_emr tasks in-process and reuses one EMR client per region, credential set and task environment
+
+    def __init__(self, aws_emr):
+        self.aws_emr = aws_emr
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, params, environment):
+        credentials, session_vars, proxies = get_client_settings(params, environment)
+        key = (credentials, tuple(sorted(session_vars.items())), proxies and tuple(sorted(proxies.items())))
+        with self.lock:
+            if params.get('api_stats'):
+                # api_stats hooks into the client, so concurrent tasks on a shared client would count each other's calls
+                return self.aws_emr.get_client(*credentials, session_vars=session_vars, proxies=proxies)
+            if key not in self.clients:
+                self.clients[key] = self.aws_emr.get_client(*credentials, session_vars=session_vars, proxies=proxies)
+            return self.clients[key]
+
+    def get_no_log_values(self, params):
+        return set(
+            str(params.get(param_name)) for param_name, param_spec in self.aws_emr.MODULE_ARGS.items()
+            if param_spec.get('no_log') and params.get(param_name) not in ('', None)
+        )
+
+    def finish(self, result, params):
+        # Like AnsibleModule.exit_json: the result gets the invocation and no_log values are masked everywhere
+        result = json.loads(json.dumps(result, default=to_json_value))
+        result.setdefault('invocation', dict(module_args=params))
+        return remove_values(result, self.get_no_log_values(params))
+
+    def run(self, module_args, environment=None):
+        try:
+            module = InProcessModule(self.aws_emr.MODULE_ARGS, module_args)
+        except ModuleExit as err:
+            return self.finish(err.result, module_args)
+        try:
+            self.aws_emr.validate_params(module)
+            if not self.aws_emr.import_botocore():
+                module.fail_json(msg='botocore required for this module')
+            self.aws_emr.run_mode(module, self.get_client(module.params, environment or {}))
+        except ModuleExit as err:
+            return self.finish(err.result, module.params)
+        except Exception as err:
+            return self.finish(dict(failed=True, msg='aws_emr failed: ' + str(err), exception=traceback.format_exc()), module.params)
+        return self.finish(dict(changed=False), module.params)
+
+
+def bypasses_proxy(host, no_proxy):
+    for entry in no_proxy.replace(' ', '').lower().split(','):
+        entry = entry.lstrip('.')
+        if entry == '*' or (entry != '' and (host == entry or host.endswith('.' + entry))):
+            return True
+    return False
+
+
+def get_client_settings(params, environment):
+    # The get_client arguments for the task environment on top of the controller's, which the helper inherited
+    region = params.get('region')
+    credentials = (region, params.get('aws_access_key'), params.get('aws_secret_key'), params.get('security_token'))
+    if credentials[1] in ('', None) and environment.get('AWS_ACCESS_KEY_ID'):
+        credentials = (
+            region, environment['AWS_ACCESS_KEY_ID'], environment.get('AWS_SECRET_ACCESS_KEY'),
+            environment.get('AWS_SESSION_TOKEN') or environment.get('AWS_SECURITY_TOKEN')
+        )
+    session_vars = {}
+    for name, session_var in reversed(SESSION_ENVIRONMENT):
+        if environment.get(name):
+            session_vars[session_var] = environment[name]
+
+    proxies = None
+    task_proxy_names = [name for name in environment if name.lower() in PROXY_ENVIRONMENT]
+    if task_proxy_names:
+        # Lower case names win over upper case ones, like in urllib
+        proxy_environment = {}
+        for proxy_source in (os.environ, environment):
+            for name in sorted(proxy_source):
+                if name.lower() in PROXY_ENVIRONMENT:
+                    proxy_environment[name.lower()] = proxy_source[name]
+        # All the regions of MODULE_ARGS have their EMR endpoint under amazonaws.com
+        host = 'elasticmapreduce.%s.amazonaws.com' % region
+        proxies = {}
+        if not bypasses_proxy(host, proxy_environment.get('no_proxy', '')):
+            for scheme in ('http', 'https'):
+                if proxy_environment.get(scheme + '_proxy'):
+                    proxies[scheme] = proxy_environment[scheme + '_proxy']
+    return credentials, session_vars, proxies
+
+
+def supports_environment(environment):
+    handled_names = set(name for name, session_var in SESSION_ENVIRONMENT) | set(CREDENTIAL_ENVIRONMENT)
+    return all(not name.startswith('AWS_') or name in handled_names for name in environment)
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def get_helper_address(module_path, owner_pid):
+    # Every ansible-playbook run (owner_pid) gets its own helper. So does a changed aws_emr.py or action plugin, the
+    # old helper exits when it becomes idle, and another controller environment: the helper inherits the environment
+    # of the fork that started it.
+    key = '%s:%s:%s:%s:%s:%s' % (
+        module_path, os.path.getmtime(module_path), os.path.getmtime(os.path.abspath(__file__)), sys.executable,
+        owner_pid, sorted(os.environ.items())
+    )
+    return os.path.join(HELPER_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+
+def call_helper(address, task):
+    from multiprocessing.connection import Client
+    try:
+        with open(address + '.key', 'rb') as key_file:
+            authkey = key_file.read()
+        conn = Client(address + '.sock', family='AF_UNIX', authkey=authkey)
+    except Exception:
+        raise HelperUnavailable()
+    try:
+        try:
+            send_json(conn, task)
+            recv_json(conn)
+        except Exception:
+            # Nothing was run before the helper acknowledged the task
+            raise HelperUnavailable()
+        try:
+            return recv_json(conn)
+        except Exception:
+            return dict(failed=True, msg='aws_emr helper exited before returning the result')
+    finally:
+        conn.close()
+
+
+def start_helper(address, module_path, idle_timeout, owner_pid):
+    authkey = os.urandom(32)
+    key_fd = os.open(address + '.key', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(key_fd, 'wb') as key_file:
+        key_file.write(authkey)
+    if os.path.exists(address + '.sock'):
+        os.remove(address + '.sock')
+    # The helper stays in the process group of the fork, which ansible-playbook signals when it is interrupted
+    with open(os.devnull, 'r+b') as devnull:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', address, module_path, str(idle_timeout), str(owner_pid)],
+            stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True
+        )
+    deadline = time() + HELPER_START_TIMEOUT
+    while not os.path.exists(address + '.sock'):
+        if process.poll() is not None or time() > deadline:
+            raise HelperUnavailable()
+        sleep(0.05)
+
+
+def run_with_helper(module_path, module_args, environment, idle_timeout, owner_pid):
+    import fcntl
+    if not os.path.isdir(HELPER_DIR):
+        os.makedirs(HELPER_DIR, 0o700)
+    address = get_helper_address(module_path, owner_pid)
+    task = dict(module_args=module_args, environment=environment)
+    try:
+        return call_helper(address, task)
+    except HelperUnavailable:
+        pass
+    # Only one fork starts the helper, the others wait for it and connect
+    with open(address + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return call_helper(address, task)
+        except HelperUnavailable:
+            start_helper(address, module_path, idle_timeout, owner_pid)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return call_helper(address, task)
+
+
+def serve(address, module_path, idle_timeout, owner_pid):
+    from multiprocessing.connection import Listener
+    with open(address + '.key', 'rb') as key_file:
+        authkey = key_file.read()
+    runner = ModuleRunner(load_aws_emr_module(module_path))
+    runner.aws_emr.import_botocore()
+
+    state = dict(active=0, last_used=time())
+    lock = threading.Lock()
+    old_umask = os.umask(0o177)
+    listener = Listener(address + '.sock', family='AF_UNIX', authkey=authkey)
+    os.umask(old_umask)
+
+    def stop_when_done():
+        # Tasks still running when ansible-playbook is gone have no one to return to
+        while True:
+            sleep(1)
+            with lock:
+                if not is_running(owner_pid) or (state['active'] == 0 and time() - state['last_used'] > idle_timeout):
+                    os.remove(address + '.sock')
+                    os._exit(0)
+
+    def handle(conn):
+        try:
+            task = recv_json(conn)
+            send_json(conn, 'accepted')
+            send_json(conn, runner.run(task['module_args'], task['environment']))
+        except Exception:
+            pass
+        finally:
+            conn.close()
+            with lock:
+                state['active'] -= 1
+                state['last_used'] = time()
+
+    watcher = threading.Thread(target=stop_when_done)
+    watcher.daemon = True
+    watcher.start()
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception:
+            continue
+        with lock:
+            state['active'] += 1
+        worker = threading.Thread(target=handle, args=(conn,))
+        worker.daemon = True
+        worker.start()
+
+
+class ActionModule(ActionBase):
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = self._task.args.copy()
+        environment = self.get_task_environment()
+        if not self.can_run_in_process(module_args, environment, task_vars):
+            result.update(self._execute_module(module_name='aws_emr', module_args=module_args, task_vars=task_vars))
+            return result
+
+        try:
+            module_path = self.find_module_path()
+            runner = ModuleRunner(load_aws_emr_module(module_path))
+            # The module would report a missing botocore, but the target python may well have it
+            if not runner.aws_emr.import_botocore():
+                raise ImportError('botocore')
+        except Exception:
+            result.update(self._execute_module(module_name='aws_emr', module_args=module_args, task_vars=task_vars))
+            return result
+
+        module_args = self.resolve_paths(runner.aws_emr, module_args)
+        if boolean(task_vars.get('aws_emr_helper', True), strict=False):
+            idle_timeout = int(task_vars.get('aws_emr_helper_idle_timeout', HELPER_IDLE_TIMEOUT))
+            try:
+                # Forks are children of the ansible-playbook process
+                result.update(run_with_helper(module_path, module_args, environment, idle_timeout, os.getppid()))
+                return result
+            except (HelperUnavailable, OSError, IOError):
+                pass
+        result.update(runner.run(module_args, environment))
+        return result
+
+    def can_run_in_process(self, module_args, environment, task_vars):
+        # A trace of a module run covers interpreter start and module loading, which the helper skips
+        return (
+            getattr(self._connection, 'transport', None) == 'local'
+            and not self._play_context.check_mode
+            and not self._task.async_val
+            and module_args.get('trace_path') in ('', None)
+            and not os.environ.get('AWS_EMR_TRACE_DIR')
+            and 'AWS_EMR_TRACE_DIR' not in environment
+            and supports_environment(environment)
+            and self.uses_controller_python(task_vars)
+        )
+
+    def uses_controller_python(self, task_vars):
+        # The module logic runs with the controller's python and its packages, not the one the task asked for
+        interpreter = task_vars.get('ansible_python_interpreter')
+        if interpreter in ('', None):
+            return True
+        interpreter = self._templar.template(interpreter)
+        return os.path.realpath(str(interpreter)) == os.path.realpath(sys.executable)
+
+    def get_task_environment(self):
+        environment = {}
+        environment_items = self._task.environment or []
+        if isinstance(environment_items, dict):
+            environment_items = [environment_items]
+        for environment_item in environment_items:
+            environment_item = self._templar.template(environment_item)
+            if isinstance(environment_item, dict):
+                environment.update(environment_item)
+        return dict((str(name), str(value)) for name, value in environment.items())
+
+    def find_module_path(self):
+        module_path = self._shared_loader_obj.module_loader.find_plugin('aws_emr')
+        if module_path in ('', None):
+            module_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'aws_emr.py')
+        return os.path.abspath(module_path)
+
+    def resolve_paths(self, aws_emr, module_args):
+        # The helper may have been started from another directory, so relative file parameters are made absolute here
+        resolved_args = dict(module_args)
+        for param_name, param_spec in aws_emr.MODULE_ARGS.items():
+            value = resolved_args.get(param_name)
+            if param_spec.get('type') == 'path' and isinstance(value, string_types) and value != '':
+                resolved_args[param_name] = os.path.abspath(os.path.expanduser(os.path.expandvars(value)))
+        return resolved_args
+
+
+if __name__ == '__main__' and len(sys.argv) == 6 and sys.argv[1] == '--serve':
+    serve(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
@@ -0,0 +1,666 @@
+# Offline stand-in for the EMR API.
+#
+# FakeEmrBackend answers the calls of a real botocore EMR client from memory: the client still validates and
+# serializes every request, then a before-call handler (the hook botocore's Stubber uses) returns the simulated
+# response instead of sending it. It simulates:
+#   - clusters with instance groups or fleets, instances, steps and bootstrap actions
+#   - on-demand and spot capacity of fleets, with one weighted capacity per fleet
+#   - steps that run StepConcurrencyLevel (1 by default) at a time once the cluster is up, PENDING -> RUNNING ->
+#     COMPLETED, every transition_calls reads; a step_failure_rate share of them ends FAILED. Clusters created with
+#     KeepJobFlowAliveWhenNoSteps false terminate when their steps are done, TERMINATE_CLUSTER steps on failure
+#   - cluster tags, release labels and applications
+#   - automatic scaling policies of instance groups and managed scaling policies of clusters
+#   - Marker pagination of the list_* operations with EMR's page size of 50
+#   - cluster and instance collection state transitions, advanced every transition_calls reads; resized groups and
+#     fleets stay as they are for transition_calls reads, then turn RESIZING and start half of their pending
+#     instances per step
+#   - ThrottlingException at a given rate and a fixed latency per call
+# API calls and throttled calls are counted per operation.
+#
+#   backend = FakeEmrBackend(seed=1)
+#   cluster_id = backend.add_cluster('EMR-EXAMPLE', instance_count=100)
+#   backend.add_clusters(5000)
+#   emr_client = backend.create_client()
+
+import calendar
+import copy
+import json
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from time import sleep, time
+
+import botocore.session
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from dateutil.tz import tzutc
+
+PAGE_SIZE = 50
+
+ACTIVE_CLUSTER_STATES = ['STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING']
+
+# Transitional states and the state they move to
+CLUSTER_TRANSITIONS = {
+    'STARTING': 'BOOTSTRAPPING',
+    'BOOTSTRAPPING': 'WAITING',
+    'TERMINATING': 'TERMINATED'
+}
+INSTANCE_COLLECTION_TRANSITIONS = {
+    'PROVISIONING': 'RUNNING',
+    'BOOTSTRAPPING': 'RUNNING',
+    'RESIZING': 'RUNNING'
+}
+STEP_TRANSITIONS = {
+    'PENDING': 'RUNNING',
+    'RUNNING': 'COMPLETED'
+}
+
+
+class FakeApiError(Exception):
+    def __init__(self, code, message, status_code=400):
+        super(FakeApiError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+def to_epoch(value):
+    if value.tzinfo is None:
+        return calendar.timegm(value.timetuple())
+    return calendar.timegm(value.utctimetuple())
+
+
+def to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tzutc())
+
+
+def paginate(items, params):
+    start = int(params.get('Marker') or 0)
+    page = items[start:start + PAGE_SIZE]
+    marker = None
+    if start + PAGE_SIZE < len(items):
+        marker = str(start + PAGE_SIZE)
+    return page, marker
+
+
+def page_response(result_key, items, params):
+    page, marker = paginate(items, params)
+    response = {result_key: page}
+    if marker is not None:
+        response['Marker'] = marker
+    return response
+
+
+class FakeEmrBackend(object):
+
+    def __init__(self, seed=0, throttle_rate=0.0, latency=0.0, transition_calls=2, now=None, step_failure_rate=0.0):
+        self.random = random.Random(seed)
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.transition_calls = transition_calls
+        self.step_failure_rate = step_failure_rate
+        self.now = to_epoch(now or datetime.utcnow())
+        self.started = time()
+        self.clusters = {}
+        self.cluster_order = []
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    # Building the account
+
+    def new_id(self, prefix):
+        self.next_id += 1
+        return '%s-%012X' % (prefix, self.next_id)
+
+    def add_cluster(self, name, state='WAITING', fleet=False, instance_count=3, age=3600, step_count=3, tags=None, termination_protected=False, weighted_capacity=1,
+                    release_label='emr-5.8.0', applications=('Hadoop', 'Spark')):
+        cluster_id = self.new_id('j')
+        cluster = dict(
+            Id=cluster_id,
+            Name=name,
+            ReleaseLabel=release_label,
+            Applications=[dict(Name=application) for application in applications],
+            State=state,
+            StateChangeReason={},
+            Created=self.now - age,
+            InstanceCollectionType='INSTANCE_FLEET' if fleet else 'INSTANCE_GROUP',
+            Tags=tags or [],
+            TerminationProtected=termination_protected,
+            ManagedScalingPolicy=None,
+            Collections=[],
+            Instances=[],
+            Steps=[],
+            StepConcurrencyLevel=1,
+            KeepJobFlowAliveWhenNoSteps=True,
+            LogUri='s3n://fake-emr-logs/',
+            BootstrapActions=[dict(Name='bootstrap', ScriptPath='s3://bootstrap/setup.sh', Args=[])],
+            Number=len(self.clusters),
+            Reads=0
+        )
+        self.clusters[cluster_id] = cluster
+        self.cluster_order.insert(0, cluster_id)
+        core_count = max(1, (instance_count - 1) // 2)
+        task_count = max(0, instance_count - 1 - core_count)
+        collection_state = 'RUNNING' if state in ('RUNNING', 'WAITING') else 'PROVISIONING'
+        for role, count in (('MASTER', 1), ('CORE', core_count), ('TASK', task_count)):
+            self.add_collection(cluster, role, role.capitalize(), count, collection_state, weighted_capacity=weighted_capacity)
+        for index in range(step_count):
+            cluster['Steps'].insert(0, dict(
+                Id=self.new_id('s'),
+                Name='step-%d' % index,
+                State='COMPLETED',
+                Created=cluster['Created'] + 60 * (index + 1),
+                Started=cluster['Created'] + 60 * (index + 1),
+                Ended=cluster['Created'] + 60 * (index + 1) + 30,
+                ActionOnFailure='CONTINUE',
+                Config=dict(Jar='command-runner.jar', Args=[]),
+                Reads=0
+            ))
+        return cluster_id
+
+    def add_clusters(self, count, active_ratio=0.2, max_age_days=60):
+        # Background clusters named cluster-<n>, most of them terminated, created over the last max_age_days
+        cluster_ids = []
+        for index in range(count):
+            if self.random.random() < active_ratio:
+                state = self.random.choice(['WAITING', 'RUNNING'])
+            else:
+                state = self.random.choice(['TERMINATED', 'TERMINATED_WITH_ERRORS'])
+            age = self.random.randint(60, max_age_days * 86400)
+            cluster_ids.append(self.add_cluster('cluster-%d' % index, state=state, fleet=self.random.random() < 0.3, age=age, step_count=1))
+        return cluster_ids
+
+    def add_collection(self, cluster, role, name, count, state='RUNNING', instance_type='m4.large', market='ON_DEMAND', weighted_capacity=1):
+        # count is in instances; a fleet instance provides weighted_capacity units
+        fleet = cluster['InstanceCollectionType'] == 'INSTANCE_FLEET'
+        weighted_capacity = weighted_capacity if fleet else 1
+        collection = dict(
+            Id=self.new_id('if' if fleet else 'ig'),
+            Name=name,
+            Role=role,
+            State=state,
+            InstanceType=instance_type,
+            Market=market,
+            WeightedCapacity=weighted_capacity,
+            Requested=count * weighted_capacity,
+            SpotRequested=0,
+            AutoScalingPolicy=None,
+            PendingResize=None,
+            Reads=0
+        )
+        cluster['Collections'].append(collection)
+        self.resize_instances(cluster, collection, count)
+        return collection
+
+    def resize_instances(self, cluster, collection, count, market=None):
+        market = market or collection['Market']
+        current = [instance for instance in cluster['Instances'] if instance['CollectionId'] == collection['Id'] and instance['Market'] == market and instance['State'] != 'TERMINATED']
+        for instance in current[count:]:
+            instance['State'] = 'TERMINATED'
+        for _ in range(count - len(current)):
+            address = len(cluster['Instances']) + 4
+            cluster['Instances'].append(dict(
+                Id=self.new_id('ci'),
+                Ec2InstanceId=self.new_id('i').lower(),
+                CollectionId=collection['Id'],
+                PrivateIpAddress='10.%d.%d.%d' % (cluster['Number'] % 250, address // 250 % 250, address % 250),
+                State='RUNNING' if collection['State'] == 'RUNNING' else 'PROVISIONING',
+                InstanceType=collection['InstanceType'],
+                Market=market
+            ))
+
+    # Client wiring
+
+    def create_client(self, region='us-east-1'):
+        session = botocore.session.get_session()
+        emr_client = session.create_client(
+            'emr',
+            region_name=region,
+            config=Config(retries={'max_attempts': 0}),
+            aws_access_key_id='AKIAFAKEEMRBACKEND',
+            aws_secret_access_key='fake'
+        )
+        self.attach(emr_client)
+        return emr_client
+
+    def attach(self, emr_client):
+        emr_client.meta.events.register('before-parameter-build.emr.*', self.capture_params)
+        emr_client.meta.events.register('before-call.emr.*', self.handle_call)
+        return emr_client
+
+    def capture_params(self, params, context, **kwargs):
+        context['fake_emr_params'] = dict(params)
+
+    def handle_call(self, model, context, **kwargs):
+        operation_name = model.name
+        params = context.get('fake_emr_params', {})
+        if self.latency > 0:
+            sleep(self.latency)
+        with self.lock:
+            self.calls[operation_name] += 1
+            try:
+                if self.throttle_rate > 0 and self.random.random() < self.throttle_rate:
+                    self.throttled[operation_name] += 1
+                    raise FakeApiError('ThrottlingException', 'Rate exceeded')
+                handler = getattr(self, operation_name, None)
+                if handler is None:
+                    raise FakeApiError('UnsupportedOperation', operation_name + ' is not simulated')
+                parsed = handler(params)
+                status_code = 200
+            except FakeApiError as err:
+                parsed = dict(Error=dict(Code=err.code, Message=err.message))
+                status_code = err.status_code
+        parsed['ResponseMetadata'] = dict(HTTPStatusCode=status_code, RequestId='fake')
+        # The size of the JSON body EMR would have sent
+        headers = {'content-length': str(len(json.dumps(parsed, default=str)))}
+        return AWSResponse(None, status_code, headers, None), parsed
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    # Simulation helpers
+
+    def get_cluster(self, cluster_id):
+        cluster = self.clusters.get(cluster_id)
+        if cluster is None:
+            raise FakeApiError('InvalidRequestException', 'Cluster id \'' + str(cluster_id) + '\' is not valid.')
+        return cluster
+
+    def advance(self, item, transitions):
+        # Every transition_calls reads move a transitional item one state further
+        if item['State'] not in transitions:
+            return False
+        item['Reads'] += 1
+        if item['Reads'] < self.transition_calls:
+            return False
+        item['Reads'] = 0
+        item['State'] = transitions[item['State']]
+        return True
+
+    def advance_collection(self, cluster, collection):
+        # Every transition_calls reads start half of the pending instances, the collection is RUNNING once all are
+        if collection['PendingResize'] is not None:
+            # Like EMR, a resize request takes effect a while after it was accepted
+            collection['Reads'] += 1
+            if collection['Reads'] < self.transition_calls:
+                return
+            collection['Reads'] = 0
+            for market, count in collection['PendingResize']:
+                self.resize_instances(cluster, collection, count, market)
+            collection['PendingResize'] = None
+            collection['State'] = 'RESIZING'
+            return
+        if collection['State'] not in INSTANCE_COLLECTION_TRANSITIONS:
+            return
+        collection['Reads'] += 1
+        if collection['Reads'] < self.transition_calls:
+            return
+        collection['Reads'] = 0
+        pending = [instance for instance in cluster['Instances'] if instance['CollectionId'] == collection['Id'] and instance['State'] == 'PROVISIONING']
+        for instance in pending[:(len(pending) + 1) // 2]:
+            instance['State'] = 'RUNNING'
+        if len(pending) <= 1:
+            collection['State'] = INSTANCE_COLLECTION_TRANSITIONS[collection['State']]
+
+    def advance_cluster(self, cluster):
+        self.advance(cluster, CLUSTER_TRANSITIONS)
+        if cluster['State'] == 'WAITING' and not cluster['KeepJobFlowAliveWhenNoSteps']:
+            if not any(step['State'] in STEP_TRANSITIONS for step in cluster['Steps']):
+                cluster['State'] = 'TERMINATING'
+        if cluster['State'] == 'WAITING':
+            for collection in cluster['Collections']:
+                if collection['State'] == 'PROVISIONING':
+                    collection['State'] = 'RUNNING'
+                    for instance in cluster['Instances']:
+                        if instance['CollectionId'] == collection['Id'] and instance['State'] == 'PROVISIONING':
+                            instance['State'] = 'RUNNING'
+        elif cluster['State'] == 'TERMINATED':
+            for collection in cluster['Collections']:
+                collection['State'] = 'TERMINATED'
+            for instance in cluster['Instances']:
+                instance['State'] = 'TERMINATED'
+
+    def advance_step(self, cluster, step):
+        # Only the oldest StepConcurrencyLevel unfinished steps of a started cluster move on
+        if cluster['State'] not in ('RUNNING', 'WAITING'):
+            return
+        unfinished_steps = [unfinished_step for unfinished_step in reversed(cluster['Steps']) if unfinished_step['State'] in STEP_TRANSITIONS]
+        if not any(unfinished_step is step for unfinished_step in unfinished_steps[:cluster['StepConcurrencyLevel']]):
+            return
+        if not self.advance(step, STEP_TRANSITIONS):
+            return
+        if step['State'] == 'RUNNING':
+            step['Started'] = self.clock()
+            return
+        step['Ended'] = self.clock()
+        if self.random.random() < self.step_failure_rate:
+            step['State'] = 'FAILED'
+            if step['ActionOnFailure'] in ('TERMINATE_CLUSTER', 'TERMINATE_JOB_FLOW'):
+                for unfinished_step in cluster['Steps']:
+                    if unfinished_step['State'] == 'PENDING':
+                        unfinished_step['State'] = 'CANCELLED'
+                cluster['State'] = 'TERMINATING'
+
+    def clock(self):
+        return self.now + (time() - self.started)
+
+    def get_collection(self, cluster, collection_id):
+        for collection in cluster['Collections']:
+            if collection['Id'] == collection_id:
+                return collection
+        raise FakeApiError('InvalidRequestException', 'Instance collection id \'' + str(collection_id) + '\' is not valid.')
+
+    def running_count(self, cluster, collection, market=None):
+        return len([
+            instance for instance in cluster['Instances']
+            if instance['CollectionId'] == collection['Id'] and instance['State'] == 'RUNNING' and market in (None, instance['Market'])
+        ])
+
+    def cluster_status(self, cluster):
+        return dict(
+            State=cluster['State'],
+            StateChangeReason=cluster['StateChangeReason'],
+            Timeline=dict(CreationDateTime=to_datetime(cluster['Created']))
+        )
+
+    def collection_response(self, cluster, collection):
+        status = dict(State=collection['State'], StateChangeReason={})
+        if cluster['InstanceCollectionType'] == 'INSTANCE_FLEET':
+            return dict(
+                Id=collection['Id'],
+                Name=collection['Name'],
+                Status=status,
+                InstanceFleetType=collection['Role'],
+                TargetOnDemandCapacity=collection['Requested'],
+                TargetSpotCapacity=collection['SpotRequested'],
+                ProvisionedOnDemandCapacity=self.running_count(cluster, collection, 'ON_DEMAND') * collection['WeightedCapacity'],
+                ProvisionedSpotCapacity=self.running_count(cluster, collection, 'SPOT') * collection['WeightedCapacity'],
+                InstanceTypeSpecifications=[dict(InstanceType=collection['InstanceType'], WeightedCapacity=collection['WeightedCapacity'])]
+            )
+        response = dict(
+            Id=collection['Id'],
+            Name=collection['Name'],
+            Status=status,
+            Market=collection['Market'],
+            InstanceGroupType=collection['Role'],
+            InstanceType=collection['InstanceType'],
+            RequestedInstanceCount=collection['Requested'],
+            RunningInstanceCount=self.running_count(cluster, collection)
+        )
+        if collection['AutoScalingPolicy'] is not None:
+            response['AutoScalingPolicy'] = collection['AutoScalingPolicy']
+        return response
+
+    def instance_response(self, cluster, instance):
+        response = dict(
+            Id=instance['Id'],
+            Ec2InstanceId=instance['Ec2InstanceId'],
+            PrivateIpAddress=instance['PrivateIpAddress'],
+            PrivateDnsName='ip-' + instance['PrivateIpAddress'].replace('.', '-') + '.ec2.internal',
+            Status=dict(State=instance['State']),
+            Market=instance['Market'],
+            InstanceType=instance['InstanceType']
+        )
+        if cluster['InstanceCollectionType'] == 'INSTANCE_FLEET':
+            response['InstanceFleetId'] = instance['CollectionId']
+        else:
+            response['InstanceGroupId'] = instance['CollectionId']
+        return response
+
+    # Simulated operations, named after the EMR API
+
+    def ListClusters(self, params):
+        created_after = params.get('CreatedAfter')
+        created_before = params.get('CreatedBefore')
+        states = params.get('ClusterStates')
+        summaries = []
+        for cluster_id in self.cluster_order:
+            cluster = self.clusters[cluster_id]
+            if states and cluster['State'] not in states:
+                continue
+            if created_after is not None and cluster['Created'] < to_epoch(created_after):
+                continue
+            if created_before is not None and cluster['Created'] > to_epoch(created_before):
+                continue
+            summaries.append(dict(Id=cluster['Id'], Name=cluster['Name'], Status=self.cluster_status(cluster), NormalizedInstanceHours=0))
+        return page_response('Clusters', summaries, params)
+
+    def DescribeCluster(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        self.advance_cluster(cluster)
+        return dict(Cluster=dict(
+            Id=cluster['Id'],
+            Name=cluster['Name'],
+            Status=self.cluster_status(cluster),
+            InstanceCollectionType=cluster['InstanceCollectionType'],
+            ReleaseLabel=cluster['ReleaseLabel'],
+            AutoScalingRole='EMR_AutoScaling_DefaultRole',
+            Applications=cluster['Applications'],
+            Tags=cluster['Tags'],
+            TerminationProtected=cluster['TerminationProtected'],
+            LogUri=cluster['LogUri'],
+            StepConcurrencyLevel=cluster['StepConcurrencyLevel'],
+            Ec2InstanceAttributes=dict(Ec2SubnetId='subnet-fake'),
+            MasterPublicDnsName='ip-10-0-0-4.ec2.internal'
+        ))
+
+    def ListInstanceGroups(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        for collection in cluster['Collections']:
+            self.advance_collection(cluster, collection)
+        return page_response('InstanceGroups', [self.collection_response(cluster, collection) for collection in cluster['Collections']], params)
+
+    def ListInstanceFleets(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        for collection in cluster['Collections']:
+            self.advance_collection(cluster, collection)
+        return page_response('InstanceFleets', [self.collection_response(cluster, collection) for collection in cluster['Collections']], params)
+
+    def ListInstances(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        roles = params.get('InstanceGroupTypes') or ([params['InstanceFleetType']] if params.get('InstanceFleetType') else None)
+        collection_id = params.get('InstanceGroupId') or params.get('InstanceFleetId')
+        states = params.get('InstanceStates')
+        role_by_collection_id = dict((collection['Id'], collection['Role']) for collection in cluster['Collections'])
+        instances = []
+        for instance in cluster['Instances']:
+            if states and instance['State'] not in states:
+                continue
+            if collection_id and instance['CollectionId'] != collection_id:
+                continue
+            if roles and role_by_collection_id.get(instance['CollectionId']) not in roles:
+                continue
+            instances.append(self.instance_response(cluster, instance))
+        return page_response('Instances', instances, params)
+
+    def ListSteps(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        # Waits for steps read only the steps, the cluster has to start meanwhile
+        self.advance_cluster(cluster)
+        states = params.get('StepStates')
+        step_ids = params.get('StepIds')
+        steps = []
+        for step in cluster['Steps']:
+            if states and step['State'] not in states:
+                continue
+            if step_ids and step['Id'] not in step_ids:
+                continue
+            self.advance_step(cluster, step)
+            timeline = dict(CreationDateTime=to_datetime(step['Created']))
+            if step.get('Started') is not None:
+                timeline['StartDateTime'] = to_datetime(step['Started'])
+            if step.get('Ended') is not None:
+                timeline['EndDateTime'] = to_datetime(step['Ended'])
+            status = dict(State=step['State'], StateChangeReason={}, Timeline=timeline)
+            if step['State'] == 'FAILED':
+                status['FailureDetails'] = dict(Reason='Unknown Error.', Message='Step failed with exitCode 1.')
+            steps.append(dict(
+                Id=step['Id'],
+                Name=step['Name'],
+                ActionOnFailure=step['ActionOnFailure'],
+                Config=step['Config'],
+                Status=status
+            ))
+        return page_response('Steps', steps, params)
+
+    def ListBootstrapActions(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        return page_response('BootstrapActions', list(cluster['BootstrapActions']), params)
+
+    def RunJobFlow(self, params):
+        instances = params.get('Instances', {})
+        fleet = 'InstanceFleets' in instances
+        cluster_id = self.add_cluster(
+            params['Name'],
+            state='STARTING',
+            fleet=fleet,
+            instance_count=0,
+            age=0,
+            step_count=0,
+            tags=params.get('Tags'),
+            termination_protected=instances.get('TerminationProtected', False),
+            release_label=params.get('ReleaseLabel', 'emr-5.8.0'),
+            applications=[application['Name'] for application in params.get('Applications', [])]
+        )
+        cluster = self.clusters[cluster_id]
+        cluster['LogUri'] = params.get('LogUri')
+        cluster['StepConcurrencyLevel'] = params.get('StepConcurrencyLevel', 1)
+        cluster['KeepJobFlowAliveWhenNoSteps'] = instances.get('KeepJobFlowAliveWhenNoSteps', True)
+        cluster['Collections'] = []
+        cluster['Instances'] = []
+        for collection in instances.get('InstanceFleets') or instances.get('InstanceGroups') or []:
+            if fleet:
+                role = collection['InstanceFleetType']
+                count = collection.get('TargetOnDemandCapacity', 0) + collection.get('TargetSpotCapacity', 0)
+                instance_type = collection.get('InstanceTypeConfigs', [{}])[0].get('InstanceType', 'm4.large')
+            else:
+                role = collection['InstanceRole']
+                count = collection['InstanceCount']
+                instance_type = collection['InstanceType']
+            self.add_collection(cluster, role, collection.get('Name', role.capitalize()), count, 'PROVISIONING', instance_type, collection.get('Market', 'ON_DEMAND'))
+        if params.get('Steps'):
+            self.AddJobFlowSteps(dict(JobFlowId=cluster_id, Steps=params['Steps']))
+        return dict(JobFlowId=cluster_id)
+
+    def AddJobFlowSteps(self, params):
+        cluster = self.get_cluster(params['JobFlowId'])
+        if len(params['Steps']) > 256:
+            raise FakeApiError('ValidationException', 'At most 256 steps can be added in one request.')
+        step_ids = []
+        for step in params['Steps']:
+            hadoop_jar_step = step['HadoopJarStep']
+            step_ids.append(self.new_id('s'))
+            cluster['Steps'].insert(0, dict(
+                Id=step_ids[-1],
+                Name=step['Name'],
+                State='PENDING',
+                Created=self.now,
+                ActionOnFailure=step.get('ActionOnFailure', 'CONTINUE'),
+                Config=dict(Jar=hadoop_jar_step['Jar'], Args=hadoop_jar_step.get('Args', [])),
+                Reads=0
+            ))
+        return dict(StepIds=step_ids)
+
+    def AddInstanceGroups(self, params):
+        cluster = self.get_cluster(params['JobFlowId'])
+        collection_ids = []
+        for instance_group in params['InstanceGroups']:
+            collection = self.add_collection(cluster, instance_group['InstanceRole'], instance_group.get('Name', 'Task'), instance_group['InstanceCount'], 'PROVISIONING', instance_group['InstanceType'], instance_group.get('Market', 'ON_DEMAND'))
+            collection_ids.append(collection['Id'])
+        return dict(JobFlowId=cluster['Id'], InstanceGroupIds=collection_ids)
+
+    def ModifyInstanceGroups(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        for instance_group in params.get('InstanceGroups', []):
+            collection = self.get_collection(cluster, instance_group['InstanceGroupId'])
+            if 'InstanceCount' in instance_group:
+                collection['Requested'] = instance_group['InstanceCount']
+                collection['PendingResize'] = [(None, instance_group['InstanceCount'])]
+                collection['Reads'] = 0
+        return {}
+
+    def ModifyInstanceFleet(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        instance_fleet = params['InstanceFleet']
+        collection = self.get_collection(cluster, instance_fleet['InstanceFleetId'])
+        collection['Requested'] = instance_fleet.get('TargetOnDemandCapacity', collection['Requested'])
+        collection['SpotRequested'] = instance_fleet.get('TargetSpotCapacity', collection['SpotRequested'])
+        weighted_capacity = collection['WeightedCapacity']
+        collection['PendingResize'] = [
+            ('ON_DEMAND', (collection['Requested'] + weighted_capacity - 1) // weighted_capacity),
+            ('SPOT', (collection['SpotRequested'] + weighted_capacity - 1) // weighted_capacity)
+        ]
+        collection['Reads'] = 0
+        return {}
+
+    def PutAutoScalingPolicy(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        collection = self.get_collection(cluster, params['InstanceGroupId'])
+        # EMR returns the policy with the defaults of the rules filled in
+        rules = copy.deepcopy(params['AutoScalingPolicy'].get('Rules', []))
+        for rule in rules:
+            alarm = rule['Trigger']['CloudWatchAlarmDefinition']
+            alarm.setdefault('Namespace', 'AWS/ElasticMapReduce')
+            alarm.setdefault('Statistic', 'AVERAGE')
+            alarm.setdefault('Unit', 'NONE')
+            alarm.setdefault('EvaluationPeriods', 1)
+            alarm.setdefault('Dimensions', [dict(Key='JobFlowId', Value=cluster['Id'])])
+            alarm['Threshold'] = float(alarm['Threshold'])
+            action = rule['Action']['SimpleScalingPolicyConfiguration']
+            action.setdefault('AdjustmentType', 'CHANGE_IN_CAPACITY')
+            action.setdefault('CoolDown', 0)
+        collection['AutoScalingPolicy'] = dict(params['AutoScalingPolicy'], Rules=rules, Status=dict(State='ATTACHED', StateChangeReason={}))
+        return dict(ClusterId=cluster['Id'], InstanceGroupId=collection['Id'], AutoScalingPolicy=collection['AutoScalingPolicy'])
+
+    def RemoveAutoScalingPolicy(self, params):
+        cluster = self.get_cluster(params['ClusterId'])
+        self.get_collection(cluster, params['InstanceGroupId'])['AutoScalingPolicy'] = None
+        return {}
+
+    def PutManagedScalingPolicy(self, params):
+        self.get_cluster(params['ClusterId'])['ManagedScalingPolicy'] = params['ManagedScalingPolicy']
+        return {}
+
+    def GetManagedScalingPolicy(self, params):
+        managed_scaling_policy = self.get_cluster(params['ClusterId'])['ManagedScalingPolicy']
+        if managed_scaling_policy is None:
+            return {}
+        return dict(ManagedScalingPolicy=managed_scaling_policy)
+
+    def RemoveManagedScalingPolicy(self, params):
+        self.get_cluster(params['ClusterId'])['ManagedScalingPolicy'] = None
+        return {}
+
+    def SetTerminationProtection(self, params):
+        clusters = [self.get_cluster(cluster_id) for cluster_id in params['JobFlowIds']]
+        for cluster in clusters:
+            cluster['TerminationProtected'] = params['TerminationProtected']
+        return {}
+
+    def AddTags(self, params):
+        cluster = self.get_cluster(params['ResourceId'])
+        keys = [tag['Key'] for tag in params['Tags']]
+        cluster['Tags'] = [tag for tag in cluster['Tags'] if tag['Key'] not in keys] + list(params['Tags'])
+        return {}
+
+    def RemoveTags(self, params):
+        cluster = self.get_cluster(params['ResourceId'])
+        cluster['Tags'] = [tag for tag in cluster['Tags'] if tag['Key'] not in params['TagKeys']]
+        return {}
+
+    def TerminateJobFlows(self, params):
+        clusters = [self.get_cluster(cluster_id) for cluster_id in params['JobFlowIds']]
+        for cluster in clusters:
+            if cluster['TerminationProtected']:
+                raise FakeApiError('ValidationException', 'Could not shut down one or more job flows since they are termination protected.')
+        for cluster in clusters:
+            if cluster['State'] in ACTIVE_CLUSTER_STATES:
+                cluster['State'] = 'TERMINATING'
+                cluster['Reads'] = 0
+                cluster['StateChangeReason'] = dict(Code='USER_REQUEST', Message='Terminated by user request')
+        return {}
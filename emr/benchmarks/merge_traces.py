@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# Merge the trace files written by aws_emr (trace_path option or AWS_EMR_TRACE_DIR) into one Chrome trace.
+#
+# Every run keeps its own process row, labeled with its mode and cluster, on one wall clock timeline. A summary of
+# the runs is printed: start offset, duration, the gap since the previous run ended and how many runs overlapped.
+# Runs that never overlap and follow each other with gaps point at tasks being serialized.
+#
+# Usage: python emr/benchmarks/merge_traces.py /tmp/emr-traces [more files or directories] [-o merged.json]
+
+import argparse
+import json
+import os
+import sys
+
+
+def find_trace_files(paths):
+    trace_file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                if file_name.startswith('aws_emr-') and file_name.endswith('.json'):
+                    trace_file_paths.append(os.path.join(path, file_name))
+        else:
+            trace_file_paths.append(path)
+    return trace_file_paths
+
+
+def load_run(trace_file_path, run_index):
+    with open(trace_file_path) as trace_file:
+        events = json.load(trace_file).get('traceEvents', [])
+    # pids are reused across hosts and runs, so each run gets its own
+    label = os.path.basename(trace_file_path)
+    for event in events:
+        event['pid'] = run_index
+        if event.get('ph') == 'M' and event.get('name') == 'process_name':
+            label = event['args']['name']
+    spans = [event for event in events if event.get('ph') == 'X']
+    if len(spans) == 0:
+        return None
+    start = min(event['ts'] for event in spans)
+    end = max(event['ts'] + event['dur'] for event in spans)
+    return dict(label=label, start=start, end=end, events=events)
+
+
+def count_overlaps(run, runs):
+    return len([other for other in runs if other is not run and other['start'] < run['end'] and run['start'] < other['end']])
+
+
+def print_summary(runs):
+    first_start = runs[0]['start']
+    last_end = max(run['end'] for run in runs)
+    print('%10s %10s %10s %8s  %s' % ('start ms', 'dur ms', 'gap ms', 'overlap', 'run'))
+    previous_end = None
+    for run in runs:
+        gap = '-'
+        if previous_end is not None:
+            gap = '%.1f' % max(0, (run['start'] - previous_end) / 1000.0)
+        print('%10.1f %10.1f %10s %8d  %s' % ((run['start'] - first_start) / 1000.0, (run['end'] - run['start']) / 1000.0, gap, count_overlaps(run, runs), run['label']))
+        previous_end = run['end'] if previous_end is None else max(previous_end, run['end'])
+    wall_ms = (last_end - first_start) / 1000.0
+    busy_ms = sum(run['end'] - run['start'] for run in runs) / 1000.0
+    print('runs: %d, wall: %.1f ms, sum of runs: %.1f ms, average parallelism: %.2f' % (len(runs), wall_ms, busy_ms, busy_ms / wall_ms if wall_ms > 0 else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge aws_emr trace files into one Chrome trace timeline')
+    parser.add_argument('paths', nargs='+', help='trace files or directories containing them')
+    parser.add_argument('-o', '--output', default='aws_emr-trace.json', help='merged trace file')
+    options = parser.parse_args()
+
+    runs = []
+    for trace_file_path in find_trace_files(options.paths):
+        run = load_run(trace_file_path, len(runs) + 1)
+        if run is not None:
+            runs.append(run)
+    if len(runs) == 0:
+        print('No aws_emr trace files found')
+        sys.exit(1)
+    runs.sort(key=lambda run: run['start'])
+
+    events = []
+    for run in runs:
+        events.extend(run['events'])
+    with open(options.output, 'w') as output_file:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), output_file)
+
+    print_summary(runs)
+    print('Merged trace: ' + options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/python
+# Per mode benchmark of emr/lib/aws_emr.py against the offline EMR stand-in in fake_emr.py.
+#
+# For every account scale (clusters in the account) and cluster scale (instances in the cluster the modes work on)
+# each scenario gets a fresh fake account and runs the module logic in-process, the way the aws_emr action plugin
+# does. Reported per scenario: wall time in milliseconds, EMR API calls and throttled calls; --json adds the calls
+# per operation. Waits poll every --wait-interval seconds instead of the module's 5 seconds.
+#
+# Usage: python emr/benchmarks/mode_benchmark.py [--clusters 50,500,5000] [--instances 10,100,1000]
+#            [--scenarios describe,get-master-ip] [--throttle-rate 0.05] [--latency-ms 20] [--api-rate 10] [--json]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+import aws_emr
+from fake_emr import FakeEmrBackend
+
+CLUSTER_NAME = 'EMR-BENCHMARK'
+POOL_NAME = CLUSTER_NAME + '-POOL'
+
+INSTANCE_GROUPS = [
+    dict(Name='Master', InstanceRole='MASTER', InstanceType='m4.large', InstanceCount=1, Market='ON_DEMAND'),
+    dict(Name='Core', InstanceRole='CORE', InstanceType='m4.large', InstanceCount=2, Market='ON_DEMAND'),
+    dict(Name='Task', InstanceRole='TASK', InstanceType='m4.large', InstanceCount=2, Market='ON_DEMAND')
+]
+
+AUTO_SCALING_POLICY = dict(
+    Constraints=dict(MinCapacity=2, MaxCapacity=20),
+    Rules=[dict(
+        Name='ScaleOut',
+        Action=dict(SimpleScalingPolicyConfiguration=dict(ScalingAdjustment=2, CoolDown=300)),
+        Trigger=dict(CloudWatchAlarmDefinition=dict(ComparisonOperator='LESS_THAN', MetricName='YARNMemoryAvailablePercentage', Period=300, Threshold=15))
+    )]
+)
+
+MANAGED_SCALING_POLICY = dict(ComputeLimits=dict(UnitType='Instances', MinimumCapacityUnits=2, MaximumCapacityUnits=40))
+
+STEPS = [
+    dict(Name='step-%d' % index, HadoopJarStep=dict(Jar='command-runner.jar', Args=['spark-submit', 's3://benchmark/step-%d.py' % index]))
+    for index in range(300)
+]
+
+# JSON files written for the run, {<name>} in the module arguments is replaced with the file path
+SPEC_FILES = dict(
+    instances=INSTANCE_GROUPS, auto_scaling_policy=AUTO_SCALING_POLICY, managed_scaling_policy=MANAGED_SCALING_POLICY, steps=STEPS, job_steps=STEPS[:5]
+)
+
+CREATE_ARGS = dict(
+    mode='create', name=CLUSTER_NAME + '-NEW', log_url='s3://benchmark/logs', ec2_key_file_name='benchmark',
+    emr_master_security_group='sg-1', emr_slave_security_group='sg-2', emr_service_security_group='sg-3',
+    ec2_subnet='subnet-1', termination_protection=False
+)
+
+# (scenario, module arguments); {id}, {name} and {ids} are replaced with the target cluster, {step_ids} with the ids of
+# its WAIT_STEP_COUNT pending steps, {pool_id} with a leased cluster of the pool POOL_NAME, {<spec file>} with its path.
+# idle_timeout is left out when botocore does not know AutoTerminationPolicy.
+SCENARIOS = [
+    ('create', dict(CREATE_ARGS)),
+    ('create+wait', dict(CREATE_ARGS, wait=True)),
+    ('create transient+wait', dict(CREATE_ARGS, release_label='emr-5.30.0', steps='{job_steps}', key_alive_when_no_steps=False, idle_timeout=3600, wait=True)),
+    ('describe', dict(mode='describe', id='{id}')),
+    ('describe by name', dict(mode='describe', name='{name}')),
+    ('describe batch', dict(mode='describe', ids='{ids}')),
+    ('check-status', dict(mode='check-status', id='{id}')),
+    ('get-cluster-id', dict(mode='get-cluster-id', name='{name}')),
+    ('get-cluster-ids', dict(mode='get-cluster-ids', name='{name}')),
+    ('get-master-ip', dict(mode='get-master-ip', id='{id}')),
+    ('get-core-ips', dict(mode='get-core-ips', id='{id}')),
+    ('get-slave-ips', dict(mode='get-slave-ips', id='{id}')),
+    ('get-collection-id-by-name', dict(mode='get-collection-id-by-name', id='{id}', instance_collection_name='Task')),
+    ('add-instance-group', dict(mode='add-instance-group', id='{id}', instance_collection_name='Extra', scale_out_instance_count=5)),
+    ('scale-out', dict(mode='scale-out', id='{id}', instance_collection_name='Task', scale_out_instance_count=20)),
+    ('scale-out+wait', dict(mode='scale-out', id='{id}', instance_collection_name='Task', scale_out_instance_count=20, wait=True)),
+    ('scale-in', dict(mode='scale-in', id='{id}', instance_collection_name='Task')),
+    ('scale-in+wait', dict(mode='scale-in', id='{id}', instance_collection_name='Task', wait=True)),
+    ('capacity', dict(mode='capacity', id='{id}', capacity=[dict(name='Core', on_demand=8), dict(type='TASK', on_demand=20)])),
+    ('capacity+wait', dict(mode='capacity', id='{id}', capacity=[dict(name='Core', on_demand=8), dict(type='TASK', on_demand=20)], wait=True)),
+    ('capacity no-op', dict(mode='capacity', id='{id}', capacity=[dict(type='MASTER', on_demand=1)])),
+    ('resize-instance-groups', dict(mode='resize-instance-groups', id='{id}', instance_groups=dict(
+        [('Task', 20)] + [('Task-%d' % index, dict(instance_count=index + 1, instance_type='r4.xlarge')) for index in range(7)]
+    ))),
+    ('put-auto-scaling-policy', dict(mode='put-auto-scaling-policy', id='{id}', instance_collection_name='Task', auto_scaling_policy='{auto_scaling_policy}')),
+    ('put-managed-scaling-policy', dict(mode='put-managed-scaling-policy', id='{id}', managed_scaling_policy='{managed_scaling_policy}')),
+    ('describe-scaling-policies', dict(mode='describe-scaling-policies', id='{id}')),
+    ('add-steps', dict(mode='add-steps', name='{name}', steps='{steps}')),
+    ('wait-steps', dict(mode='wait-steps', id='{id}', step_ids='{step_ids}')),
+    ('wait-steps (few)', dict(mode='wait-steps', id='{id}', step_ids='{step_ids:3}')),
+    ('active-instances-by-collection', dict(mode='active-instances-by-collection', id='{id}', instance_collection_name='Task')),
+    ('wait', dict(mode='wait', id='{id}')),
+    ('cluster-facts', dict(mode='cluster-facts', id='{id}')),
+    ('pool-acquire', dict(CREATE_ARGS, mode='pool-acquire', name=POOL_NAME)),
+    ('pool-acquire (create)', dict(CREATE_ARGS, mode='pool-acquire', name=POOL_NAME, release_label='emr-5.30.0')),
+    ('pool-release', dict(mode='pool-release', id='{pool_id}')),
+    ('terminate', dict(mode='terminate', id='{id}')),
+    ('terminate-all', dict(mode='terminate-all', name='{name}')),
+    ('terminate-all+wait', dict(mode='terminate-all', name='{name}', wait=True)),
+]
+
+BATCH_SIZE = 20
+WAIT_STEP_COUNT = 20
+# Seconds the clusters of the pool are idle: one leased, one idle and one idle for longer than the default pool_idle_ttl
+POOL_IDLE_SECONDS = [None, 60, 7200]
+
+
+class ModuleExit(Exception):
+    def __init__(self, result):
+        super(ModuleExit, self).__init__(result.get('msg'))
+        self.result = result
+
+
+class BenchmarkModule(object):
+    check_mode = False
+
+    def __init__(self, params):
+        self.params = params
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs['failed'] = True
+        kwargs['msg'] = msg
+        raise ModuleExit(kwargs)
+
+
+def build_account(options, cluster_count, instance_count):
+    backend = FakeEmrBackend(seed=options.seed, throttle_rate=options.throttle_rate, latency=options.latency_ms / 1000.0)
+    backend.add_clusters(cluster_count - 1)
+    target_id = backend.add_cluster(CLUSTER_NAME, instance_count=instance_count)
+    active_ids = [cluster_id for cluster_id in backend.cluster_order if backend.clusters[cluster_id]['State'] == 'WAITING']
+    step_ids = backend.AddJobFlowSteps(dict(JobFlowId=target_id, Steps=STEPS[:WAIT_STEP_COUNT]))['StepIds']
+    pool_ids = []
+    for idle_seconds in POOL_IDLE_SECONDS:
+        tags = [dict(Key='aws_emr:pool', Value=POOL_NAME), dict(Key='aws_emr:lease', Value='benchmark')]
+        if idle_seconds is not None:
+            tags = [dict(Key='aws_emr:pool', Value=POOL_NAME), dict(Key='aws_emr:released_at', Value=str(int(time() - idle_seconds)))]
+        pool_ids.append(backend.add_cluster(POOL_NAME, instance_count=instance_count, tags=tags))
+    return backend, dict(id=target_id, name=CLUSTER_NAME, ids=active_ids[:BATCH_SIZE], step_ids=step_ids, pool_id=pool_ids[0])
+
+
+def build_params(module_args, spec_paths, placeholders):
+    params = dict((param_name, param_spec.get('default')) for param_name, param_spec in aws_emr.MODULE_ARGS.items())
+    params.update(aws_access_key='AKIAFAKEEMRBACKEND', aws_secret_key='fake', region='us-east-1', instances=spec_paths['instances'])
+    for param_name, value in module_args.items():
+        if isinstance(value, str) and value.startswith('{') and value[1:-1] in placeholders:
+            value = placeholders[value[1:-1]]
+        elif isinstance(value, str) and value.startswith('{step_ids:'):
+            value = placeholders['step_ids'][:int(value[10:-1])]
+        elif isinstance(value, str) and value.startswith('{') and value[1:-1] in spec_paths:
+            value = spec_paths[value[1:-1]]
+        params[param_name] = value
+    return params
+
+
+def run_scenario(options, cluster_count, instance_count, module_args, spec_paths):
+    backend, placeholders = build_account(options, cluster_count, instance_count)
+    emr_client = backend.create_client()
+    if module_args.get('idle_timeout') is not None and not aws_emr.has_auto_termination(emr_client):
+        # idle_timeout needs botocore 1.21.31 or later, without it the transient cluster ends with its steps alone
+        module_args = dict(module_args, idle_timeout=None)
+    aws_emr.api_token_bucket = aws_emr.TokenBucket(options.api_rate or 1e9, options.api_rate or 1e9)
+    module = BenchmarkModule(build_params(module_args, spec_paths, placeholders))
+
+    started = time()
+    try:
+        aws_emr.validate_params(module)
+        aws_emr.run_mode(module, emr_client)
+        result = {}
+    except ModuleExit as err:
+        result = err.result
+    elapsed_ms = (time() - started) * 1000
+
+    return dict(
+        clusters=cluster_count,
+        instances=instance_count,
+        wall_ms=elapsed_ms,
+        api_calls=sum(backend.calls.values()),
+        throttled=sum(backend.throttled.values()),
+        calls=dict(backend.calls),
+        failed=bool(result.get('failed')),
+        msg=result.get('msg')
+    )
+
+
+def parse_scales(value):
+    return [int(scale) for scale in value.split(',') if scale != '']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per mode benchmark of the aws_emr module against an offline EMR stand-in')
+    parser.add_argument('--clusters', type=parse_scales, default=[50, 500, 5000], help='account scales, comma separated')
+    parser.add_argument('--instances', type=parse_scales, default=[10, 100, 1000], help='cluster scales, comma separated')
+    parser.add_argument('--scenarios', help='comma separated scenario names, all by default')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of API calls answered with ThrottlingException')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated latency of every API call')
+    parser.add_argument('--api-rate', type=float, default=0.0, help='client side request rate of aws_emr, unlimited by default')
+    parser.add_argument('--wait-interval', type=float, default=0.01, help='poll interval of the wait scenarios in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the simulated account and throttling')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    options = parser.parse_args()
+
+    aws_emr.import_botocore()
+    aws_emr.WAIT_MIN_INTERVAL = options.wait_interval
+    aws_emr.WAIT_MAX_INTERVAL = options.wait_interval
+    aws_emr.POOL_LEASE_SETTLE = 0
+
+    scenarios = SCENARIOS
+    if options.scenarios:
+        scenario_names = options.scenarios.split(',')
+        scenarios = [scenario for scenario in SCENARIOS if scenario[0] in scenario_names]
+
+    spec_paths = {}
+    for spec_name, spec in SPEC_FILES.items():
+        spec_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
+        json.dump(spec, spec_file)
+        spec_file.close()
+        spec_paths[spec_name] = spec_file.name
+
+    if not options.json:
+        print('%8s %9s  %-32s %10s %6s %6s  %s' % ('clusters', 'instances', 'scenario', 'wall ms', 'calls', 'thrtl', 'result'))
+    results = []
+    try:
+        for cluster_count in options.clusters:
+            for instance_count in options.instances:
+                for scenario_name, module_args in scenarios:
+                    result = run_scenario(options, cluster_count, instance_count, module_args, spec_paths)
+                    result['scenario'] = scenario_name
+                    results.append(result)
+                    if not options.json:
+                        print('%8d %9d  %-32s %10.1f %6d %6d  %s' % (
+                            cluster_count, instance_count, scenario_name, result['wall_ms'], result['api_calls'], result['throttled'],
+                            'failed: ' + str(result['msg']) if result['failed'] else 'ok'
+                        ))
+    finally:
+        for spec_path in spec_paths.values():
+            os.remove(spec_path)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# Cold start benchmark of emr/lib/aws_emr.py.
+#
+# Every scenario runs the module in a fresh interpreter, the way Ansible does, and stops right after the EMR
+# client is created so no AWS call is made. Reported times are medians in milliseconds:
+#   import  - interpreter start until aws_emr.py is imported
+#   client  - interpreter start until the EMR client is ready (empty when the run fails validation before it)
+#   total   - process spawn until exit, measured by the parent
+#
+# Usage: python emr/benchmarks/startup_benchmark.py [--repeat 5] [--max-ms 2000] [--json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'aws_emr.py')
+# create checks its spec files before the client is created
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples', 'roles', 'emr', 'init-create', 'files', 'instances.json')
+
+COMMON_ARGS = dict(aws_access_key='AKIABENCHMARK', aws_secret_key='benchmark', region='us-east-1')
+
+SCENARIOS = [
+    ('create', dict(mode='create', name='benchmark', log_url='s3://benchmark/logs', ec2_key_file_name='benchmark',
+                    emr_master_security_group='sg-1', emr_slave_security_group='sg-2', emr_service_security_group='sg-3',
+                    ec2_subnet='subnet-1', instances=INSTANCES_PATH)),
+    ('create (invalid)', dict(mode='create', name='benchmark')),
+    ('describe', dict(mode='describe', id='j-BENCHMARK')),
+    ('describe (invalid)', dict(mode='describe')),
+    ('check-status', dict(mode='check-status', id='j-BENCHMARK')),
+    ('get-cluster-id', dict(mode='get-cluster-id', name='benchmark')),
+    ('get-master-ip', dict(mode='get-master-ip', id='j-BENCHMARK')),
+    ('get-slave-ips', dict(mode='get-slave-ips', id='j-BENCHMARK')),
+    ('scale-out', dict(mode='scale-out', id='j-BENCHMARK')),
+    ('terminate', dict(mode='terminate', id='j-BENCHMARK')),
+    ('terminate-all (invalid)', dict(mode='terminate-all')),
+    ('wait', dict(mode='wait', id='j-BENCHMARK')),
+]
+
+
+class ClientReady(Exception):
+    pass
+
+
+def run_child(args_path, timing_path, started):
+    timings = dict(import_ms=None, client_ms=None)
+    # Ansible passes module arguments as a file in argv[1]
+    sys.argv = [MODULE_PATH, args_path]
+    sys.path.insert(0, os.path.dirname(MODULE_PATH))
+    import aws_emr
+    timings['import_ms'] = (time.time() - started) * 1000
+
+    get_client = aws_emr.get_client
+
+    def timed_get_client(*args, **kwargs):
+        get_client(*args, **kwargs)
+        timings['client_ms'] = (time.time() - started) * 1000
+        raise ClientReady()
+    aws_emr.get_client = timed_get_client
+
+    try:
+        aws_emr.main()
+    except ClientReady:
+        pass
+    except SystemExit:
+        pass
+    with open(timing_path, 'w') as timing_file:
+        json.dump(timings, timing_file)
+
+
+def median(values):
+    values = sorted(value for value in values if value is not None)
+    if len(values) == 0:
+        return None
+    return values[len(values) // 2]
+
+
+def run_scenario(module_args, repeat):
+    args_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
+    args = dict(COMMON_ARGS)
+    args.update(module_args)
+    json.dump(dict(ANSIBLE_MODULE_ARGS=args), args_file)
+    args_file.close()
+    timing_path = args_file.name + '.timing'
+    samples = []
+    try:
+        for _ in range(repeat):
+            started = time.time()
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call([sys.executable, os.path.abspath(__file__), '--child', args_file.name, timing_path, repr(started)], stdout=devnull)
+            total_ms = (time.time() - started) * 1000
+            with open(timing_path) as timing_file:
+                timings = json.load(timing_file)
+            timings['total_ms'] = total_ms
+            samples.append(timings)
+    finally:
+        os.remove(args_file.name)
+        if os.path.exists(timing_path):
+            os.remove(timing_path)
+    return dict(
+        import_ms=median([sample['import_ms'] for sample in samples]),
+        client_ms=median([sample['client_ms'] for sample in samples]),
+        total_ms=median([sample['total_ms'] for sample in samples])
+    )
+
+
+def format_ms(value):
+    if value is None:
+        return '-'
+    return '%.1f' % value
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description='Cold start benchmark of the aws_emr module per mode')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario, the median is reported')
+    parser.add_argument('--max-ms', type=float, help='exit with 1 if the total time of any scenario exceeds this')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    options = parser.parse_args()
+
+    results = []
+    for scenario_name, module_args in SCENARIOS:
+        result = run_scenario(module_args, options.repeat)
+        result['scenario'] = scenario_name
+        results.append(result)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print('%-26s %10s %10s %10s' % ('scenario', 'import', 'client', 'total'))
+        for result in results:
+            print('%-26s %10s %10s %10s' % (result['scenario'], format_ms(result['import_ms']), format_ms(result['client_ms']), format_ms(result['total_ms'])))
+
+    if options.max_ms is not None:
+        slow = [result['scenario'] for result in results if result['total_ms'] > options.max_ms]
+        if slow:
+            print('Slower than %.0f ms: %s' % (options.max_ms, ', '.join(slow)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
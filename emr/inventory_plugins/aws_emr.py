@@ -0,0 +1,258 @@
+# This file is a self designed Ansible inventory plugin to build hosts from AWS Elastic MapReduce clusters.
+
+DOCUMENTATION = '''
+---
+name: aws_emr
+plugin_type: inventory
+short_description: EMR master/core/task nodes as an Ansible inventory
+description:
+    - "Build hosts and groups from the instances of active EMR clusters. It uses the client and listing helpers of the aws_emr module, lists the instances of every cluster concurrently and caches the result in a local JSON file."
+    - "The config file name must end with aws_emr.yml or aws_emr.yaml."
+version_added: "2.5.5"
+author: "Mengfan Shan (fox)"
+options:
+    plugin:
+      description:
+        - Token that ensures this is a source file for the plugin.
+      required: true
+      choices: ['aws_emr']
+    aws_access_key:
+      description:
+        - The AWS Access Key. boto3 default credentials are used if it is not given.
+      required: false
+    aws_secret_key:
+      description:
+        - The AWS Secret Key.
+      required: false
+    security_token:
+      description:
+        - The AWS Security Token.
+      required: false
+    regions:
+      description:
+        - AWS Regions to look for EMR clusters.
+      type: list
+      required: true
+    cluster_names:
+      description:
+        - Only clusters with these names are added. All active clusters are added if it is not given.
+      type: list
+      required: false
+    concurrency:
+      description:
+        - Number of clusters whose instances are listed at the same time.
+      type: int
+      default: 8
+    cache_path:
+      description:
+        - Path of the JSON file caching the inventory.
+      type: path
+      default: '~/.ansible/tmp/aws_emr_inventory.json'
+    cache_ttl:
+      description:
+        - Seconds the cached inventory is used before the clusters are listed again. 0 disables the cache.
+      type: int
+      default: 300
+    module_path:
+      description:
+        - Path of aws_emr.py. Defaults to ../lib/aws_emr.py from this plugin.
+      type: path
+      required: false
+'''
+
+EXAMPLES = '''
+# emr.aws_emr.yml
+plugin: aws_emr
+regions: ['ap-northeast-1']
+cluster_names: ['EMR-EXAMPLE']
+cache_ttl: 600
+
+# Groups created for cluster EMR-EXAMPLE with a TASK instance group named EMR_TASK:
+#   emr_EMR_EXAMPLE, emr_EMR_EXAMPLE_master, emr_EMR_EXAMPLE_core, emr_EMR_EXAMPLE_task, emr_EMR_EXAMPLE_EMR_TASK
+#   and emr_master, emr_core, emr_task across all clusters.
+'''
+
+import hashlib
+import json
+import os
+import re
+from time import time
+
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_FUTURES = True
+except ImportError:
+    HAS_FUTURES = False
+
+
+def load_aws_emr_module(path):
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source('ansible_aws_emr_module', path)
+    spec = importlib.util.spec_from_file_location('ansible_aws_emr_module', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def to_safe_group_name(name):
+    return re.sub(r'[^A-Za-z0-9_]', '_', name)
+
+
+class InventoryModule(BaseInventoryPlugin):
+
+    NAME = 'aws_emr'
+
+    def verify_file(self, path):
+        if super(InventoryModule, self).verify_file(path):
+            return path.endswith(('aws_emr.yml', 'aws_emr.yaml'))
+        return False
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        self._read_config_data(path)
+        if not HAS_FUTURES:
+            raise AnsibleError('futures is required for the aws_emr inventory plugin with Python 2')
+
+        cache_key = self.get_cache_key()
+        host_list = None
+        if cache:
+            host_list = self.read_cache(cache_key)
+        if host_list is None:
+            host_list = self.list_hosts()
+            self.write_cache(cache_key, host_list)
+        self.populate(host_list)
+
+    def get_cache_key(self):
+        config = dict(
+            regions=self.get_option('regions'),
+            cluster_names=self.get_option('cluster_names'),
+            aws_access_key=self.get_option('aws_access_key')
+        )
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def read_cache(self, cache_key):
+        cache_path = os.path.expanduser(self.get_option('cache_path'))
+        if self.get_option('cache_ttl') <= 0 or not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path) as cache_file:
+                entry = json.load(cache_file).get(cache_key)
+        except ValueError:
+            return None
+        if entry is None or time() - entry['timestamp'] > self.get_option('cache_ttl'):
+            return None
+        return entry['hosts']
+
+    def write_cache(self, cache_key, host_list):
+        if self.get_option('cache_ttl') <= 0:
+            return
+        cache_path = os.path.expanduser(self.get_option('cache_path'))
+        entries = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as cache_file:
+                    entries = json.load(cache_file)
+            except ValueError:
+                entries = {}
+        else:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+        entries[cache_key] = dict(timestamp=time(), hosts=host_list)
+        temp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'w') as cache_file:
+            json.dump(entries, cache_file)
+        os.rename(temp_path, cache_path)
+
+    def list_hosts(self):
+        module_path = self.get_option('module_path')
+        if module_path in ('', None):
+            module_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib', 'aws_emr.py')
+        aws_emr = load_aws_emr_module(module_path)
+        if not aws_emr.import_botocore():
+            raise AnsibleError('botocore required for the aws_emr inventory plugin')
+
+        clients = {}
+        for region in self.get_option('regions'):
+            clients[region] = aws_emr.get_client(
+                region,
+                self.get_option('aws_access_key'),
+                self.get_option('aws_secret_key'),
+                self.get_option('security_token')
+            )
+
+        host_list = []
+        executor = ThreadPoolExecutor(max_workers=max(1, self.get_option('concurrency')))
+        try:
+            # Regions are listed concurrently first, then the instances of every cluster
+            cluster_futures = {}
+            for region, emr_client in clients.items():
+                cluster_futures[region] = executor.submit(self.list_clusters, aws_emr, emr_client)
+            host_futures = []
+            for region, emr_client in clients.items():
+                for cluster in cluster_futures[region].result():
+                    host_futures.append(executor.submit(self.list_cluster_hosts, aws_emr, emr_client, region, cluster))
+            for future in host_futures:
+                host_list.extend(future.result())
+        finally:
+            executor.shutdown(wait=True)
+        return host_list
+
+    def list_clusters(self, aws_emr, emr_client):
+        cluster_names = self.get_option('cluster_names')
+        result = []
+        for cluster in aws_emr.iter_clusters(emr_client, aws_emr.ACTIVE_CLUSTER_STATES):
+            if cluster_names and cluster.get('Name') not in cluster_names:
+                continue
+            result.append(cluster)
+        return result
+
+    def list_cluster_hosts(self, aws_emr, emr_client, region, cluster):
+        instance_collection_list, instances_by_role = aws_emr.collect_instances_by_role(emr_client, cluster.get('Id'))
+        collection_by_id = dict((instance_collection.get('Id'), instance_collection) for instance_collection in instance_collection_list)
+        host_list = []
+        for role, instance_list in instances_by_role.items():
+            for instance in instance_list:
+                collection_id = instance.get('InstanceFleetId') or instance.get('InstanceGroupId')
+                instance_collection = collection_by_id.get(collection_id, {})
+                host_list.append(dict(
+                    name=instance.get('PrivateIpAddress'),
+                    cluster_id=cluster.get('Id'),
+                    cluster_name=cluster.get('Name'),
+                    region=region,
+                    role=role,
+                    collection_id=collection_id,
+                    collection_name=instance_collection.get('Name'),
+                    instance_id=instance.get('Ec2InstanceId'),
+                    market=instance.get('Market') or instance_collection.get('Market'),
+                    instance_type=instance.get('InstanceType') or instance_collection.get('InstanceType'),
+                    private_dns_name=instance.get('PrivateDnsName'),
+                    public_ip=instance.get('PublicIpAddress')
+                ))
+        return host_list
+
+    def populate(self, host_list):
+        for host in host_list:
+            if host['name'] in ('', None):
+                continue
+            cluster_group = 'emr_' + to_safe_group_name(host['cluster_name'])
+            role_group = 'emr_' + host['role'].lower()
+            cluster_role_group = cluster_group + '_' + host['role'].lower()
+            for group in (cluster_group, role_group, cluster_role_group):
+                self.inventory.add_group(group)
+            self.inventory.add_child(cluster_group, cluster_role_group)
+            self.inventory.add_host(host['name'], group=cluster_role_group)
+            self.inventory.add_host(host['name'], group=role_group)
+            if host['collection_name'] not in ('', None):
+                collection_group = cluster_group + '_' + to_safe_group_name(host['collection_name'])
+                self.inventory.add_group(collection_group)
+                self.inventory.add_host(host['name'], group=collection_group)
+            self.inventory.set_variable(host['name'], 'ansible_host', host['name'])
+            for key in ('cluster_id', 'cluster_name', 'region', 'role', 'collection_id', 'collection_name', 'instance_id', 'market', 'instance_type', 'private_dns_name', 'public_ip'):
+                self.inventory.set_variable(host['name'], 'emr_' + key, host[key])
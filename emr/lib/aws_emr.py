@@ -33,7 +33,7 @@ options:
       default: null
     mode:
       description:
-        - Given operation to EMR, valid values are ['create', 'describe', 'get-cluster-id', 'get-cluster-ids', 'terminate', 'terminate-all', 'check-status', 'get-master-ip', 'get-core-ips', 'get-slave-ips', 'get-collection-id-by-name', 'add-instance-group', 'scale-out', 'scale-in']
+        - Given operation to EMR, valid values are ['create', 'describe', 'get-cluster-id', 'get-cluster-ids', 'terminate', 'terminate-all', 'check-status', 'get-master-ip', 'get-core-ips', 'get-slave-ips', 'get-collection-id-by-name', 'add-instance-group', 'scale-out', 'scale-in', 'active-instances-by-collection', 'wait', 'cluster-facts', 'capacity', 'put-auto-scaling-policy', 'remove-auto-scaling-policy', 'put-managed-scaling-policy', 'remove-managed-scaling-policy', 'describe-scaling-policies', 'resize-instance-groups', 'add-steps', 'wait-steps', 'pool-acquire', 'pool-release']
       required: true
     cluster_name:
       description:
@@ -45,6 +45,28 @@ options:
         - Cluster id of target cluster. If cluster id is not given. Cluster name is also acceptable, but only one active cluster could be found.
       required: false
       default: null
+    ids:
+      description:
+        - A list of cluster ids. Supported by describe, check-status, get-master-ip, get-core-ips, get-slave-ips, scale-out, scale-in, capacity, resize-instance-groups, the scaling policy modes, add-steps, wait-steps, terminate and cluster-facts. The operation runs concurrently for every cluster and results are returned in 'clusters' keyed by cluster id.
+      required: false
+    names:
+      description:
+        - A list of cluster names, resolved to the newest active cluster of each name. Can be combined with ids. Names without an active cluster are returned in 'missing_names'.
+      required: false
+    batch_concurrency:
+      description:
+        - Number of clusters operated at the same time when ids or names is given.
+      required: false
+      default: 8
+    snapshot_path:
+      description:
+        - Path of a local JSON file caching clusters, instance collections and instance IPs. get-cluster-id, get-master-ip, get-core-ips, get-slave-ips and get-collection-id-by-name answer from it while it is fresh. A sync is one paginated list_clusters of the active clusters, compared with the snapshot; only clusters that left the active states are described. Snapshots are kept per region and access key.
+      required: false
+    snapshot_max_age:
+      description:
+        - Seconds a snapshot answer may be old before it is refreshed from AWS.
+      required: false
+      default: 300
     auto_scaling_role:
       description:
         - the auto scaling role to create EMR cluster
@@ -52,7 +74,7 @@ options:
       default: 'EMR_AutoScaling_DefaultRole'
     applications:
       description:
-        - the applications we need to create an EMR cluster
+        - the applications we need to create an EMR cluster. Names aws_emr does not know are passed to EMR with a warning.
       required: false
       default: ['Hadoop', 'Spark']
     log_url:
@@ -103,9 +125,32 @@ options:
       required: false
     key_alive_when_no_steps:
       description:
-        - If EMR is alive after steps are done
+        - If EMR is alive after steps are done. Set it to false with steps to create a transient cluster that runs its steps and terminates.
+      required: false
+      default: True
+    idle_timeout:
+      description:
+        - Seconds (60 to 604800) an idle cluster is kept before it terminates itself, the AutoTerminationPolicy of create. Needs release emr-5.30.0 or later (emr-6.1.0 or later on 6.x) and botocore 1.21.31 or later, which runs on Python 3.6 or later only.
+      required: false
+    reuse_cluster:
+      description:
+        - create tags the cluster with aws_emr:fingerprint, a hash of the whole request (applications, release label, instances, configurations, bootstrap actions, steps, network and roles; not the tags except the pool and lease tags of pool-acquire). With reuse_cluster an active cluster with the same name and fingerprint is returned with changed false and reused true instead of creating another one. Either way a run_job_flow call that failed with a server or connection error is only sent again when no cluster with the fingerprint was created meanwhile.
       required: false
       default: True
+    lease_id:
+      description:
+        - Lease of mode pool-acquire and pool-release. pool-acquire generates one when it is not given and returns it; pool-release fails when the cluster is leased with another lease id.
+      required: false
+    pool_idle_ttl:
+      description:
+        - Seconds a released pool cluster stays in the pool. pool-acquire and pool-release terminate the clusters of the pool that were idle longer; pool-release with 0 terminates the released cluster.
+      required: false
+      default: 3600
+    min_capacity:
+      description:
+        - Running CORE and TASK instances (capacity units for fleets) a cluster needs to be leased by pool-acquire.
+      required: false
+      default: 0
     termination_protection:
       description:
         - If we need terminate protection for created EMR cluster
@@ -131,7 +176,7 @@ options:
       required: false
     instances:
       description:
-        - A path to a json file for instance properties.
+        - A path to a json file for instance properties. Before any AWS call, create checks this file, configurations and bootstrap_actions against the run_job_flow request shape of instance groups or fleets (enable_fleet), checks that ec2_subnet (groups) or ec2_subnets (fleets) is given and that release_label and applications are valid, and fails with every problem found. Parsed files are cached by content.
       required: false
     instance_collection_name:
       description:
@@ -139,7 +184,37 @@ options:
       required: false
     instance_group_id:
       description:
-        - ID of instance group
+        - ID of instance group. put-auto-scaling-policy and remove-auto-scaling-policy take it instead of instance_collection_name.
+      required: false
+    instance_groups:
+      description:
+        - Target instance counts for mode resize-instance-groups, keyed by instance group name. A value is a count or a dict with instance_count and, for groups to be added, instance_type (scale_out_instance_type by default) and market (ON_DEMAND by default). All groups are found with one list_instance_groups call, missing TASK groups are added with one add_instance_groups call and the others are resized with one modify_instance_groups call. Groups already at their count are not touched.
+      required: false
+    steps:
+      description:
+        - A path to a json file with a list of steps (Name, ActionOnFailure and HadoopJarStep as in add_job_flow_steps) for mode add-steps and create. The steps are submitted in order, 256 per add_job_flow_steps call (create passes the first 256 to run_job_flow), and their ids are returned in step_ids in the same order. With wait, create waits for the steps first (the result has steps and steps_wait like the steps and wait of wait-steps), then for the cluster.
+      required: false
+    action_on_failure:
+      description:
+        - ActionOnFailure of the steps that do not set one. Valid values are ['CONTINUE', 'CANCEL_AND_WAIT', 'TERMINATE_CLUSTER', 'TERMINATE_JOB_FLOW'].
+      required: false
+      default: CONTINUE
+    step_ids:
+      description:
+        - Ids of the steps mode wait-steps waits for, e.g. the step_ids of add-steps. Steps that ended are not queried again; up to 10 unfinished steps are read by id with list_steps, with more one listing of the cluster's active steps tells which of them ended. The poll interval grows while nothing changes and is reset when a step ends. A step that is not listed within 30 seconds fails the wait. The result has the steps in the given order with their state, duration in seconds and, for failed steps, the failure reason, log file and the step log files under the cluster's log url.
+      required: false
+    fail_fast:
+      description:
+        - With mode wait-steps, fail as soon as one step is FAILED, CANCELLED or INTERRUPTED instead of waiting for the other steps to end.
+      required: false
+      default: False
+    auto_scaling_policy:
+      description:
+        - A path to a json file with the automatic scaling policy (Constraints and Rules, optionally wrapped in AutoScalingPolicy) that put-auto-scaling-policy attaches to an instance group. The policy is not sent again when the group already has an equal policy attached, counting the values EMR fills in for left out ones (Namespace, Statistic, EvaluationPeriods, Dimensions, AdjustmentType, CoolDown) as equal. The cluster needs an auto_scaling_role.
+      required: false
+    managed_scaling_policy:
+      description:
+        - A path to a json file with the managed scaling policy (ComputeLimits, optionally wrapped in ManagedScalingPolicy) that put-managed-scaling-policy sets on the cluster. Managed scaling works for instance groups and fleets and needs botocore 1.15.43 or later. The policy is not sent again when the cluster already has an equal one.
       required: false
     scale_out_instance_type:
       description:
@@ -157,6 +232,60 @@ options:
       description:
         - Number of instances need to be scaled in. If it was more than current, it will be scaled in to 0. If the value is
       required: false
+    instance_fleet_type:
+      description:
+        - The instance fleet that scale-out/scale-in resize, TASK or CORE.
+      required: false
+      default: TASK
+    scale_out_spot_count:
+      description:
+        - Spot capacity added to the instance fleet by scale-out, on top of scale_out_instance_count on-demand capacity.
+      required: false
+    scale_in_spot_count:
+      description:
+        - Spot capacity removed from the instance fleet by scale-in. The spot target is kept when it is not given.
+      required: false
+    on_demand_ratio:
+      description:
+        - Share (0 to 1) of scale_out_instance_count/scale_in_instance_count that goes to on-demand capacity of the instance fleet, the rest goes to spot capacity. Cannot be combined with scale_out_spot_count/scale_in_spot_count.
+      required: false
+    scale_unit:
+      description:
+        - Unit of the instance fleet counts of scale-out/scale-in. units are the fleet's capacity units. instances counts every instance as the smallest WeightedCapacity of the fleet's instance types. Fleet results carry the on-demand and spot targets in units and the estimated instance count range.
+      required: false
+      default: units
+    capacity:
+      description:
+        - Desired capacity for mode capacity, a list of entries with the name or type (MASTER, CORE, TASK) of an instance group/fleet and its on_demand and/or spot units. A type must match only one active group/fleet. Units that are not given stay as they are. An instance group has only the units of its market. The module compares them with the current targets, sends one modify_instance_groups request for all changed groups (one modify_instance_fleet per changed fleet) and reports changed only when a target was changed. Nothing is modified when every group/fleet is already at its target.
+      required: false
+    wait:
+      description:
+        - Wait inside the module until the cluster (create/terminate/terminate-all) reaches a target state, or until the resized instance group/fleet (scale-out/scale-in) is in a target state with its target capacity provisioned (RunningInstanceCount for groups, ProvisionedOnDemandCapacity plus ProvisionedSpotCapacity for fleets). The result's wait key then has target_capacity, provisioned_capacity, a capacity_timeline of the provisioned count and time_to_capacity; on timeout the module fails with the provisioned count. terminate-all waits for all clusters concurrently. The wait mode always waits.
+      required: false
+      default: False
+    wait_states:
+      description:
+        - Target states to wait for. Defaults to ['WAITING', 'RUNNING'] for create and wait mode, ['TERMINATED', 'TERMINATED_WITH_ERRORS'] for create with steps and key_alive_when_no_steps false, ['TERMINATED', 'TERMINATED_WITH_ERRORS'] for terminate and terminate-all, ['RUNNING'] for scale-out/scale-in/capacity.
+      required: false
+    wait_timeout:
+      description:
+        - Seconds to wait before failing with the last observed state.
+      required: false
+      default: 1800
+    step_limit:
+      description:
+        - Number of most recent steps returned by cluster-facts.
+      required: false
+      default: 10
+    api_stats:
+      description:
+        - Return an api_stats block with EMR API calls and errors per operation, retries, connection errors and timeouts, backoff and pacing time, per call latency percentiles and bytes received.
+      required: false
+      default: False
+    trace_path:
+      description:
+        - Directory to write a Chrome trace event file (chrome://tracing, Perfetto) of this run into, with spans for interpreter start, module load, argument parsing, file loading, client creation, every EMR API call and every backoff/pacing wait. The AWS_EMR_TRACE_DIR environment variable enables it too. emr/benchmarks/merge_traces.py merges the files of a playbook run into one timeline.
+      required: false
 '''
 
 EXAMPLES = '''
@@ -427,20 +556,395 @@ EXAMPLES = '''
     id: "{{ CLUSTER_ID }}"
     scale_in_instance_count: 1
 
+# Example 23: Wait until a cluster is ready to take work, polling inside one module run
+- name: Wait for cluster
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: wait
+    id: "{{ CLUSTER_ID }}"
+    wait_states: ['WAITING']
+    wait_timeout: 1200
+
+# Example 24: Get master IPs of several clusters in one task. Errors are reported per cluster.
+- name: Get master IPs
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: get-master-ip
+    names: ['EMR-EXAMPLE-1', 'EMR-EXAMPLE-2']
+    ids: ["{{ CLUSTER_ID }}"]
+
+# Example 25: Gather state, instance groups/fleets, capacities, IPs by role, recent steps and bootstrap actions at once
+- name: Gather cluster facts
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: cluster-facts
+    name: "{{ CLSUTER_NAME }}"
+  register: result
+
+# Example 26: See where the time of a slow task goes
+- name: Get slave IPs with API statistics
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: get-slave-ips
+    name: "{{ CLSUTER_NAME }}"
+    api_stats: true
+  register: result
+# result.api_stats.calls_by_operation shows pagination, errors_by_code and backoff_seconds show throttling
+
+# Example 27: Trace every aws_emr task of a play, then merge the traces into one timeline with
+#   python emr/benchmarks/merge_traces.py /tmp/emr-traces -o play-trace.json
+- name: Scale out with tracing
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: scale-out
+    name: "{{ CLSUTER_NAME }}"
+    instance_collection_name: EMR_TASK
+    trace_path: /tmp/emr-traces
+
+# Example 28: Scale out and wait until the new task instances are running
+- name: Scale out and wait for capacity
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: scale-out
+    name: "{{ CLSUTER_NAME }}"
+    instance_collection_name: EMR_TASK
+    scale_out_instance_count: 20
+    wait: true
+    wait_timeout: 900
+  register: result
+# result.wait.time_to_capacity is the seconds until all 20 were running, result.wait.capacity_timeline the progress
+
+# Example 29: Keep the task groups at a desired size. Rerunning the task changes nothing once they are there.
+- name: Set task capacity
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: capacity
+    name: "{{ CLSUTER_NAME }}"
+    capacity:
+      - name: EMR_TASK
+        on_demand: 10
+      - name: EMR_TASK_SPOT
+        spot: 20
+  register: result
+
+# Example 30: Set the on-demand and spot targets of the task fleet
+- name: Set task fleet capacity
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: capacity
+    name: "{{ CLSUTER_NAME }}"
+    capacity:
+      - type: TASK
+        on_demand: 2
+        spot: 8
+    wait: true
+
+# Example 31: Let EMR scale the task group on YARN memory pressure. autoscaling.json:
+#   {"Constraints": {"MinCapacity": 2, "MaxCapacity": 20},
+#    "Rules": [{"Name": "ScaleOut", "Action": {"SimpleScalingPolicyConfiguration": {"ScalingAdjustment": 2, "CoolDown": 300}},
+#               "Trigger": {"CloudWatchAlarmDefinition": {"ComparisonOperator": "LESS_THAN", "MetricName": "YARNMemoryAvailablePercentage",
+#                                                         "Period": 300, "Threshold": 15, "Unit": "PERCENT"}}}]}
+- name: Attach an automatic scaling policy
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: put-auto-scaling-policy
+    name: "{{ CLSUTER_NAME }}"
+    instance_collection_name: EMR_TASK
+    auto_scaling_policy: "{{ role_path }}/files/autoscaling.json"
+
+# Example 32: Let EMR managed scaling keep the cluster between 2 and 40 units. managedscaling.json:
+#   {"ComputeLimits": {"UnitType": "Instances", "MinimumCapacityUnits": 2, "MaximumCapacityUnits": 40, "MaximumOnDemandCapacityUnits": 10}}
+- name: Set managed scaling limits
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: put-managed-scaling-policy
+    name: "{{ CLSUTER_NAME }}"
+    managed_scaling_policy: "{{ role_path }}/files/managedscaling.json"
+
+# Example 33: Show the automatic scaling policies of the instance groups and the managed scaling limits
+- name: Describe scaling policies
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: describe-scaling-policies
+    name: "{{ CLSUTER_NAME }}"
+  register: result
+
+# Example 34: Add 40 capacity units to the core fleet, a quarter of them on-demand and the rest spot
+- name: Scale out core fleet with spot capacity
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: scale-out
+    name: "{{ CLSUTER_NAME }}"
+    instance_fleet_type: CORE
+    scale_out_instance_count: 40
+    on_demand_ratio: 0.25
+  register: result
+# result.target_on_demand_capacity, result.target_spot_capacity and result.estimated_instance_count show the new size
+
+# Example 35: Remove 4 spot instances from the task fleet, counted in the fleet's smallest WeightedCapacity
+- name: Scale in task fleet spot instances
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: scale-in
+    name: "{{ CLSUTER_NAME }}"
+    scale_in_instance_count: 0
+    scale_in_spot_count: 4
+    scale_unit: instances
+
+# Example 36: Resize several task groups at once, adding the ones that do not exist yet
+- name: Resize task groups
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: resize-instance-groups
+    name: "{{ CLSUTER_NAME }}"
+    instance_groups:
+      EMR_TASK: 10
+      EMR_TASK_MEMORY:
+        instance_count: 4
+        instance_type: r4.2xlarge
+      EMR_TASK_SPOT:
+        instance_count: 20
+        instance_type: c4.2xlarge
+        market: SPOT
+  register: result
+
+# Example 37: Submit the nightly ETL steps to a cluster found by name. steps.json:
+#   [{"Name": "load", "ActionOnFailure": "CANCEL_AND_WAIT",
+#     "HadoopJarStep": {"Jar": "command-runner.jar", "Args": ["spark-submit", "s3://bucket/load.py"]}}, ...]
+- name: Add steps
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: add-steps
+    name: "{{ CLSUTER_NAME }}"
+    steps: "{{ role_path }}/files/steps.json"
+  register: result
+# result.step_ids lists the step ids in the order of steps.json
+
+# Example 38: Wait for the added steps and stop at the first failed one
+- name: Wait for steps
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: wait-steps
+    id: "{{ result.cluster_id }}"
+    step_ids: "{{ result.step_ids }}"
+    fail_fast: true
+    wait_timeout: 7200
+  register: steps_result
+# steps_result.steps has state, duration and, for a failed step, failure.log_files.stderr per step
+
+# Example 39: Transient cluster that runs its steps and terminates, all in one task
+- name: Run nightly job
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: create
+    name: EMR_exmaple_name
+    release_label: emr-5.30.0
+    log_url: 's3://emr-bucket-example/logs'
+    ec2_key_file_name: key-exmaple
+    emr_master_security_group: 'sg-example1'
+    emr_slave_security_group: 'sg-example2'
+    emr_service_security_group: 'sg-example3'
+    ec2_subnet: 'subnet-example'
+    instances: "{{ playbook_dir }}/roles/emr/init-create/files/instances.json"
+    steps: "{{ playbook_dir }}/roles/emr/init-create/files/steps.json"
+    action_on_failure: TERMINATE_CLUSTER
+    key_alive_when_no_steps: false
+    idle_timeout: 3600
+    wait: true
+    wait_timeout: 14400
+  register: job
+
+# Example 40: Running the create task of Example 1 again returns the cluster it created while that cluster is active
+# (changed false, reused true). Set reuse_cluster false to always create a new cluster.
+- name: create emr cluster unless it already exists
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: create
+    name: EMR_exmaple_name
+    log_url: 's3://emr-bucket-example/logs'
+    ec2_key_file_name: key-exmaple
+    emr_master_security_group: 'sg-example1'
+    emr_slave_security_group: 'sg-example2'
+    emr_service_security_group: 'sg-example3'
+    instances: "{{ playbook_dir }}/roles/emr/init-create/files/instances.json"
+    ec2_subnet: 'subnet-example'
+  register: result
+# result.fingerprint is the value of the aws_emr:fingerprint tag
+
+# Example 41: Lease a cluster of the warm pool EMR_pool (created with the create parameters when none is idle),
+# run the job and give the cluster back. It is terminated once it stayed idle for pool_idle_ttl seconds.
+- name: Acquire a pool cluster
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: pool-acquire
+    name: EMR_pool
+    release_label: emr-5.8.0
+    applications: ['Hadoop', 'Spark']
+    min_capacity: 4
+    log_url: 's3://emr-bucket-example/logs'
+    ec2_key_file_name: key-exmaple
+    emr_master_security_group: 'sg-example1'
+    emr_slave_security_group: 'sg-example2'
+    emr_service_security_group: 'sg-example3'
+    instances: "{{ playbook_dir }}/roles/emr/init-create/files/instances.json"
+    ec2_subnet: 'subnet-example'
+    wait: true
+  register: lease
+
+- name: Release the pool cluster
+  aws_emr:
+    aws_access_key: "{{ AWS_ACCESS_KEY }}"
+    aws_secret_key: "{{ AWS_SECURITY_KEY }}"
+    region: "{{ AWS_REGION }}"
+    mode: pool-release
+    id: "{{ lease.id }}"
+    lease_id: "{{ lease.lease_id }}"
+    pool_idle_ttl: 1800
 
 '''
 
 import os
+import re
 import json
-from time import sleep
+import calendar
+import copy
+import hashlib
+import math
+import random
+import threading
+import weakref
+from datetime import datetime, timedelta
+from itertools import islice
+from contextlib import contextmanager
+from time import sleep, time
+
+MODULE_LOAD_STARTED = time()
+
+# botocore is imported on demand by import_botocore(), so runs that fail validation never pay for it
+botocore = None
+Config = None
+ClientError = None
+BotoCoreError = None
+# botocore errors of requests that got no response: connection failures and timeouts
+CONNECTION_ERRORS = ()
 
 try:
-    import boto3
-    from botocore.exceptions import ClientError
-    import botocore
-    HAS_BOTO3 = True
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_FUTURES = True
 except ImportError:
-    HAS_BOTO3 = False
+    HAS_FUTURES = False
+
+ACTIVE_CLUSTER_STATES = ['STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING']
+TERMINATED_CLUSTER_STATES = ['TERMINATING', 'TERMINATED', 'TERMINATED_WITH_ERRORS']
+# Name lookups with a limit scan list_clusters by creation time, newest window first (days back, None is unbounded)
+CLUSTER_LOOKUP_WINDOWS = [1, 7, 30, None]
+
+# Every EMR API call goes through call_emr_api, which retries with full-jitter exponential backoff
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 30
+RETRY_DEADLINE = 300
+THROTTLING_ERROR_CODES = ['Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException', 'RequestLimitExceeded', 'TooManyRequestsException']
+SERVER_ERROR_CODES = ['InternalFailure', 'InternalError', 'InternalServerError', 'ServiceUnavailable']
+# Client side request rate (calls per second). It is halved on throttling and recovers on success
+API_REQUEST_RATE = 10.0
+API_REQUEST_BURST = 10
+API_REQUEST_MIN_RATE = 0.5
+API_REQUEST_RATE_STEP = 0.5
+# Tracing is enabled by the trace_path option or this environment variable
+TRACE_DIR_ENV = 'AWS_EMR_TRACE_DIR'
+# Number of clusters sent in one set_termination_protection/terminate_job_flows request
+TERMINATE_BATCH_SIZE = 50
+INSTANCE_ROLES = ['MASTER', 'CORE', 'TASK']
+ACTIVE_INSTANCE_STATES = ['BOOTSTRAPPING', 'RUNNING']
+# Cluster snapshot (snapshot_path). Terminal clusters are dropped after SNAPSHOT_RETENTION seconds.
+# Clusters found after a failed run_job_flow must be created at most SNAPSHOT_CLOCK_SKEW seconds before it.
+SNAPSHOT_MODES = ['get-cluster-id', 'get-master-ip', 'get-core-ips', 'get-slave-ips', 'get-collection-id-by-name']
+SNAPSHOT_RETENTION = 7 * 24 * 3600
+SNAPSHOT_CLOCK_SKEW = 300
+
+# In-process polling for the wait mode and the wait option. The interval grows while the state is unchanged.
+WAIT_MIN_INTERVAL = 5
+WAIT_MAX_INTERVAL = 60
+WAIT_INTERVAL_BACKOFF = 1.5
+CLUSTER_READY_STATES = ['WAITING', 'RUNNING']
+CLUSTER_TERMINAL_STATES = ['TERMINATED', 'TERMINATED_WITH_ERRORS']
+INSTANCE_COLLECTION_READY_STATES = ['RUNNING']
+INSTANCE_COLLECTION_FAILED_STATES = ['SUSPENDED', 'ARRESTED', 'TERMINATING', 'TERMINATED', 'SHUTTING_DOWN', 'ENDED']
+INSTANCE_COLLECTION_ENDED_STATES = ['TERMINATING', 'TERMINATED', 'SHUTTING_DOWN', 'ENDED']
+
+# Preflight checks of create
+SPEC_CACHE_SIZE = 32
+RELEASE_LABEL_PATTERN = re.compile(r'^emr-\d+\.\d+\.\d+$')
+IDLE_TIMEOUT_RANGE = (60, 604800)
+FINGERPRINT_TAG = 'aws_emr:fingerprint'
+POOL_TAG = 'aws_emr:pool'
+LEASE_TAG = 'aws_emr:lease'
+LEASED_AT_TAG = 'aws_emr:leased_at'
+RELEASED_AT_TAG = 'aws_emr:released_at'
+# Seconds between tagging a lease and reading it back
+POOL_LEASE_SETTLE = 2
+# Applications of the recent releases. Others are passed on with a warning, EMR adds new ones with new releases.
+APPLICATION_NAME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9-]*$')
+EMR_APPLICATIONS = [
+    'AmazonCloudWatchAgent', 'Delta', 'Flink', 'Ganglia', 'Hadoop', 'HBase', 'HCatalog', 'Hive', 'Hudi', 'Hue', 'Iceberg', 'JupyterEnterpriseGateway', 'JupyterHub',
+    'Livy', 'Mahout', 'MXNet', 'Oozie', 'Phoenix', 'Pig', 'Presto', 'Spark', 'Sqoop', 'TensorFlow', 'Tez', 'Trino', 'Zeppelin', 'ZooKeeper'
+]
+# Values EMR fills in when an automatic scaling rule leaves them out. The cluster id placeholder of the
+# JobFlowId dimension is returned as is or as the id.
+AUTO_SCALING_ALARM_DEFAULTS = dict(Namespace='AWS/ElasticMapReduce', Statistic='AVERAGE', EvaluationPeriods=1, Dimensions=[dict(Key='JobFlowId', Value='${emr.clusterId}')])
+AUTO_SCALING_ACTION_DEFAULTS = dict(AdjustmentType='CHANGE_IN_CAPACITY', CoolDown=0)
+INSTANCE_GROUP_KEYS = ['Name', 'Market', 'InstanceRole', 'BidPrice', 'InstanceType', 'InstanceCount', 'Configurations', 'EbsConfiguration', 'AutoScalingPolicy', 'CustomAmiId']
+INSTANCE_FLEET_KEYS = ['Name', 'InstanceFleetType', 'TargetOnDemandCapacity', 'TargetSpotCapacity', 'InstanceTypeConfigs', 'LaunchSpecifications', 'ResizeSpecifications', 'Context']
+STEP_KEYS = ['Name', 'ActionOnFailure', 'HadoopJarStep']
+HADOOP_JAR_STEP_KEYS = ['Jar', 'MainClass', 'Args', 'Properties']
+STEP_ACTIONS_ON_FAILURE = ['CONTINUE', 'CANCEL_AND_WAIT', 'TERMINATE_CLUSTER', 'TERMINATE_JOB_FLOW']
+ADD_STEPS_BATCH_SIZE = 256
+LIST_STEPS_ID_LIMIT = 10
+# Seconds a step id that was never listed counts as PENDING, new steps can take a moment to be listed
+STEP_NOT_FOUND_GRACE = 30
+STEP_ACTIVE_STATES = ['PENDING', 'CANCEL_PENDING', 'RUNNING']
+STEP_FAILED_STATES = ['CANCELLED', 'FAILED', 'INTERRUPTED']
+STEP_ENDED_STATES = ['COMPLETED'] + STEP_FAILED_STATES
+STEP_LOG_FILES = ['controller', 'syslog', 'stderr', 'stdout']
+INSTANCE_TYPE_CONFIG_KEYS = ['InstanceType', 'WeightedCapacity', 'BidPrice', 'BidPriceAsPercentageOfOnDemandPrice', 'EbsConfiguration', 'Configurations', 'CustomAmiId', 'Priority']
 
 def convert_application(applications):
     result = []
@@ -450,8 +954,11 @@ def convert_application(applications):
 
 def convert_tag(tags):
     result = []
+    if tags is None:
+        return result
     for tag in tags:
-        result.append({'Key':tag.items()[0][0], 'Value':tag.items()[0][1]})
+        key, value = list(tag.items())[0]
+        result.append({'Key':key, 'Value':value})
     return result
 
 def is_instance_fleet_enalbed(cluster):
@@ -459,109 +966,436 @@ def is_instance_fleet_enalbed(cluster):
         return True
     return False
 
-def get_client(region, access_key, secret_key, security_token):
+class TokenBucket(object):
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Returns the seconds spent waiting for a token
+        waited = 0
+        while True:
+            with self.lock:
+                now = time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+            waited += wait
+
+    def on_throttled(self):
+        with self.lock:
+            self.rate = max(API_REQUEST_MIN_RATE, self.rate / 2)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + API_REQUEST_RATE_STEP)
+
+api_token_bucket = TokenBucket(API_REQUEST_RATE, API_REQUEST_BURST)
+
+def is_throttling_error(err):
+    error = err.response.get('Error', {})
+    return error.get('Code') in THROTTLING_ERROR_CODES or error.get('Message') == 'Rate exceeded'
+
+def is_server_error(err):
+    if err.response.get('Error', {}).get('Code') in SERVER_ERROR_CODES:
+        return True
+    return err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+def is_connection_error(err):
+    return isinstance(err, CONNECTION_ERRORS)
+
+def get_backoff_delay(attempt):
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def emit_client_event(operation, event_name, **kwargs):
+    # Retries and pacing happen here rather than in botocore, so they are announced on the client's event hooks
+    # for ApiStats. Operations of anything but a botocore client are skipped.
+    meta = getattr(getattr(operation, '__self__', None), 'meta', None)
+    if meta is None or not hasattr(meta, 'events'):
+        return
+    operation_name = meta.method_to_api_mapping.get(getattr(operation, '__name__', ''), 'Unknown')
+    meta.events.emit(event_name + '.emr.' + operation_name, operation_name=operation_name, **kwargs)
+
+def call_emr_api(operation, retry_deadline=RETRY_DEADLINE, idempotent=True, **kwargs):
+    # Throttled requests are never executed, so they are retried for every operation.
+    # Server errors, connection errors and timeouts are only retried for idempotent operations:
+    # the client retries of botocore are disabled, so nothing else retries them.
+    start = time()
+    attempt = 0
+    while True:
+        waited = api_token_bucket.acquire()
+        if waited > 0:
+            emit_client_event(operation, 'aws-emr-paced', seconds=waited)
+        try:
+            response = operation(**kwargs)
+        except ClientError as err:
+            throttled = is_throttling_error(err)
+            if throttled:
+                api_token_bucket.on_throttled()
+            elif not (idempotent and is_server_error(err)):
+                raise
+            delay = get_backoff_delay(attempt)
+            if time() - start + delay > retry_deadline:
+                raise
+        except BotoCoreError as err:
+            if not is_connection_error(err):
+                raise
+            emit_client_event(operation, 'aws-emr-connection-error', error_type=type(err).__name__)
+            if not idempotent:
+                raise
+            delay = get_backoff_delay(attempt)
+            if time() - start + delay > retry_deadline:
+                raise
+        else:
+            api_token_bucket.on_success()
+            return response
+        emit_client_event(operation, 'aws-emr-backoff', seconds=delay)
+        sleep(delay)
+        attempt += 1
+
+def import_botocore():
+    global botocore, Config, ClientError, BotoCoreError, CONNECTION_ERRORS
+    if botocore is not None:
+        return True
+    try:
+        import botocore.session
+        from botocore.config import Config
+        from botocore.exceptions import BotoCoreError, ClientError
+    except ImportError:
+        return False
+    # HTTPClientError (read timeouts, closed connections) only exists since botocore 1.11
+    CONNECTION_ERRORS = tuple(
+        getattr(botocore.exceptions, name)
+        for name in ('ConnectionError', 'HTTPClientError', 'ReadTimeoutError', 'ConnectionClosedError')
+        if hasattr(botocore.exceptions, name)
+    )
+    return True
+
+# Access key each client of get_client signs with, see get_access_key
+client_access_keys = weakref.WeakKeyDictionary()
+
+def get_client(region, access_key, secret_key, security_token, session_vars=None, proxies=None):
+    # A bare botocore session skips importing boto3 and its resource layer; it only loads the EMR service model.
+    # Retries are handled by call_emr_api, so botocore's own retry loop is disabled.
+    # session_vars (profile, config_file, ca_bundle, ...) and proxies take the place of what botocore would read from
+    # os.environ, for callers creating clients for another environment than their own.
+    import_botocore()
+    session = botocore.session.get_session()
+    for name, value in (session_vars or {}).items():
+        session.set_config_variable(name, value)
+    config = Config(retries={'max_attempts': 0}, proxies=proxies)
     if access_key == None or access_key == '':
-        return boto3.client(
+        # The session resolves the credentials of the environment or profile once, create_client reuses them
+        credentials = session.get_credentials()
+        emr_client = session.create_client(
             'emr',
-            region_name=region
+            region_name=region,
+            config=config
         )
+        client_access_keys[emr_client] = getattr(credentials, 'access_key', None)
     else:
-        return boto3.client(
+        emr_client = session.create_client(
             'emr',
             region_name=region,
+            config=config,
             aws_access_key_id=access_key,
             aws_secret_access_key=secret_key,
             aws_session_token=security_token
         )
+        client_access_keys[emr_client] = access_key
+    return emr_client
 
-def list_active_clusters_by_name(emr_client, cluster_name):
-    i = 0.1
-    max_interval = 30
-    cluster_list = []
-    while i < max_interval:
-        try:
-            cluster_list = emr_client.list_clusters(
-                ClusterStates=[
-                    'STARTING',
-                    'BOOTSTRAPPING',
-                    'RUNNING',
-                    'WAITING',
-                ]
-            ).get('Clusters')
-            break
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
-    result = []
-    for cluster in cluster_list:
-        if cluster.get('Name') == cluster_name:
-            result.append(cluster)
-    return result
+def percentile(sorted_values, percent):
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[max(0, int(math.ceil(percent / 100.0 * len(sorted_values))) - 1)]
 
-def list_terminated_clusters_by_name(emr_client, cluster_name):
-    i = 0.1
-    max_interval = 30
-    cluster_list = []
-    while i < max_interval:
-        try:
-            cluster_list = emr_client.list_clusters(
-                ClusterStates=[
-                    'TERMINATING',
-                    'TERMINATED',
-                    'TERMINATED_WITH_ERRORS',
-                ]
-            ).get('Clusters')
-            break
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
-    result = []
-    for cluster in cluster_list:
-        if cluster.get('Name') == cluster_name:
-            result.append(cluster)
-    return result
+def get_response_size(http_response):
+    content_length = http_response.headers.get('content-length')
+    if content_length is not None:
+        return int(content_length)
+    try:
+        return len(http_response.content)
+    except Exception:
+        return 0
+
+class ApiStats(object):
+    # EMR API statistics of one module run, collected from the botocore event hooks of the client.
+    # Every HTTP attempt is one call, so retried calls are counted again.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+        self.latencies = []
+        self.bytes_received = 0
+        self.retries = 0
+        self.connection_errors = {}
+        self.backoff_seconds = 0
+        self.pacing_seconds = 0
+        self.handler_id = 'aws-emr-api-stats-' + str(id(self))
+        self.handlers = [
+            ('before-parameter-build.emr', self.on_request),
+            ('after-call.emr', self.on_response),
+            ('after-call-error.emr', self.on_request_error),
+            ('aws-emr-backoff.emr', self.on_backoff),
+            ('aws-emr-connection-error.emr', self.on_connection_error),
+            ('aws-emr-paced.emr', self.on_paced)
+        ]
+
+    def attach(self, emr_client):
+        for event_name, handler in self.handlers:
+            emr_client.meta.events.register(event_name, handler, unique_id=self.handler_id + event_name)
+
+    def detach(self, emr_client):
+        for event_name, handler in self.handlers:
+            emr_client.meta.events.unregister(event_name, handler, unique_id=self.handler_id + event_name)
+
+    def on_request(self, context, **kwargs):
+        context['aws_emr_started'] = time()
+
+    def record_call(self, operation_name, context, error_code=None, response_size=0):
+        latency = time() - context.get('aws_emr_started', time())
+        with self.lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+            self.latencies.append(latency)
+            self.bytes_received += response_size
+            if error_code is not None:
+                self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+    def on_response(self, http_response, parsed, model, context, **kwargs):
+        error_code = None
+        if http_response.status_code >= 300:
+            error_code = parsed.get('Error', {}).get('Code') or str(http_response.status_code)
+        self.record_call(model.name, context, error_code, get_response_size(http_response))
+
+    def on_request_error(self, exception, context, event_name, **kwargs):
+        self.record_call(event_name.split('.')[-1], context, type(exception).__name__)
+
+    def on_backoff(self, seconds, **kwargs):
+        with self.lock:
+            self.retries += 1
+            self.backoff_seconds += seconds
+
+    def on_connection_error(self, error_type, **kwargs):
+        with self.lock:
+            self.connection_errors[error_type] = self.connection_errors.get(error_type, 0) + 1
+
+    def on_paced(self, seconds, **kwargs):
+        with self.lock:
+            self.pacing_seconds += seconds
+
+    def summary(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            latency_ms = {}
+            for name, percent in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+                value = percentile(latencies, percent)
+                latency_ms[name] = None if value is None else round(value * 1000, 1)
+            return dict(
+                calls=sum(self.calls.values()),
+                calls_by_operation=dict(self.calls),
+                errors_by_code=dict(self.errors),
+                retries=self.retries,
+                connection_errors=dict(self.connection_errors),
+                backoff_seconds=round(self.backoff_seconds, 3),
+                pacing_seconds=round(self.pacing_seconds, 3),
+                latency_ms=latency_ms,
+                bytes_received=self.bytes_received
+            )
+
+def get_process_start_time():
+    # Linux only: when this interpreter was started, from its start time since boot and the uptime
+    try:
+        with open('/proc/self/stat') as stat_file:
+            start_ticks = float(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
 
-def list_all_clusters_by_name(emr_client, cluster_name):
-    i = 0.1
-    max_interval = 30
-    cluster_list = []
-    while i < max_interval:
+class Tracer(object):
+    # Chrome trace events (complete events, absolute microseconds) of one module run.
+    # Timestamps are wall clock based, so traces of several runs line up when merged.
+    def __init__(self, trace_dir, label):
+        self.trace_dir = trace_dir
+        self.label = label
+        self.started = time()
+        self.lock = threading.Lock()
+        self.events = []
+        self.handler_id = 'aws-emr-tracer-' + str(id(self))
+        self.handlers = [
+            ('before-parameter-build.emr', self.on_request),
+            ('after-call.emr', self.on_response),
+            ('after-call-error.emr', self.on_request_error),
+            ('aws-emr-backoff.emr', self.on_backoff),
+            ('aws-emr-paced.emr', self.on_paced)
+        ]
+
+    def add_span(self, name, category, start, end, **args):
+        event = dict(name=name, cat=category, ph='X', ts=int(start * 1000000), dur=max(0, int((end - start) * 1000000)), pid=os.getpid(), tid=threading.current_thread().ident, args=args)
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, category='module', **args):
+        start = time()
         try:
-            cluster_list = emr_client.list_clusters().get('Clusters')
-            break
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+            yield
+        finally:
+            self.add_span(name, category, start, time(), **args)
+
+    def attach(self, emr_client):
+        for event_name, handler in self.handlers:
+            emr_client.meta.events.register(event_name, handler, unique_id=self.handler_id + event_name)
+
+    def on_request(self, context, **kwargs):
+        context['aws_emr_trace_started'] = time()
+
+    def on_response(self, http_response, parsed, model, context, **kwargs):
+        args = dict(status=http_response.status_code)
+        if http_response.status_code >= 300:
+            args['error'] = parsed.get('Error', {}).get('Code')
+        self.add_span(model.name, 'api', context.get('aws_emr_trace_started', time()), time(), **args)
+
+    def on_request_error(self, exception, context, event_name, **kwargs):
+        self.add_span(event_name.split('.')[-1], 'api', context.get('aws_emr_trace_started', time()), time(), error=type(exception).__name__)
+
+    def on_backoff(self, operation_name, seconds, **kwargs):
+        # Announced right before the sleep
+        start = time()
+        self.add_span('backoff ' + operation_name, 'wait', start, start + seconds)
+
+    def on_paced(self, operation_name, seconds, **kwargs):
+        # Announced right after the wait for a token
+        end = time()
+        self.add_span('pacing ' + operation_name, 'wait', end - seconds, end)
+
+    def write(self):
+        if not os.path.isdir(self.trace_dir):
+            os.makedirs(self.trace_dir)
+        pid = os.getpid()
+        metadata = [
+            dict(name='process_name', ph='M', pid=pid, tid=0, args=dict(name=self.label)),
+            dict(name='thread_name', ph='M', pid=pid, tid=threading.current_thread().ident, args=dict(name='main'))
+        ]
+        trace_file_path = os.path.join(self.trace_dir, 'aws_emr-%d-%d.json' % (int(self.started * 1000000), pid))
+        with open(trace_file_path, 'w') as trace_file:
+            json.dump(dict(traceEvents=metadata + sorted(self.events, key=lambda event: event['ts']), displayTimeUnit='ms'), trace_file)
+        return trace_file_path
+
+# Tracer of this module run, None unless tracing is enabled
+tracer = None
+
+@contextmanager
+def trace_span(name, category='module', **args):
+    if tracer is None:
+        yield
+    else:
+        with tracer.span(name, category, **args):
+            yield
+
+def start_tracing(module, parse_started, parse_ended):
+    global tracer
+    trace_dir = module.params.get('trace_path') or os.environ.get(TRACE_DIR_ENV)
+    if trace_dir in ('', None):
+        return
+    label = 'aws_emr ' + str(module.params.get('mode'))
+    cluster = module.params.get('id') or module.params.get('name')
+    if cluster not in ('', None):
+        label += ' ' + cluster
+    tracer = Tracer(os.path.expanduser(trace_dir), label)
+    process_started = get_process_start_time()
+    if process_started is not None and process_started < MODULE_LOAD_STARTED:
+        tracer.add_span('interpreter start', 'startup', process_started, MODULE_LOAD_STARTED)
+    tracer.add_span('load module', 'startup', MODULE_LOAD_STARTED, parse_started)
+    tracer.add_span('parse arguments', 'startup', parse_started, parse_ended)
+
+def stop_tracing():
+    global tracer
+    if tracer is not None:
+        tracer.write()
+        tracer = None
+
+def iter_api_results(operation, result_key, **request):
+    # Lazily walk every page of a list_* operation, following Marker
+    while True:
+        response = call_emr_api(operation, **request)
+        for item in response.get(result_key, []):
+            yield item
+        marker = response.get('Marker')
+        if marker in ('', None):
+            return
+        request['Marker'] = marker
+
+def iter_clusters(emr_client, cluster_states=None, created_after=None, created_before=None):
+    request = {}
+    if cluster_states:
+        request['ClusterStates'] = cluster_states
+    if created_after is not None:
+        request['CreatedAfter'] = created_after
+    if created_before is not None:
+        request['CreatedBefore'] = created_before
+    return iter_api_results(emr_client.list_clusters, 'Clusters', **request)
+
+def iter_lookup_windows(now):
+    # Yield (created_after, created_before) pairs from the newest window backwards
+    created_before = None
+    for days in CLUSTER_LOOKUP_WINDOWS:
+        if days is None:
+            created_after = None
+        else:
+            created_after = now - timedelta(days=days)
+        yield created_after, created_before
+        if created_after is None:
+            return
+        created_before = created_after
+
+def find_clusters_by_name(emr_client, cluster_name, cluster_states=None, limit=None):
+    # The windows only pay off when a limit can stop the scan early, without one every window is read anyway
     result = []
-    for cluster in cluster_list:
-        if cluster.get('Name') == cluster_name:
+    found_ids = set()
+    lookup_windows = [(None, None)]
+    if limit is not None:
+        lookup_windows = iter_lookup_windows(datetime.utcnow())
+    for created_after, created_before in lookup_windows:
+        for cluster in iter_clusters(emr_client, cluster_states, created_after, created_before):
+            if cluster.get('Name') != cluster_name or cluster.get('Id') in found_ids:
+                continue
+            found_ids.add(cluster.get('Id'))
             result.append(cluster)
+            if limit is not None and len(result) >= limit:
+                return result
     return result
 
+def list_active_clusters_by_name(emr_client, cluster_name, limit=None):
+    return find_clusters_by_name(emr_client, cluster_name, ACTIVE_CLUSTER_STATES, limit)
+
+def list_terminated_clusters_by_name(emr_client, cluster_name, limit=None):
+    return find_clusters_by_name(emr_client, cluster_name, TERMINATED_CLUSTER_STATES, limit)
+
+def list_all_clusters_by_name(emr_client, cluster_name, limit=None):
+    return find_clusters_by_name(emr_client, cluster_name, None, limit)
+
 def terminate_emr(emr_client, cluster_id):
     try:
-        emr_client.set_termination_protection(
+        call_emr_api(
+            emr_client.set_termination_protection,
             JobFlowIds=[
                 cluster_id,
             ],
             TerminationProtected=False
         )
-        emr_client.terminate_job_flows(
+        call_emr_api(
+            emr_client.terminate_job_flows,
             JobFlowIds=[
                 cluster_id,
             ]
@@ -570,127 +1404,130 @@ def terminate_emr(emr_client, cluster_id):
     except ClientError as e:
         return "Termiantion failed due to " + e.response["Error"]["Code"]
 
-def get_cluster_ids(emr_client, cluster_name):
-    cluster_list = list_active_clusters_by_name(emr_client, cluster_name)
+def split_into_chunks(items, size):
+    result = []
+    for start in range(0, len(items), size):
+        result.append(items[start:start + size])
+    return result
+
+def terminate_emr_clusters(emr_client, cluster_ids):
+    # Both APIs take a list of JobFlowIds, so each chunk costs two calls no matter how many clusters it holds
+    result = {}
+    for chunk in split_into_chunks(cluster_ids, TERMINATE_BATCH_SIZE):
+        try:
+            call_emr_api(
+                emr_client.set_termination_protection,
+                JobFlowIds=chunk,
+                TerminationProtected=False
+            )
+            call_emr_api(
+                emr_client.terminate_job_flows,
+                JobFlowIds=chunk
+            )
+            for cluster_id in chunk:
+                result[cluster_id] = dict(changed=True, msg='Termination request is successfully submitted.')
+        except ClientError as e:
+            if len(chunk) == 1:
+                result[chunk[0]] = dict(changed=False, failed=True, msg='Termination failed due to ' + e.response["Error"]["Code"])
+            else:
+                # One invalid id rejects the whole request, so retry the chunk one cluster at a time
+                for cluster_id in chunk:
+                    result.update(terminate_emr_clusters(emr_client, [cluster_id]))
+    return result
+
+def get_cluster_ids(emr_client, cluster_name, limit=None):
+    cluster_list = list_active_clusters_by_name(emr_client, cluster_name, limit)
     result = []
     for cluster in cluster_list:
-        if cluster.get('Name') == cluster_name:
-            result.append(cluster.get('Id'))
+        result.append(cluster.get('Id'))
     return result
 
 def get_cluster_id(emr_client, cluster_name):
-    id_list = get_cluster_ids(emr_client, cluster_name)
+    id_list = get_cluster_ids(emr_client, cluster_name, 1)
     if len(id_list) == 0:
         return None
     return id_list[0]
 
 def describle_cluster(emr_client, cluster_id):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.describe_cluster(
-                ClusterId = cluster_id
-            ).get('Cluster')
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return call_emr_api(
+        emr_client.describe_cluster,
+        ClusterId = cluster_id
+    ).get('Cluster')
 
 def list_instance_groups(emr_client, cluster_id):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.list_instance_groups(
-                ClusterId=cluster_id
-            ).get('InstanceGroups')
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return list(iter_api_results(emr_client.list_instance_groups, 'InstanceGroups', ClusterId=cluster_id))
 
 def list_instance_fleets(emr_client, cluster_id):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.list_instance_fleets(
-                ClusterId=cluster_id
-            ).get('InstanceFleets')
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return list(iter_api_results(emr_client.list_instance_fleets, 'InstanceFleets', ClusterId=cluster_id))
+
+def list_instance_collections(emr_client, cluster_id, is_fleet):
+    if is_fleet:
+        return list_instance_fleets(emr_client, cluster_id)
+    return list_instance_groups(emr_client, cluster_id)
+
+def iter_instances(emr_client, cluster_id, **filters):
+    request = dict(ClusterId=cluster_id, InstanceStates=ACTIVE_INSTANCE_STATES)
+    request.update(filters)
+    return iter_api_results(emr_client.list_instances, 'Instances', **request)
+
+def iter_steps(emr_client, cluster_id, **filters):
+    # Steps are listed newest first
+    return iter_api_results(emr_client.list_steps, 'Steps', ClusterId=cluster_id, **filters)
+
+def list_bootstrap_actions(emr_client, cluster_id):
+    return list(iter_api_results(emr_client.list_bootstrap_actions, 'BootstrapActions', ClusterId=cluster_id))
 
 def list_instance_by_group_id(emr_client, cluster_id, instance_group_id):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.list_instances(
-                ClusterId=cluster_id,
-                InstanceGroupId=instance_group_id,
-                InstanceStates=['BOOTSTRAPPING', 'RUNNING']
-            ).get("Instances")
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return list(iter_instances(emr_client, cluster_id, InstanceGroupId=instance_group_id))
 
 def list_instance_by_group_type(emr_client, cluster_id, instance_group_type):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.list_instances(
-                ClusterId=cluster_id,
-                InstanceGroupTypes=instance_group_type,
-                InstanceStates=['BOOTSTRAPPING', 'RUNNING']
-            ).get("Instances")
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return list(iter_instances(emr_client, cluster_id, InstanceGroupTypes=instance_group_type))
 
 def list_instance_by_fleet_type(emr_client, cluster_id, instance_fleet_type):
-    i = 0.1
-    max_interval = 30
-    while i < max_interval:
-        try:
-            return emr_client.list_instances(
-                ClusterId=cluster_id,
-                InstanceFleetType=instance_fleet_type,
-                InstanceStates=['BOOTSTRAPPING', 'RUNNING']
-            ).get("Instances")
-        except ClientError as err:
-            if err.response['Error']['Message'] == "Rate exceeded":
-                sleep(i)
-                i = i * 2
-                if i > max_interval:
-                    raise
-            else:
-                raise
+    return list(iter_instances(emr_client, cluster_id, InstanceFleetType=instance_fleet_type))
+
+def get_instance_collection_type(instance_collection):
+    return instance_collection.get('InstanceFleetType') or instance_collection.get('InstanceGroupType')
+
+def collect_instances_by_role(emr_client, cluster_id, is_fleet=None):
+    # One paginated list_instances pass for every role, partitioned client side by group/fleet id.
+    # The collection type is taken from the instances when the caller has not described the cluster.
+    instance_list = list(iter_instances(emr_client, cluster_id))
+    if is_fleet is None:
+        if len(instance_list) == 0:
+            return [], partition_instances_by_role([], [], False)
+        is_fleet = any(instance.get('InstanceFleetId') for instance in instance_list)
+    instance_collection_list = list_instance_collections(emr_client, cluster_id, is_fleet)
+    return instance_collection_list, partition_instances_by_role(instance_list, instance_collection_list, is_fleet)
+
+def partition_instances_by_role(instance_list, instance_collection_list, is_fleet):
+    instances_by_role = dict((role, []) for role in INSTANCE_ROLES)
+    role_by_collection_id = {}
+    for instance_collection in instance_collection_list:
+        role_by_collection_id[instance_collection.get('Id')] = get_instance_collection_type(instance_collection)
+    collection_id_key = 'InstanceFleetId' if is_fleet else 'InstanceGroupId'
+    for instance in instance_list:
+        role = role_by_collection_id.get(instance.get(collection_id_key))
+        if role in instances_by_role:
+            instances_by_role[role].append(instance)
+    return instances_by_role
+
+def get_ips_by_role(instances_by_role):
+    result = {}
+    for role, instance_list in instances_by_role.items():
+        result[role] = get_private_ip_address(instance_list)
+    return result
+
+def build_ip_result(mode, ips_by_role):
+    result = {}
+    if mode == 'get-master-ip':
+        if len(ips_by_role.get('MASTER', [])) > 0:
+            result['master_private_ip'] = ips_by_role['MASTER'][0]
+    if mode == 'get-core-ips':
+        result['core_private_ips'] = ips_by_role.get('CORE', [])
+    if mode == 'get-slave-ips':
+        result['slave_private_ips'] = ips_by_role.get('CORE', []) + ips_by_role.get('TASK', [])
+    return result
 
 def get_private_ip_address(instance_detail_list):
     result = []
@@ -702,35 +1539,48 @@ def get_cluster_state(cluster):
     return cluster.get('Status').get('State')
 
 def get_cluster_state_change_reason(cluster):
-    return cluster.get('Status').get('StateChangeReason').get('Message')
+    return cluster.get('Status').get('StateChangeReason', {}).get('Message')
 
 def add_scale_out_instance_group(emr_client, cluster_id, instance_group_name, scale_out_instance_type, scale_out_instance_count):
-    return emr_client.add_instance_groups(
-        InstanceGroups=[
-            {
-                'Name': instance_group_name,
-                'Market': 'ON_DEMAND',
-                'InstanceRole': 'TASK',
-                'InstanceType': scale_out_instance_type,
-                'InstanceCount': scale_out_instance_count
-            }
-        ],
+    return add_instance_groups(emr_client, cluster_id, [
+        {
+            'Name': instance_group_name,
+            'Market': 'ON_DEMAND',
+            'InstanceRole': 'TASK',
+            'InstanceType': scale_out_instance_type,
+            'InstanceCount': scale_out_instance_count
+        }
+    ])
+
+def add_instance_groups(emr_client, cluster_id, instance_groups):
+    # A retried add after a server error could create the groups twice, so only throttling is retried
+    return call_emr_api(
+        emr_client.add_instance_groups,
+        idempotent=False,
+        InstanceGroups=instance_groups,
         JobFlowId = cluster_id
     )
 
 def resize_instance_group(emr_client, cluster_id, instance_group_id, instance_count):
-    return emr_client.modify_instance_groups(
+    return resize_instance_groups(emr_client, cluster_id, [(instance_group_id, instance_count)])
+
+def resize_instance_groups(emr_client, cluster_id, instance_counts):
+    # One modify_instance_groups request for a list of (instance group id, instance count)
+    return call_emr_api(
+        emr_client.modify_instance_groups,
         InstanceGroups = [
             {
                 'InstanceGroupId': instance_group_id,
                 'InstanceCount': instance_count
             }
+            for instance_group_id, instance_count in instance_counts
         ],
         ClusterId = cluster_id
     )
 
 def resize_instance_fleet(emr_client, cluster_id, instance_fleet_id, instance_count, spot_count):
-    return emr_client.modify_instance_fleet(
+    return call_emr_api(
+        emr_client.modify_instance_fleet,
         InstanceFleet = {
             'InstanceFleetId': instance_fleet_id,
             'TargetOnDemandCapacity': instance_count,
@@ -740,424 +1590,1708 @@ def resize_instance_fleet(emr_client, cluster_id, instance_fleet_id, instance_co
     )
 
 
+def poll_until(get_state, target_states, failed_states, timeout, get_progress=None, target_progress=None, progress_at_least=False, progress_at_most=False):
+    # With get_progress the wait is only reached once get_progress(detail) equals target_progress as well, or
+    # exceeds it with progress_at_least, or stays below it with progress_at_most.
+    # Every change of state or progress is recorded and resets the poll interval.
+    start = time()
+    interval = WAIT_MIN_INTERVAL
+    timeline = []
+    progress_timeline = []
+    while True:
+        state, detail = get_state()
+        elapsed = round(time() - start, 1)
+        if len(timeline) == 0 or timeline[-1]['state'] != state:
+            timeline.append({'state': state, 'elapsed': elapsed})
+            interval = WAIT_MIN_INTERVAL
+        progress = None
+        if get_progress is not None:
+            progress = get_progress(detail)
+            if len(progress_timeline) == 0 or progress_timeline[-1]['progress'] != progress:
+                progress_timeline.append({'progress': progress, 'elapsed': elapsed})
+                interval = WAIT_MIN_INTERVAL
+        progress_reached = progress == target_progress or (progress is not None and (
+            (progress_at_least and progress > target_progress) or (progress_at_most and progress < target_progress)
+        ))
+        if state in target_states and progress_reached:
+            outcome = 'reached'
+        elif state in failed_states:
+            outcome = 'failed'
+        elif elapsed >= timeout:
+            outcome = 'timeout'
+        else:
+            sleep(min(interval, timeout - elapsed))
+            interval = min(WAIT_MAX_INTERVAL, interval * WAIT_INTERVAL_BACKOFF)
+            continue
+        wait_result = dict(outcome=outcome, state=state, detail=detail, timeline=timeline, elapsed=elapsed)
+        if get_progress is not None:
+            wait_result.update(progress=progress, target_progress=target_progress, progress_timeline=progress_timeline)
+        return wait_result
+
+def wait_for_cluster_state(emr_client, cluster_id, target_states, timeout):
+    def get_state():
+        cluster = describle_cluster(emr_client, cluster_id)
+        return get_cluster_state(cluster), cluster
+    failed_states = [state for state in CLUSTER_TERMINAL_STATES if state not in target_states]
+    return poll_until(get_state, target_states, failed_states, timeout)
+
+def describe_instance_collection(emr_client, cluster_id, instance_collection_id, is_fleet):
+    if is_fleet:
+        instance_collection_list = list_instance_fleets(emr_client, cluster_id)
+    else:
+        instance_collection_list = list_instance_groups(emr_client, cluster_id)
+    for instance_collection in instance_collection_list:
+        if instance_collection.get('Id') == instance_collection_id:
+            return instance_collection
+    return None
+
+def get_provisioned_capacity(instance_collection, is_fleet):
+    if instance_collection is None:
+        return None
+    if is_fleet:
+        return (instance_collection.get('ProvisionedOnDemandCapacity') or 0) + (instance_collection.get('ProvisionedSpotCapacity') or 0)
+    return instance_collection.get('RunningInstanceCount') or 0
+
+def wait_for_instance_collection_capacity(emr_client, cluster_id, instance_collection_id, is_fleet, target_capacity, target_states, timeout, previous_capacity=None):
+    # Provisioned capacity is RunningInstanceCount for groups and on-demand plus spot units for fleets. A fleet of
+    # weighted instance types may provision up to one instance more than its target when it grows, and less when it
+    # shrinks. The fleet stays RUNNING for a while after a resize request, so its previous_capacity (provisioned when
+    # the request was sent) must not count as reached: more only counts when growing, less only when shrinking.
+    def get_state():
+        instance_collection = describe_instance_collection(emr_client, cluster_id, instance_collection_id, is_fleet)
+        if instance_collection is None:
+            return 'NOT_FOUND', None
+        return instance_collection.get('Status').get('State'), instance_collection
+    def get_progress(instance_collection):
+        return get_provisioned_capacity(instance_collection, is_fleet)
+    failed_states = INSTANCE_COLLECTION_FAILED_STATES + ['NOT_FOUND']
+    growing = is_fleet and previous_capacity is not None and target_capacity > previous_capacity
+    shrinking = is_fleet and previous_capacity is not None and target_capacity < previous_capacity
+    return poll_until(get_state, target_states, failed_states, timeout, get_progress, target_capacity, progress_at_least=growing, progress_at_most=shrinking)
+
+def get_wait_failure_reason(wait_result):
+    detail = wait_result.get('detail') or {}
+    return detail.get('Status', {}).get('StateChangeReason', {}).get('Message')
+
+class EmrOperationError(Exception):
+    def __init__(self, msg, result=None, failed=True):
+        super(EmrOperationError, self).__init__(msg)
+        self.msg = msg
+        self.result = result or {}
+        self.failed = failed
+
+def check_wait_result(result, wait_result):
+    result['wait'] = dict(
+        state=wait_result['state'],
+        elapsed=wait_result['elapsed'],
+        timeline=wait_result['timeline']
+    )
+    capacity = ''
+    if 'progress' in wait_result:
+        result['wait']['target_capacity'] = wait_result['target_progress']
+        result['wait']['provisioned_capacity'] = wait_result['progress']
+        result['wait']['capacity_timeline'] = [dict(provisioned=entry['progress'], elapsed=entry['elapsed']) for entry in wait_result['progress_timeline']]
+        result['wait']['time_to_capacity'] = wait_result['elapsed'] if wait_result['outcome'] == 'reached' else None
+        capacity = ' with ' + str(wait_result['progress']) + ' of ' + str(wait_result['target_progress']) + ' capacity provisioned'
+    if wait_result['outcome'] == 'failed':
+        raise EmrOperationError('Wait ended in state ' + wait_result['state'] + capacity + ': ' + str(get_wait_failure_reason(wait_result)), result)
+    if wait_result['outcome'] == 'timeout':
+        raise EmrOperationError('Timed out after ' + str(wait_result['elapsed']) + ' seconds in state ' + wait_result['state'] + capacity, result)
+
+def report_wait_result(module, result, wait_result):
+    try:
+        check_wait_result(result, wait_result)
+    except EmrOperationError as err:
+        module.fail_json(msg=err.msg, **err.result)
+
+def describe_active_cluster(emr_client, cluster_id):
+    cluster = describle_cluster(emr_client, cluster_id)
+    if cluster is None:
+        raise EmrOperationError('No active EMR cluster was founded by Id: ' + cluster_id + '.', failed=False)
+    return cluster
+
+# Per-cluster operations shared by the single cluster modes and the ids/names batch path.
+# Each returns the result keys for one cluster and raises EmrOperationError when it cannot complete.
+def describe_operation(emr_client, cluster_id, params):
+    return dict(changed=True, cluster=describe_active_cluster(emr_client, cluster_id))
+
+def check_status_operation(emr_client, cluster_id, params):
+    cluster = describe_active_cluster(emr_client, cluster_id)
+    return dict(
+        changed=True,
+        state=get_cluster_state(cluster),
+        state_changed_reason=get_cluster_state_change_reason(cluster)
+    )
+
+def get_ips_operation(emr_client, cluster_id, params):
+    instances_by_role = collect_instances_by_role(emr_client, cluster_id)[1]
+    return build_ip_result(params.get('mode'), get_ips_by_role(instances_by_role))
+
+def terminate_operation(emr_client, cluster_id, params):
+    result = dict(changed=True, cluster_id=cluster_id)
+    result['response'] = terminate_emr(emr_client, cluster_id)
+    if params.get('wait'):
+        check_wait_result(result, wait_for_cluster_state(emr_client, cluster_id, params.get('wait_states') or CLUSTER_TERMINAL_STATES, params.get('wait_timeout')))
+    return result
+
+def wait_for_termination_operation(emr_client, cluster_id, params):
+    result = {}
+    check_wait_result(result, wait_for_cluster_state(emr_client, cluster_id, params.get('wait_states') or CLUSTER_TERMINAL_STATES, params.get('wait_timeout')))
+    return result
+
+def find_instance_fleet(emr_client, cluster_id, instance_fleet_type):
+    for instance_fleet in list_instance_fleets(emr_client, cluster_id):
+        if instance_fleet.get('InstanceFleetType') == instance_fleet_type:
+            return instance_fleet
+    raise EmrOperationError(instance_fleet_type.capitalize() + " Instance Fleet does not exists.", failed=False)
+
+def get_weighted_capacities(instance_fleet):
+    return [specification.get('WeightedCapacity') or 1 for specification in instance_fleet.get('InstanceTypeSpecifications', [])] or [1]
+
+def get_fleet_deltas(params, instance_count, spot_count, instance_fleet):
+    # (on-demand, spot) capacity units to add or remove
+    if params.get('on_demand_ratio') is not None:
+        on_demand_count = int(round(instance_count * params.get('on_demand_ratio')))
+        spot_count = instance_count - on_demand_count
+    else:
+        on_demand_count = instance_count
+        spot_count = spot_count or 0
+    units_per_instance = 1
+    if params.get('scale_unit') == 'instances':
+        units_per_instance = min(get_weighted_capacities(instance_fleet))
+    return on_demand_count * units_per_instance, spot_count * units_per_instance
+
+def estimate_instance_count(instance_fleet, on_demand_capacity, spot_capacity):
+    # Fewest instances when the largest instance types are launched, most with the smallest ones
+    weighted_capacities = get_weighted_capacities(instance_fleet)
+    def count_instances(weighted_capacity):
+        return int(math.ceil(float(on_demand_capacity) / weighted_capacity) + math.ceil(float(spot_capacity) / weighted_capacity))
+    return dict(min=count_instances(max(weighted_capacities)), max=count_instances(min(weighted_capacities)))
+
+def resize_instance_fleet_by(emr_client, cluster_id, instance_fleet, on_demand_delta, spot_delta, result):
+    # Targets do not go below 0. Returns the new total target capacity.
+    previous_on_demand_capacity = instance_fleet.get('TargetOnDemandCapacity') or 0
+    previous_spot_capacity = instance_fleet.get('TargetSpotCapacity') or 0
+    on_demand_capacity = max(0, previous_on_demand_capacity + on_demand_delta)
+    spot_capacity = max(0, previous_spot_capacity + spot_delta)
+    result['instance_fleet_type'] = instance_fleet.get('InstanceFleetType')
+    result['target_instance_count'] = on_demand_capacity
+    result['target_on_demand_capacity'] = on_demand_capacity
+    result['target_spot_capacity'] = spot_capacity
+    result['previous_on_demand_capacity'] = previous_on_demand_capacity
+    result['previous_spot_capacity'] = previous_spot_capacity
+    result['estimated_instance_count'] = estimate_instance_count(instance_fleet, on_demand_capacity, spot_capacity)
+    if (on_demand_capacity, spot_capacity) == (previous_on_demand_capacity, previous_spot_capacity):
+        result['operation'] = "Instance fleet is at the target capacity"
+    else:
+        result['response'] = resize_instance_fleet(emr_client, cluster_id, instance_fleet.get('Id'), on_demand_capacity, spot_capacity)
+        result['operation'] = "Instance group exists. Resize"
+        result['changed'] = True
+    return on_demand_capacity + spot_capacity
+
+def scale_out_operation(emr_client, cluster_id, params):
+    instance_collection_name = params.get('instance_collection_name')
+    scale_out_instance_type = params.get('scale_out_instance_type')
+    scale_out_instance_count = params.get('scale_out_instance_count')
+    result = {}
+    cluster = describe_active_cluster(emr_client, cluster_id)
+
+    if is_instance_fleet_enalbed(cluster):
+        # For instance fleet
+        is_fleet = True
+        instance_fleet = find_instance_fleet(emr_client, cluster_id, params.get('instance_fleet_type'))
+        instance_collection_id = instance_fleet.get('Id')
+        on_demand_delta, spot_delta = get_fleet_deltas(params, scale_out_instance_count, params.get('scale_out_spot_count'), instance_fleet)
+        previous_capacity = get_provisioned_capacity(instance_fleet, True)
+        target_capacity = resize_instance_fleet_by(emr_client, cluster_id, instance_fleet, on_demand_delta, spot_delta, result)
+
+    else:
+        # For instance group
+        is_fleet = False
+        instance_collection_list = list_instance_groups(emr_client, cluster_id)
+        instance_collection_id = ''
+        for instance_collection in instance_collection_list:
+            if instance_collection.get('Name') == instance_collection_name:
+                instance_collection_id = instance_collection.get('Id')
+        if instance_collection_id in ('', None):
+            result['response'] = add_scale_out_instance_group(emr_client, cluster_id, instance_collection_name, scale_out_instance_type, scale_out_instance_count)
+            result['operation'] = "Instance collection does not exists. Add new instance collection to scale out"
+            instance_collection_id = result['response'].get('InstanceGroupIds')[0]
+        else:
+            result['response'] = resize_instance_group(emr_client, cluster_id, instance_collection_id, scale_out_instance_count)
+            result['operation'] = "Instance group exists. Resize"
+        target_capacity = scale_out_instance_count
+        previous_capacity = None
+        result['changed'] = True
+
+    if params.get('wait'):
+        check_wait_result(result, wait_for_instance_collection_capacity(emr_client, cluster_id, instance_collection_id, is_fleet, target_capacity, params.get('wait_states') or INSTANCE_COLLECTION_READY_STATES, params.get('wait_timeout'), previous_capacity))
+    return result
+
+def scale_in_operation(emr_client, cluster_id, params):
+    instance_collection_name = params.get('instance_collection_name')
+    scale_in_instance_count = params.get('scale_in_instance_count')
+    result = {}
+    cluster = describe_active_cluster(emr_client, cluster_id)
+
+    if is_instance_fleet_enalbed(cluster):
+        # For instance fleet
+        is_fleet = True
+        instance_fleet = find_instance_fleet(emr_client, cluster_id, params.get('instance_fleet_type'))
+        instance_collection_id = instance_fleet.get('Id')
+        if scale_in_instance_count is None:
+            # Without a count the on-demand target goes to 0
+            spot_delta = get_fleet_deltas(params, 0, params.get('scale_in_spot_count'), instance_fleet)[1]
+            on_demand_delta = -(instance_fleet.get('TargetOnDemandCapacity') or 0)
+        else:
+            on_demand_delta, spot_delta = get_fleet_deltas(params, scale_in_instance_count, params.get('scale_in_spot_count'), instance_fleet)
+            on_demand_delta = -on_demand_delta
+        previous_capacity = get_provisioned_capacity(instance_fleet, True)
+        target_capacity = resize_instance_fleet_by(emr_client, cluster_id, instance_fleet, on_demand_delta, -spot_delta, result)
+
+    else:
+        #For instance group
+        is_fleet = False
+        instance_group_list = list_instance_groups(emr_client, cluster_id)
+        instance_collection_id = ''
+        for instance_group in instance_group_list:
+            if instance_group.get('Name') == instance_collection_name:
+                instance_collection_id = instance_group.get('Id')
+        if instance_collection_id in ('', None):
+            raise EmrOperationError('The instance group to scale in does not exist', result, failed=False)
+        result['response'] = resize_instance_group(emr_client, cluster_id, instance_collection_id, 0)
+        result['operation'] = "Instance group exists. Resize to 0"
+        target_capacity = 0
+        previous_capacity = None
+        result['changed'] = True
+
+    if params.get('wait'):
+        check_wait_result(result, wait_for_instance_collection_capacity(emr_client, cluster_id, instance_collection_id, is_fleet, target_capacity, params.get('wait_states') or INSTANCE_COLLECTION_READY_STATES, params.get('wait_timeout'), previous_capacity))
+    return result
+
+def describe_capacity_spec(capacity_spec):
+    if capacity_spec.get('name') not in ('', None):
+        return 'name ' + str(capacity_spec.get('name'))
+    return 'type ' + str(capacity_spec.get('type')).upper()
+
+def find_capacity_target(instance_collection_list, capacity_spec):
+    # An entry picks its group/fleet by name, or by type when only one active group/fleet has that type
+    matches = []
+    for instance_collection in instance_collection_list:
+        if instance_collection.get('Status', {}).get('State') in INSTANCE_COLLECTION_ENDED_STATES:
+            continue
+        if capacity_spec.get('name') not in ('', None):
+            if instance_collection.get('Name') == capacity_spec.get('name'):
+                matches.append(instance_collection)
+        elif get_instance_collection_type(instance_collection) == str(capacity_spec.get('type')).upper():
+            matches.append(instance_collection)
+    if len(matches) == 0:
+        raise EmrOperationError('No active instance group/fleet was found by ' + describe_capacity_spec(capacity_spec))
+    if len(matches) > 1:
+        raise EmrOperationError(str(len(matches)) + ' active instance groups/fleets were found by ' + describe_capacity_spec(capacity_spec) + ', select one by name')
+    return matches[0]
+
+def get_target_capacity(instance_collection):
+    # (on-demand units, spot units) the group/fleet is asked to run
+    if 'InstanceFleetType' in instance_collection:
+        return instance_collection.get('TargetOnDemandCapacity') or 0, instance_collection.get('TargetSpotCapacity') or 0
+    if instance_collection.get('Market') == 'SPOT':
+        return 0, instance_collection.get('RequestedInstanceCount') or 0
+    return instance_collection.get('RequestedInstanceCount') or 0, 0
+
+def capacity_operation(emr_client, cluster_id, params):
+    result = dict(changed=False, capacity=[])
+    cluster = describe_active_cluster(emr_client, cluster_id)
+    is_fleet = is_instance_fleet_enalbed(cluster)
+    instance_collection_list = list_instance_collections(emr_client, cluster_id, is_fleet)
+    provisioned_capacity = {}
+
+    for capacity_spec in params.get('capacity'):
+        instance_collection = find_capacity_target(instance_collection_list, capacity_spec)
+        if instance_collection.get('Id') in [entry['id'] for entry in result['capacity']]:
+            raise EmrOperationError('Instance group/fleet ' + instance_collection.get('Name') + ' is given more than once in capacity')
+        on_demand, spot = get_target_capacity(instance_collection)
+        provisioned_capacity[instance_collection.get('Id')] = get_provisioned_capacity(instance_collection, is_fleet)
+        desired_on_demand = on_demand if capacity_spec.get('on_demand') is None else int(capacity_spec.get('on_demand'))
+        desired_spot = spot if capacity_spec.get('spot') is None else int(capacity_spec.get('spot'))
+        if not is_fleet:
+            market = instance_collection.get('Market')
+            if (market == 'SPOT' and desired_on_demand != 0) or (market != 'SPOT' and desired_spot != 0):
+                raise EmrOperationError('Instance group ' + instance_collection.get('Name') + ' runs ' + str(market) + ' instances only')
+        result['capacity'].append(dict(
+            id=instance_collection.get('Id'),
+            name=instance_collection.get('Name'),
+            type=get_instance_collection_type(instance_collection),
+            previous_on_demand=on_demand,
+            previous_spot=spot,
+            on_demand=desired_on_demand,
+            spot=desired_spot,
+            changed=(desired_on_demand, desired_spot) != (on_demand, spot)
+        ))
+
+    changed_entries = [entry for entry in result['capacity'] if entry['changed']]
+    if len(changed_entries) == 0:
+        return result
+    if is_fleet:
+        # modify_instance_fleet takes one fleet per request
+        for entry in changed_entries:
+            resize_instance_fleet(emr_client, cluster_id, entry['id'], entry['on_demand'], entry['spot'])
+    else:
+        resize_instance_groups(emr_client, cluster_id, [(entry['id'], entry['on_demand'] + entry['spot']) for entry in changed_entries])
+    result['changed'] = True
+
+    if params.get('wait'):
+        for entry in changed_entries:
+            wait_result = wait_for_instance_collection_capacity(emr_client, cluster_id, entry['id'], is_fleet, entry['on_demand'] + entry['spot'], params.get('wait_states') or INSTANCE_COLLECTION_READY_STATES, params.get('wait_timeout'), provisioned_capacity[entry['id']])
+            try:
+                check_wait_result(entry, wait_result)
+            except EmrOperationError as err:
+                raise EmrOperationError(entry['name'] + ': ' + err.msg, result)
+    return result
+
+def get_instance_group_spec(value):
+    if isinstance(value, dict):
+        return value
+    return dict(instance_count=value)
+
+def add_job_flow_steps(emr_client, cluster_id, steps):
+    # Batches are sent one after another to keep the step order. A retried add after a server error could add the
+    # steps twice, so only throttling is retried.
+    step_ids = []
+    for steps_chunk in split_into_chunks(steps, ADD_STEPS_BATCH_SIZE):
+        step_ids.extend(call_emr_api(emr_client.add_job_flow_steps, idempotent=False, JobFlowId=cluster_id, Steps=steps_chunk).get('StepIds'))
+    return step_ids
+
+def add_steps_operation(emr_client, cluster_id, params):
+    steps = load_steps(params)
+    return dict(changed=True, cluster_id=cluster_id, step_ids=add_job_flow_steps(emr_client, cluster_id, steps))
+
+def get_step_state(step):
+    if step is None:
+        return None
+    return step.get('Status', {}).get('State')
+
+def describe_steps(emr_client, cluster_id, step_ids):
+    steps = {}
+    for step_ids_chunk in split_into_chunks(step_ids, LIST_STEPS_ID_LIMIT):
+        for step in iter_steps(emr_client, cluster_id, StepIds=step_ids_chunk):
+            steps[step.get('Id')] = step
+    return steps
+
+def wait_for_steps(emr_client, cluster_id, step_ids, fail_fast, timeout):
+    # Steps that ended are kept and not queried again. The poll reads the unfinished steps by id, 10 per list_steps
+    # call; with more of them it lists the cluster's active steps instead and reads by id only those that left it.
+    steps = {}
+    started = time()
+    def get_state():
+        unfinished_ids = [step_id for step_id in step_ids if get_step_state(steps.get(step_id)) not in STEP_ENDED_STATES]
+        if len(unfinished_ids) > LIST_STEPS_ID_LIMIT:
+            active_steps = dict((step.get('Id'), step) for step in iter_steps(emr_client, cluster_id, StepStates=STEP_ACTIVE_STATES))
+            steps.update((step_id, active_steps[step_id]) for step_id in unfinished_ids if step_id in active_steps)
+            unfinished_ids = [step_id for step_id in unfinished_ids if step_id not in active_steps]
+        steps.update(describe_steps(emr_client, cluster_id, unfinished_ids))
+        missing_ids = [step_id for step_id in step_ids if step_id not in steps]
+        if len(missing_ids) > 0 and time() - started >= STEP_NOT_FOUND_GRACE:
+            return 'NOT_FOUND', missing_ids
+        states = [get_step_state(steps.get(step_id)) for step_id in step_ids]
+        failed_steps = [steps[step_id] for step_id in step_ids if get_step_state(steps.get(step_id)) in STEP_FAILED_STATES]
+        if len(failed_steps) > 0 and (fail_fast or all(state in STEP_ENDED_STATES for state in states)):
+            return 'FAILED', failed_steps[0]
+        if all(state == 'COMPLETED' for state in states):
+            return 'COMPLETED', None
+        return 'RUNNING' if 'RUNNING' in states else 'PENDING', None
+    def get_progress(detail):
+        return len([step for step in steps.values() if get_step_state(step) in STEP_ENDED_STATES])
+    wait_result = poll_until(get_state, ['COMPLETED'], ['FAILED', 'NOT_FOUND'], timeout, get_progress, len(step_ids))
+    wait_result['steps'] = steps
+    return wait_result
+
+def get_duration(started, ended):
+    if started is None or ended is None:
+        return None
+    return round((ended - started).total_seconds(), 1)
+
+def get_step_log_files(log_uri, cluster_id, step_id):
+    # EMR uploads the step logs to <LogUri>/<cluster id>/steps/<step id>/ a few minutes after the step ended
+    if log_uri in ('', None):
+        return None
+    step_log_dir = log_uri.rstrip('/') + '/' + cluster_id + '/steps/' + step_id + '/'
+    return dict((log_name, step_log_dir + log_name + '.gz') for log_name in STEP_LOG_FILES)
+
+def summarize_waited_step(step, log_uri, cluster_id):
+    summary = summarize_step(step)
+    summary['duration'] = get_duration(summary['started'], summary['ended'])
+    if summary['state'] in STEP_FAILED_STATES:
+        failure_details = step.get('Status', {}).get('FailureDetails', {})
+        summary['failure'] = dict(
+            reason=failure_details.get('Reason'),
+            message=failure_details.get('Message') or step.get('Status', {}).get('StateChangeReason', {}).get('Message'),
+            log_file=failure_details.get('LogFile'),
+            log_files=get_step_log_files(log_uri, cluster_id, step.get('Id'))
+        )
+    return summary
+
+def check_steps_wait_result(emr_client, cluster_id, step_ids, result, wait_result, log_uri, wait_key='wait'):
+    # Like check_wait_result, with the steps in result['steps'] and the wait in result[wait_key]
+    steps = wait_result['steps']
+    if log_uri in ('', None) and any(get_step_state(step) in STEP_FAILED_STATES for step in steps.values()):
+        log_uri = describle_cluster(emr_client, cluster_id).get('LogUri')
+    result['steps'] = [summarize_waited_step(steps[step_id], log_uri, cluster_id) if step_id in steps else dict(id=step_id, state=None) for step_id in step_ids]
+    result[wait_key] = dict(
+        state=wait_result['state'],
+        elapsed=wait_result['elapsed'],
+        timeline=wait_result['timeline'],
+        step_count=len(step_ids),
+        ended_count=wait_result['progress'],
+        ended_timeline=[dict(ended=entry['progress'], elapsed=entry['elapsed']) for entry in wait_result['progress_timeline']]
+    )
+    ended = ' with ' + str(wait_result['progress']) + ' of ' + str(len(step_ids)) + ' steps ended'
+    if wait_result['outcome'] == 'failed' and wait_result['state'] == 'NOT_FOUND':
+        raise EmrOperationError('Steps not found in cluster ' + cluster_id + ': ' + ', '.join(wait_result['detail']), result)
+    if wait_result['outcome'] == 'failed':
+        failed_step = summarize_waited_step(wait_result['detail'], log_uri, cluster_id)
+        raise EmrOperationError('Step ' + str(failed_step['name']) + ' (' + failed_step['id'] + ') ended in state ' + failed_step['state'] + ended + ': ' + str(failed_step['failure']['message']), result)
+    if wait_result['outcome'] == 'timeout':
+        raise EmrOperationError('Timed out after ' + str(wait_result['elapsed']) + ' seconds' + ended, result)
+
+def wait_steps_operation(emr_client, cluster_id, params):
+    step_ids = params.get('step_ids')
+    result = dict(changed=False, cluster_id=cluster_id)
+    wait_result = wait_for_steps(emr_client, cluster_id, step_ids, params.get('fail_fast'), params.get('wait_timeout'))
+    check_steps_wait_result(emr_client, cluster_id, step_ids, result, wait_result, params.get('log_url'))
+    return result
+
+def resize_instance_groups_operation(emr_client, cluster_id, params):
+    # list_instance_groups, add_instance_groups and modify_instance_groups at most once each, whatever the number of groups
+    result = dict(changed=False, instance_groups=[])
+    instance_group_by_name = {}
+    for instance_group in list_instance_groups(emr_client, cluster_id):
+        if instance_group.get('Status', {}).get('State') not in INSTANCE_COLLECTION_ENDED_STATES:
+            instance_group_by_name[instance_group.get('Name')] = instance_group
+
+    new_instance_groups = []
+    instance_counts = []
+    for instance_group_name in sorted(params.get('instance_groups')):
+        instance_group_spec = get_instance_group_spec(params.get('instance_groups')[instance_group_name])
+        instance_count = int(instance_group_spec.get('instance_count'))
+        instance_group = instance_group_by_name.get(instance_group_name)
+        entry = dict(name=instance_group_name, instance_count=instance_count)
+        if instance_group is None:
+            entry.update(id=None, previous_instance_count=0, operation='add' if instance_count > 0 else 'none')
+            if instance_count > 0:
+                new_instance_groups.append({
+                    'Name': instance_group_name,
+                    'Market': instance_group_spec.get('market') or 'ON_DEMAND',
+                    'InstanceRole': 'TASK',
+                    'InstanceType': instance_group_spec.get('instance_type') or params.get('scale_out_instance_type'),
+                    'InstanceCount': instance_count
+                })
+        else:
+            previous_instance_count = instance_group.get('RequestedInstanceCount')
+            entry.update(id=instance_group.get('Id'), previous_instance_count=previous_instance_count, operation='resize' if instance_count != previous_instance_count else 'none')
+            if instance_count != previous_instance_count:
+                instance_counts.append((instance_group.get('Id'), instance_count))
+        result['instance_groups'].append(entry)
+
+    if len(new_instance_groups) > 0:
+        new_instance_group_ids = add_instance_groups(emr_client, cluster_id, new_instance_groups).get('InstanceGroupIds')
+        new_entries = [entry for entry in result['instance_groups'] if entry['operation'] == 'add']
+        for entry, instance_group_id in zip(new_entries, new_instance_group_ids):
+            entry['id'] = instance_group_id
+        result['changed'] = True
+    if len(instance_counts) > 0:
+        resize_instance_groups(emr_client, cluster_id, instance_counts)
+        result['changed'] = True
+
+    if params.get('wait'):
+        for entry in result['instance_groups']:
+            if entry['operation'] == 'none':
+                continue
+            wait_result = wait_for_instance_collection_capacity(emr_client, cluster_id, entry['id'], False, entry['instance_count'], params.get('wait_states') or INSTANCE_COLLECTION_READY_STATES, params.get('wait_timeout'))
+            try:
+                check_wait_result(entry, wait_result)
+            except EmrOperationError as err:
+                raise EmrOperationError(entry['name'] + ': ' + err.msg, result)
+    return result
+
+def find_scaling_policy_group(emr_client, cluster_id, params):
+    cluster = describe_active_cluster(emr_client, cluster_id)
+    if is_instance_fleet_enalbed(cluster):
+        raise EmrOperationError('Automatic scaling policies are supported by instance groups only, use managed scaling for instance fleets')
+    for instance_group in list_instance_groups(emr_client, cluster_id):
+        if params.get('instance_group_id') not in ('', None):
+            if instance_group.get('Id') == params.get('instance_group_id'):
+                return instance_group
+        elif instance_group.get('Name') == params.get('instance_collection_name') and instance_group.get('Status', {}).get('State') not in INSTANCE_COLLECTION_ENDED_STATES:
+            return instance_group
+    raise EmrOperationError('The instance group ' + str(params.get('instance_group_id') or params.get('instance_collection_name')) + ' does not exist')
+
+def is_auto_scaling_policy_attached(instance_group):
+    auto_scaling_policy = instance_group.get('AutoScalingPolicy')
+    return auto_scaling_policy is not None and auto_scaling_policy.get('Status', {}).get('State') not in ('DETACHED', 'FAILED')
+
+def normalize_auto_scaling_rule(rule, cluster_id, unit_given):
+    rule = copy.deepcopy(rule)
+    rule.setdefault('Description', '')
+    alarm = rule.setdefault('Trigger', {}).setdefault('CloudWatchAlarmDefinition', {})
+    for key, value in AUTO_SCALING_ALARM_DEFAULTS.items():
+        alarm.setdefault(key, copy.deepcopy(value))
+    for dimension in alarm['Dimensions']:
+        if dimension.get('Value') == cluster_id:
+            dimension['Value'] = '${emr.clusterId}'
+    alarm['Threshold'] = float(alarm.get('Threshold', 0))
+    if not unit_given:
+        # The unit EMR picks for a rule without one is not documented
+        alarm.pop('Unit', None)
+    action = rule.setdefault('Action', {}).setdefault('SimpleScalingPolicyConfiguration', {})
+    for key, value in AUTO_SCALING_ACTION_DEFAULTS.items():
+        action.setdefault(key, value)
+    return rule
+
+def is_auto_scaling_policy_equal(current_policy, auto_scaling_policy, cluster_id):
+    # The attached policy has the defaults EMR filled in, so both sides are normalized before comparing
+    current_rules = current_policy.get('Rules') or []
+    rules = auto_scaling_policy.get('Rules') or []
+    if current_policy.get('Constraints') != auto_scaling_policy.get('Constraints') or len(current_rules) != len(rules):
+        return False
+    for current_rule, rule in zip(current_rules, rules):
+        unit_given = 'Unit' in rule.get('Trigger', {}).get('CloudWatchAlarmDefinition', {})
+        if normalize_auto_scaling_rule(current_rule, cluster_id, unit_given) != normalize_auto_scaling_rule(rule, cluster_id, unit_given):
+            return False
+    return True
+
+def put_auto_scaling_policy_operation(emr_client, cluster_id, params):
+    auto_scaling_policy = load_json_file(params.get('auto_scaling_policy'), 'auto_scaling_policy')
+    auto_scaling_policy = auto_scaling_policy.get('AutoScalingPolicy', auto_scaling_policy)
+    instance_group = find_scaling_policy_group(emr_client, cluster_id, params)
+    result = dict(changed=False, instance_group_id=instance_group.get('Id'))
+    current_policy = instance_group.get('AutoScalingPolicy') or {}
+    if is_auto_scaling_policy_attached(instance_group) and is_auto_scaling_policy_equal(current_policy, auto_scaling_policy, cluster_id):
+        result['auto_scaling_policy'] = current_policy
+        return result
+    result['auto_scaling_policy'] = call_emr_api(
+        emr_client.put_auto_scaling_policy,
+        ClusterId=cluster_id,
+        InstanceGroupId=instance_group.get('Id'),
+        AutoScalingPolicy=auto_scaling_policy
+    ).get('AutoScalingPolicy')
+    result['changed'] = True
+    return result
+
+def remove_auto_scaling_policy_operation(emr_client, cluster_id, params):
+    instance_group = find_scaling_policy_group(emr_client, cluster_id, params)
+    result = dict(changed=False, instance_group_id=instance_group.get('Id'))
+    if is_auto_scaling_policy_attached(instance_group):
+        call_emr_api(emr_client.remove_auto_scaling_policy, ClusterId=cluster_id, InstanceGroupId=instance_group.get('Id'))
+        result['changed'] = True
+    return result
+
+def has_managed_scaling(emr_client):
+    # The service model of botocore before 1.15.43 has no managed scaling operations
+    return 'GetManagedScalingPolicy' in emr_client.meta.service_model.operation_names
+
+def check_managed_scaling(emr_client):
+    if not has_managed_scaling(emr_client):
+        raise EmrOperationError('Managed scaling needs botocore 1.15.43 or later, botocore ' + botocore.__version__ + ' is installed')
+
+def get_managed_scaling_policy(emr_client, cluster_id):
+    return call_emr_api(emr_client.get_managed_scaling_policy, ClusterId=cluster_id).get('ManagedScalingPolicy')
+
+def put_managed_scaling_policy_operation(emr_client, cluster_id, params):
+    check_managed_scaling(emr_client)
+    managed_scaling_policy = load_json_file(params.get('managed_scaling_policy'), 'managed_scaling_policy')
+    managed_scaling_policy = managed_scaling_policy.get('ManagedScalingPolicy', managed_scaling_policy)
+    result = dict(changed=False, managed_scaling_policy=managed_scaling_policy)
+    if get_managed_scaling_policy(emr_client, cluster_id) == managed_scaling_policy:
+        return result
+    call_emr_api(emr_client.put_managed_scaling_policy, ClusterId=cluster_id, ManagedScalingPolicy=managed_scaling_policy)
+    result['changed'] = True
+    return result
+
+def remove_managed_scaling_policy_operation(emr_client, cluster_id, params):
+    check_managed_scaling(emr_client)
+    result = dict(changed=False)
+    if get_managed_scaling_policy(emr_client, cluster_id):
+        call_emr_api(emr_client.remove_managed_scaling_policy, ClusterId=cluster_id)
+        result['changed'] = True
+    return result
+
+def describe_scaling_policies_operation(emr_client, cluster_id, params):
+    cluster = describe_active_cluster(emr_client, cluster_id)
+    result = dict(
+        auto_scaling_role=cluster.get('AutoScalingRole'),
+        managed_scaling_policy=None,
+        auto_scaling_policies=[]
+    )
+    if has_managed_scaling(emr_client):
+        result['managed_scaling_policy'] = get_managed_scaling_policy(emr_client, cluster_id)
+    if not is_instance_fleet_enalbed(cluster):
+        for instance_group in list_instance_groups(emr_client, cluster_id):
+            if instance_group.get('AutoScalingPolicy') is not None:
+                result['auto_scaling_policies'].append(dict(
+                    instance_group_id=instance_group.get('Id'),
+                    name=instance_group.get('Name'),
+                    type=instance_group.get('InstanceGroupType'),
+                    auto_scaling_policy=instance_group.get('AutoScalingPolicy')
+                ))
+    return result
+
+def summarize_instance_collection(instance_collection):
+    summary = dict(
+        id=instance_collection.get('Id'),
+        name=instance_collection.get('Name'),
+        type=get_instance_collection_type(instance_collection),
+        state=instance_collection.get('Status', {}).get('State')
+    )
+    if 'InstanceFleetType' in instance_collection:
+        summary['target_on_demand_capacity'] = instance_collection.get('TargetOnDemandCapacity')
+        summary['target_spot_capacity'] = instance_collection.get('TargetSpotCapacity')
+        summary['provisioned_on_demand_capacity'] = instance_collection.get('ProvisionedOnDemandCapacity')
+        summary['provisioned_spot_capacity'] = instance_collection.get('ProvisionedSpotCapacity')
+        summary['instance_types'] = [specification.get('InstanceType') for specification in instance_collection.get('InstanceTypeSpecifications', [])]
+    else:
+        summary['market'] = instance_collection.get('Market')
+        summary['instance_type'] = instance_collection.get('InstanceType')
+        summary['requested_instance_count'] = instance_collection.get('RequestedInstanceCount')
+        summary['running_instance_count'] = instance_collection.get('RunningInstanceCount')
+    return summary
+
+def summarize_step(step):
+    timeline = step.get('Status', {}).get('Timeline', {})
+    return dict(
+        id=step.get('Id'),
+        name=step.get('Name'),
+        state=step.get('Status', {}).get('State'),
+        action_on_failure=step.get('ActionOnFailure'),
+        created=timeline.get('CreationDateTime'),
+        started=timeline.get('StartDateTime'),
+        ended=timeline.get('EndDateTime')
+    )
+
+def gather_cluster_facts(emr_client, cluster_id, step_limit):
+    # describe_cluster, list_instances, list_steps and list_bootstrap_actions run concurrently.
+    # The instance groups/fleets are listed as soon as describe_cluster tells which of them the cluster uses.
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        cluster_future = executor.submit(describle_cluster, emr_client, cluster_id)
+        instances_future = executor.submit(lambda: list(iter_instances(emr_client, cluster_id)))
+        steps_future = executor.submit(lambda: list(islice(iter_steps(emr_client, cluster_id), step_limit)))
+        bootstrap_future = executor.submit(list_bootstrap_actions, emr_client, cluster_id)
+        cluster = cluster_future.result()
+        is_fleet = is_instance_fleet_enalbed(cluster)
+        instance_collection_list = list_instance_collections(emr_client, cluster_id, is_fleet)
+        instance_list = instances_future.result()
+        step_list = steps_future.result()
+        bootstrap_action_list = bootstrap_future.result()
+    finally:
+        executor.shutdown(wait=True)
+
+    ips_by_role = get_ips_by_role(partition_instances_by_role(instance_list, instance_collection_list, is_fleet))
+    return dict(
+        id=cluster_id,
+        name=cluster.get('Name'),
+        state=get_cluster_state(cluster),
+        state_changed_reason=get_cluster_state_change_reason(cluster),
+        release_label=cluster.get('ReleaseLabel'),
+        applications=[application.get('Name') for application in cluster.get('Applications', [])],
+        instance_collection_type=cluster.get('InstanceCollectionType'),
+        master_public_dns_name=cluster.get('MasterPublicDnsName'),
+        log_url=cluster.get('LogUri'),
+        tags=dict((tag.get('Key'), tag.get('Value')) for tag in cluster.get('Tags', [])),
+        instance_collections=[summarize_instance_collection(instance_collection) for instance_collection in instance_collection_list],
+        instance_count=len(instance_list),
+        master_private_ip=(ips_by_role['MASTER'] or [None])[0],
+        core_private_ips=ips_by_role['CORE'],
+        task_private_ips=ips_by_role['TASK'],
+        steps=[summarize_step(step) for step in step_list],
+        bootstrap_actions=[dict(name=action.get('Name'), path=action.get('ScriptPath'), args=action.get('Args')) for action in bootstrap_action_list]
+    )
+
+def cluster_facts_operation(emr_client, cluster_id, params):
+    if not HAS_FUTURES:
+        raise EmrOperationError('futures is required for cluster-facts with Python 2')
+    return dict(cluster_facts=gather_cluster_facts(emr_client, cluster_id, params.get('step_limit')))
+
+CLUSTER_OPERATIONS = {
+    'describe': describe_operation,
+    'check-status': check_status_operation,
+    'get-master-ip': get_ips_operation,
+    'get-core-ips': get_ips_operation,
+    'get-slave-ips': get_ips_operation,
+    'terminate': terminate_operation,
+    'scale-out': scale_out_operation,
+    'scale-in': scale_in_operation,
+    'capacity': capacity_operation,
+    'resize-instance-groups': resize_instance_groups_operation,
+    'add-steps': add_steps_operation,
+    'wait-steps': wait_steps_operation,
+    'put-auto-scaling-policy': put_auto_scaling_policy_operation,
+    'remove-auto-scaling-policy': remove_auto_scaling_policy_operation,
+    'put-managed-scaling-policy': put_managed_scaling_policy_operation,
+    'remove-managed-scaling-policy': remove_managed_scaling_policy_operation,
+    'describe-scaling-policies': describe_scaling_policies_operation,
+    'cluster-facts': cluster_facts_operation
+}
+
+def get_cluster_ids_by_names(emr_client, cluster_names):
+    # Resolve several names with one scan of the active clusters, newest cluster wins
+    result = {}
+    pending_names = set(cluster_names)
+    for created_after, created_before in iter_lookup_windows(datetime.utcnow()):
+        for cluster in iter_clusters(emr_client, ACTIVE_CLUSTER_STATES, created_after, created_before):
+            if cluster.get('Name') in pending_names:
+                result[cluster.get('Name')] = cluster.get('Id')
+                pending_names.discard(cluster.get('Name'))
+                if len(pending_names) == 0:
+                    return result
+    return result
+
+def run_cluster_operation(emr_client, operation, cluster_id, params):
+    try:
+        return operation(emr_client, cluster_id, params)
+    except EmrOperationError as err:
+        error_result = dict(err.result)
+        error_result['msg'] = err.msg
+        error_result['failed'] = err.failed
+        return error_result
+    except (ClientError, BotoCoreError) as err:
+        # Connection errors past the retry deadline and invalid parameters fail this cluster, not the batch
+        return dict(msg=to_native(err), failed=True)
+
+def run_batch_operation(emr_client, operation, cluster_ids, params, concurrency):
+    # Fan out one operation over many clusters. The boto3 client and the token bucket are shared by all workers.
+    result = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(cluster_ids))))
+    try:
+        futures = {}
+        for cluster_id in cluster_ids:
+            futures[cluster_id] = executor.submit(run_cluster_operation, emr_client, operation, cluster_id, params)
+        for cluster_id in cluster_ids:
+            result[cluster_id] = futures[cluster_id].result()
+    finally:
+        executor.shutdown(wait=True)
+    return result
+
+def to_epoch(value):
+    if value is None:
+        return None
+    return calendar.timegm(value.utctimetuple())
+
+def get_access_key(emr_client, params):
+    # Tells accounts and credential sets apart without an STS call. Without aws_access_key it is the access key
+    # get_client resolved from the environment or profile when it created the client.
+    access_key = params.get('aws_access_key')
+    if access_key in ('', None):
+        access_key = client_access_keys.get(emr_client) or 'default'
+    return access_key
+
+class ClusterSnapshot(object):
+    # Clusters, instance collections and instance IPs of one region and access key kept in a local JSON file.
+    # Answers are served from the file while they are younger than max_age seconds.
+    def __init__(self, path, region, access_key, max_age):
+        self.path = path
+        self.region = region + '/' + access_key
+        self.max_age = max_age
+        self.refreshed = False
+        self.data = self.read_regions().get(self.region, dict(last_sync=0, clusters={}))
+
+    def read_regions(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as snapshot_file:
+                return json.load(snapshot_file)
+        except ValueError:
+            # A broken snapshot is rebuilt from scratch
+            return {}
+
+    def save(self):
+        regions = self.read_regions()
+        regions[self.region] = self.data
+        temp_path = self.path + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp'
+        with open(temp_path, 'w') as snapshot_file:
+            json.dump(regions, snapshot_file)
+        os.rename(temp_path, self.path)
+
+    def is_fresh(self, synced_at):
+        return time() - synced_at <= self.max_age
+
+    def update_cluster(self, cluster):
+        entry = self.data['clusters'].setdefault(cluster.get('Id'), {})
+        state = get_cluster_state(cluster)
+        if entry.get('State') != state:
+            # Instances are read again after any state change
+            entry.pop('instances_synced', None)
+        entry['Id'] = cluster.get('Id')
+        entry['Name'] = cluster.get('Name')
+        entry['State'] = state
+        entry['Created'] = to_epoch(cluster.get('Status').get('Timeline', {}).get('CreationDateTime'))
+        return entry
+
+    def refresh(self, emr_client):
+        # The summaries of list_clusters carry everything a snapshot entry keeps, so new clusters and state changes
+        # between active states need no describe_cluster. Only clusters that left the active states are described.
+        sync_started = time()
+        seen_ids = set()
+        for cluster in iter_clusters(emr_client, ACTIVE_CLUSTER_STATES):
+            self.update_cluster(cluster)
+            seen_ids.add(cluster.get('Id'))
+        for cluster_id, entry in list(self.data['clusters'].items()):
+            if cluster_id in seen_ids or entry.get('State') in CLUSTER_TERMINAL_STATES:
+                continue
+            try:
+                self.update_cluster(describle_cluster(emr_client, cluster_id))
+            except ClientError as err:
+                if err.response['Error']['Code'] != 'InvalidRequestException':
+                    raise
+                del self.data['clusters'][cluster_id]
+        for cluster_id, entry in list(self.data['clusters'].items()):
+            if entry.get('State') in CLUSTER_TERMINAL_STATES and sync_started - (entry.get('Created') or 0) > SNAPSHOT_RETENTION:
+                del self.data['clusters'][cluster_id]
+        self.data['last_sync'] = sync_started
+        self.refreshed = True
+        self.save()
+
+    def find_cluster_id(self, cluster_name):
+        candidates = [entry for entry in self.data['clusters'].values() if entry.get('Name') == cluster_name and entry.get('State') in ACTIVE_CLUSTER_STATES]
+        if len(candidates) == 0:
+            return None
+        return max(candidates, key=lambda entry: entry.get('Created') or 0).get('Id')
+
+    def get_cluster_id(self, emr_client, cluster_name):
+        if not self.is_fresh(self.data['last_sync']):
+            self.refresh(emr_client)
+        cluster_id = self.find_cluster_id(cluster_name)
+        if cluster_id is None and not self.refreshed:
+            # The cluster might have been created after the last sync
+            self.refresh(emr_client)
+            cluster_id = self.find_cluster_id(cluster_name)
+        return cluster_id
+
+    def get_cluster_details(self, emr_client, cluster_id):
+        entry = self.data['clusters'].get(cluster_id)
+        if entry is None or not self.is_fresh(entry.get('instances_synced', 0)):
+            cluster = describle_cluster(emr_client, cluster_id)
+            entry = self.update_cluster(cluster)
+            entry['InstanceCollectionType'] = cluster.get('InstanceCollectionType')
+            instance_collection_list, instances_by_role = collect_instances_by_role(emr_client, cluster_id, is_instance_fleet_enalbed(cluster))
+            entry['collections'] = [dict(Id=instance_collection.get('Id'), Name=instance_collection.get('Name'), Type=get_instance_collection_type(instance_collection)) for instance_collection in instance_collection_list]
+            entry['ips'] = get_ips_by_role(instances_by_role)
+            entry['instances_synced'] = time()
+            self.save()
+        return entry
+
+def resolve_cluster_id(emr_client, cluster_name, snapshot):
+    if snapshot is not None:
+        return snapshot.get_cluster_id(emr_client, cluster_name)
+    return get_cluster_id(emr_client, cluster_name)
+
+spec_cache = {}
+spec_cache_lock = threading.Lock()
+
+def load_json_file(file_path, param_name):
+    # Parsed files are cached by content, so the aws_emr helper parses a spec file once however often it is used
+    try:
+        with trace_span('load ' + param_name, 'file'), open(to_bytes(file_path, errors='surrogate_or_strict'), 'rb') as json_file:
+            content = json_file.read()
+    except (IOError, OSError) as err:
+        raise EmrOperationError('Could not load ' + param_name + ' from ' + file_path + ': ' + to_native(err.strerror or err))
+    cache_key = hashlib.sha1(content).hexdigest()
+    # Callers get a copy, so a spec changed by one task never leaks into the next one
+    with spec_cache_lock:
+        if cache_key in spec_cache:
+            return copy.deepcopy(spec_cache[cache_key])
+    try:
+        spec = json.loads(content.decode('utf-8'))
+    except ValueError as err:
+        raise EmrOperationError('Could not load ' + param_name + ' from ' + file_path + ': ' + to_native(err))
+    with spec_cache_lock:
+        if len(spec_cache) >= SPEC_CACHE_SIZE:
+            spec_cache.clear()
+        spec_cache[cache_key] = spec
+    return copy.deepcopy(spec)
+
+def is_count(value, minimum=0):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+def is_text(value):
+    return isinstance(value, string_types) and value != ''
+
+def check_keys(errors, path, item, allowed_keys):
+    for key in sorted(set(item) - set(allowed_keys)):
+        errors.append(path + ': unknown key ' + key)
+
+def check_configurations(errors, path, configurations):
+    if not isinstance(configurations, list):
+        errors.append(path + ': must be a list')
+        return
+    for index, configuration in enumerate(configurations):
+        item_path = path + '[' + str(index) + ']'
+        if not isinstance(configuration, dict):
+            errors.append(item_path + ': must be an object')
+            continue
+        check_keys(errors, item_path, configuration, ['Classification', 'Configurations', 'Properties'])
+        if not is_text(configuration.get('Classification')):
+            errors.append(item_path + ': Classification is required')
+        properties = configuration.get('Properties', {})
+        if not isinstance(properties, dict):
+            errors.append(item_path + ': Properties must be an object')
+        else:
+            for name in sorted(properties):
+                if not isinstance(properties[name], string_types):
+                    errors.append(item_path + ': the value of property ' + name + ' must be a string')
+        check_configurations(errors, item_path + '.Configurations', configuration.get('Configurations', []))
+
+def check_instance_groups(errors, instance_groups):
+    if any(isinstance(instance_group, dict) and 'InstanceFleetType' in instance_group for instance_group in instance_groups):
+        errors.append('instances: the file describes instance fleets (InstanceFleetType), set enable_fleet to use it')
+        return
+    roles = []
+    for index, instance_group in enumerate(instance_groups):
+        path = 'instances[' + str(index) + ']'
+        if not isinstance(instance_group, dict):
+            errors.append(path + ': must be an object')
+            continue
+        check_keys(errors, path, instance_group, INSTANCE_GROUP_KEYS)
+        if instance_group.get('InstanceRole') not in INSTANCE_ROLES:
+            errors.append(path + ': InstanceRole must be one of ' + ', '.join(INSTANCE_ROLES))
+        roles.append(instance_group.get('InstanceRole'))
+        if not is_text(instance_group.get('InstanceType')):
+            errors.append(path + ': InstanceType is required')
+        if not is_count(instance_group.get('InstanceCount')):
+            errors.append(path + ': InstanceCount must be a non-negative integer')
+        if instance_group.get('Market', 'ON_DEMAND') not in ('ON_DEMAND', 'SPOT'):
+            errors.append(path + ': Market must be ON_DEMAND or SPOT')
+        check_configurations(errors, path + '.Configurations', instance_group.get('Configurations', []))
+    if roles.count('MASTER') != 1:
+        errors.append('instances: exactly one MASTER instance group is required')
+    if roles.count('CORE') > 1:
+        errors.append('instances: only one CORE instance group is allowed')
+
+def check_instance_fleets(errors, instance_fleets):
+    if any(isinstance(instance_fleet, dict) and 'InstanceRole' in instance_fleet for instance_fleet in instance_fleets):
+        errors.append('instances: the file describes instance groups (InstanceRole), it needs enable_fleet false')
+        return
+    types = []
+    for index, instance_fleet in enumerate(instance_fleets):
+        path = 'instances[' + str(index) + ']'
+        if not isinstance(instance_fleet, dict):
+            errors.append(path + ': must be an object')
+            continue
+        check_keys(errors, path, instance_fleet, INSTANCE_FLEET_KEYS)
+        if instance_fleet.get('InstanceFleetType') not in INSTANCE_ROLES:
+            errors.append(path + ': InstanceFleetType must be one of ' + ', '.join(INSTANCE_ROLES))
+        types.append(instance_fleet.get('InstanceFleetType'))
+        for capacity_key in ('TargetOnDemandCapacity', 'TargetSpotCapacity'):
+            if not is_count(instance_fleet.get(capacity_key, 0)):
+                errors.append(path + ': ' + capacity_key + ' must be a non-negative integer')
+        if instance_fleet.get('InstanceFleetType') == 'MASTER' and (instance_fleet.get('TargetOnDemandCapacity', 0), instance_fleet.get('TargetSpotCapacity', 0)) not in ((1, 0), (0, 1)):
+            errors.append(path + ': the MASTER instance fleet needs a target capacity of 1')
+        instance_type_configs = instance_fleet.get('InstanceTypeConfigs')
+        if not isinstance(instance_type_configs, list) or len(instance_type_configs) == 0:
+            errors.append(path + ': InstanceTypeConfigs must be a non-empty list')
+            continue
+        for config_index, instance_type_config in enumerate(instance_type_configs):
+            config_path = path + '.InstanceTypeConfigs[' + str(config_index) + ']'
+            if not isinstance(instance_type_config, dict):
+                errors.append(config_path + ': must be an object')
+                continue
+            check_keys(errors, config_path, instance_type_config, INSTANCE_TYPE_CONFIG_KEYS)
+            if not is_text(instance_type_config.get('InstanceType')):
+                errors.append(config_path + ': InstanceType is required')
+            if not is_count(instance_type_config.get('WeightedCapacity', 1), 1):
+                errors.append(config_path + ': WeightedCapacity must be a positive integer')
+            check_configurations(errors, config_path + '.Configurations', instance_type_config.get('Configurations', []))
+    if types.count('MASTER') != 1:
+        errors.append('instances: exactly one MASTER instance fleet is required')
+    for instance_fleet_type in ('CORE', 'TASK'):
+        if types.count(instance_fleet_type) > 1:
+            errors.append('instances: only one ' + instance_fleet_type + ' instance fleet is allowed')
+
+def check_bootstrap_actions(errors, bootstrap_actions):
+    if not isinstance(bootstrap_actions, list):
+        errors.append('bootstrap_actions: must be a list')
+        return
+    for index, bootstrap_action in enumerate(bootstrap_actions):
+        path = 'bootstrap_actions[' + str(index) + ']'
+        if not isinstance(bootstrap_action, dict):
+            errors.append(path + ': must be an object')
+            continue
+        check_keys(errors, path, bootstrap_action, ['Name', 'ScriptBootstrapAction'])
+        if not is_text(bootstrap_action.get('Name')):
+            errors.append(path + ': Name is required')
+        script = bootstrap_action.get('ScriptBootstrapAction')
+        if not isinstance(script, dict) or not is_text(script.get('Path')):
+            errors.append(path + ': ScriptBootstrapAction.Path is required')
+            continue
+        check_keys(errors, path + '.ScriptBootstrapAction', script, ['Path', 'Args'])
+        if not isinstance(script.get('Args', []), list) or not all(isinstance(arg, string_types) for arg in script.get('Args', [])):
+            errors.append(path + ': ScriptBootstrapAction.Args must be a list of strings')
+
+def check_steps(errors, steps):
+    if not isinstance(steps, list) or len(steps) == 0:
+        errors.append('steps: must be a non-empty list')
+        return
+    for index, step in enumerate(steps):
+        path = 'steps[' + str(index) + ']'
+        if not isinstance(step, dict):
+            errors.append(path + ': must be an object')
+            continue
+        check_keys(errors, path, step, STEP_KEYS)
+        if not is_text(step.get('Name')):
+            errors.append(path + ': Name is required')
+        if step.get('ActionOnFailure', 'CONTINUE') not in STEP_ACTIONS_ON_FAILURE:
+            errors.append(path + ': ActionOnFailure must be one of ' + ', '.join(STEP_ACTIONS_ON_FAILURE))
+        hadoop_jar_step = step.get('HadoopJarStep')
+        if not isinstance(hadoop_jar_step, dict) or not is_text(hadoop_jar_step.get('Jar')):
+            errors.append(path + ': HadoopJarStep.Jar is required')
+            continue
+        check_keys(errors, path + '.HadoopJarStep', hadoop_jar_step, HADOOP_JAR_STEP_KEYS)
+        if not isinstance(hadoop_jar_step.get('Args', []), list) or not all(isinstance(arg, string_types) for arg in hadoop_jar_step.get('Args', [])):
+            errors.append(path + ': HadoopJarStep.Args must be a list of strings')
+
+def set_action_on_failure(steps, params):
+    return [dict(step, ActionOnFailure=step.get('ActionOnFailure') or params.get('action_on_failure')) for step in steps]
+
+def load_steps(params):
+    # Steps without ActionOnFailure get action_on_failure. Raises EmrOperationError with every problem found.
+    steps = load_json_file(params.get('steps'), 'steps')
+    errors = []
+    check_steps(errors, steps)
+    if len(errors) > 0:
+        raise EmrOperationError('Invalid steps: ' + '; '.join(errors), dict(errors=errors))
+    return set_action_on_failure(steps, params)
+
+def get_release_version(release_label):
+    return tuple(int(part) for part in release_label[len('emr-'):].split('.'))
+
+def load_create_specs(params):
+    # Loads the spec files of create and checks them against the run_job_flow request shape without calling AWS.
+    # Raises EmrOperationError with every problem found.
+    specs = dict(instances=[], configurations=[], bootstrap_actions=[], steps=[], warnings=[])
+    for param_name in ('instances', 'configurations', 'bootstrap_actions', 'steps'):
+        if params.get(param_name) not in ('', None):
+            specs[param_name] = load_json_file(params.get(param_name), param_name)
+
+    errors = []
+    if not isinstance(specs['instances'], list) or len(specs['instances']) == 0:
+        errors.append('instances: must be a non-empty list')
+    elif params.get('enable_fleet'):
+        check_instance_fleets(errors, specs['instances'])
+    else:
+        check_instance_groups(errors, specs['instances'])
+    check_configurations(errors, 'configurations', specs['configurations'])
+    check_bootstrap_actions(errors, specs['bootstrap_actions'])
+    if params.get('steps') not in ('', None):
+        check_steps(errors, specs['steps'])
+
+    if params.get('enable_fleet') and not params.get('ec2_subnets'):
+        errors.append('ec2_subnets is required to create a cluster with instance fleets')
+    if not params.get('enable_fleet') and params.get('ec2_subnet') in ('', None):
+        errors.append('ec2_subnet is required to create a cluster with instance groups, ec2_subnets is used with enable_fleet only')
+    if not RELEASE_LABEL_PATTERN.match(params.get('release_label') or ''):
+        errors.append('release_label must look like emr-5.8.0, got: ' + str(params.get('release_label')))
+    known_applications = [application.lower() for application in EMR_APPLICATIONS]
+    for application in params.get('applications') or []:
+        if not APPLICATION_NAME_PATTERN.match(str(application)):
+            errors.append('application names are letters, digits and dashes, got: ' + str(application))
+        elif str(application).lower() not in known_applications:
+            specs['warnings'].append('Application ' + str(application) + ' is not known to aws_emr, it is passed to EMR as is')
+    idle_timeout = params.get('idle_timeout')
+    if idle_timeout is not None:
+        if idle_timeout < IDLE_TIMEOUT_RANGE[0] or idle_timeout > IDLE_TIMEOUT_RANGE[1]:
+            errors.append('idle_timeout must be between %d and %d seconds, got: %d' % (IDLE_TIMEOUT_RANGE + (idle_timeout,)))
+        if RELEASE_LABEL_PATTERN.match(params.get('release_label') or ''):
+            release_version = get_release_version(params.get('release_label'))
+            if release_version < (5, 30, 0) or (6, 0, 0) <= release_version < (6, 1, 0):
+                errors.append('idle_timeout needs release emr-5.30.0 or later (emr-6.1.0 or later on 6.x), got: ' + params.get('release_label'))
+
+    if len(errors) > 0:
+        raise EmrOperationError('Invalid create request: ' + '; '.join(errors), dict(errors=errors))
+    specs['steps'] = set_action_on_failure(specs['steps'], params)
+    return specs
+
+def build_run_job_flow_args(params, specs):
+    instance_config = {}
+    if params.get('enable_fleet'):
+        instance_config['InstanceFleets'] = specs['instances']
+        instance_config['Ec2SubnetIds'] = params.get('ec2_subnets')
+    else:
+        instance_config['InstanceGroups'] = specs['instances']
+        instance_config['Ec2SubnetId'] = params.get('ec2_subnet')
+    instance_config['Ec2KeyName'] = params.get('ec2_key_file_name')
+    instance_config['ServiceAccessSecurityGroup'] = params.get('emr_service_security_group')
+    instance_config['EmrManagedMasterSecurityGroup'] = params.get('emr_master_security_group')
+    instance_config['EmrManagedSlaveSecurityGroup'] = params.get('emr_slave_security_group')
+    instance_config['KeepJobFlowAliveWhenNoSteps'] = params.get('key_alive_when_no_steps')
+    instance_config['TerminationProtected'] = params.get('termination_protection')
+
+    run_job_flow_args = dict(
+        Applications=convert_application(params.get('applications')),
+        Name=params.get('name'),
+        LogUri=params.get('log_url'),
+        ReleaseLabel=params.get('release_label'),
+        ServiceRole=params.get('service_role'),
+        JobFlowRole=params.get('ec2_service_role'),
+        BootstrapActions=specs['bootstrap_actions'],
+        Configurations=specs['configurations'],
+        ScaleDownBehavior=params.get('scale_down_behavior'),
+        Instances=instance_config,
+        VisibleToAllUsers=True
+    )
+    if not params.get('enable_fleet'):
+        run_job_flow_args['AutoScalingRole'] = params.get('auto_scaling_role')
+    if len(specs['steps']) > 0:
+        run_job_flow_args['Steps'] = specs['steps'][:ADD_STEPS_BATCH_SIZE]
+    if params.get('idle_timeout') is not None:
+        run_job_flow_args['AutoTerminationPolicy'] = dict(IdleTimeout=params.get('idle_timeout'))
+    return run_job_flow_args
+
+def get_create_fingerprint(run_job_flow_args, steps):
+    # sha1 of the whole run_job_flow request with all steps, applications compared as a set. Of the tags only the pool
+    # and lease tags count, so a cluster created for a lease is never found by another acquire of the pool.
+    request = dict(run_job_flow_args, Steps=steps)
+    lease_tags = [tag for tag in request.pop('Tags', None) or [] if tag.get('Key') in (POOL_TAG, LEASE_TAG)]
+    if len(lease_tags) > 0:
+        request['Tags'] = lease_tags
+    request['Applications'] = sorted(application.get('Name').lower() for application in run_job_flow_args.get('Applications'))
+    return hashlib.sha1(json.dumps(request, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def get_tag_value(cluster, key):
+    for tag in cluster.get('Tags', []):
+        if tag.get('Key') == key:
+            return tag.get('Value')
+    return None
+
+def find_cluster_by_fingerprint(emr_client, cluster_name, fingerprint, created_after=None):
+    # list_clusters has no tags, so the active clusters of the name are described until one has the fingerprint
+    for cluster_summary in list_active_clusters_by_name(emr_client, cluster_name):
+        created = cluster_summary.get('Status', {}).get('Timeline', {}).get('CreationDateTime')
+        if created_after is not None and created is not None and to_epoch(created) < created_after:
+            continue
+        cluster = describle_cluster(emr_client, cluster_summary.get('Id'))
+        if get_tag_value(cluster, FINGERPRINT_TAG) == fingerprint:
+            return cluster
+    return None
+
+def has_auto_termination(emr_client):
+    return 'AutoTerminationPolicy' in emr_client.meta.service_model.operation_model('RunJobFlow').input_shape.members
+
+def run_job_flow(emr_client, run_job_flow_args, fingerprint):
+    # run_job_flow takes no client token. After a server or connection error the cluster may have been created all
+    # the same, so the request is only sent again when no cluster created since the first attempt has the fingerprint.
+    start = time()
+    attempt = 0
+    while True:
+        try:
+            return call_emr_api(emr_client.run_job_flow, idempotent=False, **run_job_flow_args).get('JobFlowId')
+        except (ClientError, BotoCoreError) as err:
+            # Validation and other client side errors are raised before anything is sent
+            if not (is_connection_error(err) or isinstance(err, ClientError) and is_server_error(err)):
+                raise
+            cluster = find_cluster_by_fingerprint(emr_client, run_job_flow_args.get('Name'), fingerprint, start - SNAPSHOT_CLOCK_SKEW)
+            if cluster is not None:
+                return cluster.get('Id')
+            delay = get_backoff_delay(attempt)
+            if time() - start + delay > RETRY_DEADLINE:
+                raise
+            sleep(delay)
+            attempt += 1
+
+def create_cluster(emr_client, params):
+    # Every cluster is tagged with the fingerprint of its request. With reuse_cluster an active cluster of the same
+    # name and fingerprint is returned instead of creating another one, e.g. when a play is run again after a failure.
+    specs = load_create_specs(params)
+    step_list = specs['steps']
+    run_job_flow_args = build_run_job_flow_args(params, specs)
+    if 'AutoTerminationPolicy' in run_job_flow_args and not has_auto_termination(emr_client):
+        raise EmrOperationError('idle_timeout needs botocore 1.21.31 or later, botocore ' + botocore.__version__ + ' is installed')
+    run_job_flow_args['Tags'] = convert_tag(params.get('tags'))
+    fingerprint = get_create_fingerprint(run_job_flow_args, step_list)
+    run_job_flow_args['Tags'].append(dict(Key=FINGERPRINT_TAG, Value=fingerprint))
+
+    cluster = None
+    if params.get('reuse_cluster'):
+        cluster = find_cluster_by_fingerprint(emr_client, params.get('name'), fingerprint)
+    if cluster is None:
+        try:
+            cluster_id = run_job_flow(emr_client, run_job_flow_args, fingerprint)
+        except (ClientError, BotoCoreError) as err:
+            raise EmrOperationError('Failed to create cluster ' + params.get('name') + ': ' + to_native(err), dict(fingerprint=fingerprint))
+        result = dict(changed=True, id=cluster_id, reused=False, fingerprint=fingerprint)
+    else:
+        cluster_id = cluster.get('Id')
+        result = dict(changed=False, id=cluster_id, reused=True, fingerprint=fingerprint)
+    if len(specs['warnings']) > 0:
+        result['warnings'] = specs['warnings']
+
+    step_ids = []
+    if len(step_list) > 0:
+        # run_job_flow does not return step ids. Its steps are the oldest ones of the cluster, listed newest first.
+        step_ids = [step.get('Id') for step in reversed(list(iter_steps(emr_client, cluster_id)))][:len(step_list)]
+        if cluster is None:
+            step_ids.extend(add_job_flow_steps(emr_client, cluster_id, step_list[ADD_STEPS_BATCH_SIZE:]))
+        result['step_ids'] = step_ids
+
+    if params.get('wait'):
+        started = time()
+        if len(step_ids) > 0:
+            wait_result = wait_for_steps(emr_client, cluster_id, step_ids, params.get('fail_fast'), params.get('wait_timeout'))
+            check_steps_wait_result(emr_client, cluster_id, step_ids, result, wait_result, params.get('log_url'), 'steps_wait')
+        # A transient cluster terminates once its steps are done
+        default_wait_states = CLUSTER_READY_STATES
+        if len(step_ids) > 0 and not params.get('key_alive_when_no_steps'):
+            default_wait_states = CLUSTER_TERMINAL_STATES
+        wait_timeout = max(0, params.get('wait_timeout') - (time() - started))
+        check_wait_result(result, wait_for_cluster_state(emr_client, cluster_id, params.get('wait_states') or default_wait_states, wait_timeout))
+    return result
+
+# A warm pool is the set of active clusters named name with the aws_emr:pool tag. A cluster is leased while it has the
+# aws_emr:lease tag and idle since aws_emr:released_at (or its creation) otherwise.
+def iter_pool_clusters(emr_client, pool_name):
+    for cluster_summary in list_active_clusters_by_name(emr_client, pool_name):
+        cluster = describle_cluster(emr_client, cluster_summary.get('Id'))
+        if get_tag_value(cluster, POOL_TAG) == pool_name:
+            yield cluster
+
+def get_idle_seconds(cluster, now):
+    if get_tag_value(cluster, LEASE_TAG) is not None:
+        return None
+    idle_since = get_tag_value(cluster, RELEASED_AT_TAG)
+    if idle_since is None:
+        idle_since = to_epoch(cluster.get('Status').get('Timeline').get('CreationDateTime'))
+    return now - float(idle_since)
+
+def is_pool_cluster_compatible(cluster, params):
+    cluster_applications = set(application.get('Name').lower() for application in cluster.get('Applications', []))
+    requested_applications = set(application.lower() for application in params.get('applications') or [])
+    return cluster.get('ReleaseLabel') == params.get('release_label') and requested_applications <= cluster_applications
+
+def get_running_capacity(emr_client, cluster):
+    is_fleet = is_instance_fleet_enalbed(cluster)
+    return sum(
+        get_provisioned_capacity(instance_collection, is_fleet)
+        for instance_collection in list_instance_collections(emr_client, cluster.get('Id'), is_fleet)
+        if get_instance_collection_type(instance_collection) in ('CORE', 'TASK')
+    )
+
+def lease_cluster(emr_client, cluster_id, lease_id):
+    # Tags have no compare-and-set. The cluster is read again right before the lease is written, so only acquires
+    # between that read and the write race. Of those the last tag write wins, so the lease is read back after a pause
+    # and given up when another one overwrote it.
+    cluster = describle_cluster(emr_client, cluster_id)
+    if get_tag_value(cluster, LEASE_TAG) is not None or get_cluster_state(cluster) != 'WAITING':
+        return False
+    call_emr_api(emr_client.add_tags, ResourceId=cluster_id, Tags=[
+        dict(Key=LEASE_TAG, Value=lease_id),
+        dict(Key=LEASED_AT_TAG, Value=str(int(time())))
+    ])
+    sleep(POOL_LEASE_SETTLE)
+    return get_tag_value(describle_cluster(emr_client, cluster_id), LEASE_TAG) == lease_id
+
+def expire_pool_clusters(emr_client, expired_ids):
+    # Expired clusters are never leased, so they can be terminated without racing an acquire
+    if len(expired_ids) == 0:
+        return []
+    terminate_results = terminate_emr_clusters(emr_client, expired_ids)
+    return [cluster_id for cluster_id in expired_ids if not terminate_results[cluster_id].get('failed')]
+
+def acquire_pool_cluster(emr_client, params):
+    pool_name = params.get('name')
+    lease_id = params.get('lease_id') or hashlib.sha1(os.urandom(16)).hexdigest()[:16]
+    now = time()
+    expired_ids = []
+    cluster_id = None
+    for cluster in iter_pool_clusters(emr_client, pool_name):
+        idle_seconds = get_idle_seconds(cluster, now)
+        if idle_seconds is None or get_cluster_state(cluster) != 'WAITING':
+            continue
+        if idle_seconds > params.get('pool_idle_ttl'):
+            expired_ids.append(cluster.get('Id'))
+            continue
+        if not is_pool_cluster_compatible(cluster, params):
+            continue
+        if params.get('min_capacity') > 0 and get_running_capacity(emr_client, cluster) < params.get('min_capacity'):
+            continue
+        if lease_cluster(emr_client, cluster.get('Id'), lease_id):
+            cluster_id = cluster.get('Id')
+            break
+    result = dict(changed=True, lease_id=lease_id, terminated_ids=expire_pool_clusters(emr_client, expired_ids))
+    if cluster_id is not None:
+        result.update(id=cluster_id, created=False)
+        return result
+
+    # Nothing to lease: a new pool cluster is created already leased, without steps and kept alive
+    pool_tags = [{POOL_TAG: pool_name}, {LEASE_TAG: lease_id}, {LEASED_AT_TAG: str(int(now))}]
+    create_params = dict(params, tags=(params.get('tags') or []) + pool_tags, steps=None, key_alive_when_no_steps=True, reuse_cluster=False)
+    result.update(create_cluster(emr_client, create_params), created=True)
+    return result
+
+def release_pool_cluster(emr_client, params):
+    cluster_id = params.get('id')
+    cluster = describle_cluster(emr_client, cluster_id)
+    pool_name = get_tag_value(cluster, POOL_TAG)
+    if pool_name is None:
+        raise EmrOperationError('Cluster ' + cluster_id + ' is not a pool cluster', dict(id=cluster_id))
+    leased_by = get_tag_value(cluster, LEASE_TAG)
+    if params.get('lease_id') not in ('', None) and leased_by not in (None, params.get('lease_id')):
+        raise EmrOperationError('Cluster ' + cluster_id + ' is leased by ' + leased_by, dict(id=cluster_id))
+
+    result = dict(changed=True, id=cluster_id, terminated_ids=[])
+    if params.get('pool_idle_ttl') <= 0:
+        result['terminated_ids'] = expire_pool_clusters(emr_client, [cluster_id])
+    else:
+        # released_at is set before the lease is removed, so the cluster never looks idle since its creation
+        call_emr_api(emr_client.add_tags, ResourceId=cluster_id, Tags=[dict(Key=RELEASED_AT_TAG, Value=str(int(time())))])
+        call_emr_api(emr_client.remove_tags, ResourceId=cluster_id, TagKeys=[LEASE_TAG, LEASED_AT_TAG])
+
+    now = time()
+    expired_ids = []
+    for pool_cluster in iter_pool_clusters(emr_client, pool_name):
+        idle_seconds = get_idle_seconds(pool_cluster, now)
+        if pool_cluster.get('Id') != cluster_id and idle_seconds is not None and idle_seconds > params.get('pool_idle_ttl'):
+            expired_ids.append(pool_cluster.get('Id'))
+    result['terminated_ids'].extend(expire_pool_clusters(emr_client, expired_ids))
+    return result
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_bytes, to_native
+from ansible.module_utils.six import string_types
+
+# define the available arguments/parameters that a user can pass to
+# the module
+MODULE_ARGS = dict(
+    aws_access_key = dict(type='str', required=True, no_log=True),
+    aws_secret_key = dict(type='str', required=True, no_log=True),
+    security_token = dict(type='str', required=False, no_log=True),
+    region = dict(choices=['us-east-1', 'us-west-2', 'us-west-1', 'eu-west-1', 'eu-central-1', 'ap-southeast-1', 'ap-northeast-1', 'ap-southeast-2', 'ap-northeast-2', 'ap-south-1', 'sa-east-1'], required=True),
+    mode = dict(choices=['create', 'describe', 'get-cluster-id', 'get-cluster-ids', 'terminate', 'terminate-all', 'check-status', 'get-master-ip', 'get-core-ips', 'get-slave-ips', 'get-collection-id-by-name', 'add-instance-group', 'scale-out', 'scale-in', 'active-instances-by-collection', 'wait', 'cluster-facts', 'capacity', 'put-auto-scaling-policy', 'remove-auto-scaling-policy', 'put-managed-scaling-policy', 'remove-managed-scaling-policy', 'describe-scaling-policies', 'resize-instance-groups', 'add-steps', 'wait-steps', 'pool-acquire', 'pool-release'], required=True),
+    name = dict(type='str'),
+    id = dict(type='str'),
+    names = dict(type='list'),
+    ids = dict(type='list'),
+    batch_concurrency = dict(type='int', default=8),
+    snapshot_path = dict(type='path'),
+    snapshot_max_age = dict(type='int', default=300),
+    auto_scaling_role = dict(type='str', default='EMR_AutoScaling_DefaultRole'),
+    applications = dict(type='list', default=['Hadoop', 'Spark']),
+    log_url = dict(type='str'),
+    release_label = dict(type='str', default='emr-5.8.0'),
+    service_role = dict(type='str', default='iam-role-emr'),
+    ec2_service_role = dict(type='str', default='iam-role-emr-ec2'),
+    scale_down_behavior = dict(type='str', default='TERMINATE_AT_TASK_COMPLETION'),
+    tags = dict(type='list'),
+    ec2_key_file_name = dict(type='str', default=''),
+    emr_master_security_group = dict(type='str'),
+    emr_slave_security_group = dict(type='str'),
+    emr_service_security_group = dict(type='str'),
+    key_alive_when_no_steps = dict(type='bool', default=True),
+    idle_timeout = dict(type='int'),
+    reuse_cluster = dict(type='bool', default=True),
+    lease_id = dict(type='str'),
+    pool_idle_ttl = dict(type='int', default=3600),
+    min_capacity = dict(type='int', default=0),
+    termination_protection = dict(type='bool', default=True),
+    ec2_subnet = dict(type='str'),
+    ec2_subnets = dict(type='list'),
+    bootstrap_actions = dict(type='path'),
+    configurations = dict(type='path'),
+    instances = dict(type='path'),
+    instance_collection_name = dict(type='str'),
+    instance_group_id = dict(type='str'),
+    scale_out_instance_type = dict(type='str', default='m4.large'),
+    scale_out_instance_count = dict(type='int', default=1),
+    scale_in_instance_count = dict(type='int'),
+    instance_fleet_type = dict(choices=['TASK', 'CORE'], default='TASK'),
+    scale_out_spot_count = dict(type='int'),
+    scale_in_spot_count = dict(type='int'),
+    on_demand_ratio = dict(type='float'),
+    scale_unit = dict(choices=['units', 'instances'], default='units'),
+    enable_fleet = dict(type='bool', default=False),
+    capacity = dict(type='list'),
+    instance_groups = dict(type='dict'),
+    steps = dict(type='path'),
+    action_on_failure = dict(choices=STEP_ACTIONS_ON_FAILURE, default='CONTINUE'),
+    step_ids = dict(type='list'),
+    fail_fast = dict(type='bool', default=False),
+    auto_scaling_policy = dict(type='path'),
+    managed_scaling_policy = dict(type='path'),
+    wait = dict(type='bool', default=False),
+    wait_states = dict(type='list'),
+    wait_timeout = dict(type='int', default=1800),
+    step_limit = dict(type='int', default=10),
+    api_stats = dict(type='bool', default=False),
+    trace_path = dict(type='path')
+)
+
+def validate_params(module):
+    # Everything that can be checked without AWS is checked before botocore is imported and the client is created
+    params = module.params
+    mode = params.get('mode')
+    batch = mode in CLUSTER_OPERATIONS and (params.get('ids') or params.get('names'))
+
+    if mode in ('create', 'pool-acquire'):
+        for required_param in ('name', 'log_url', 'ec2_key_file_name', 'emr_master_security_group', 'emr_slave_security_group', 'emr_service_security_group', 'instances'):
+            if params.get(required_param) in ('', None):
+                module.fail_json(msg=required_param + ' is required to create a cluster')
+        try:
+            load_create_specs(params)
+        except EmrOperationError as err:
+            module.fail_json(msg=err.msg, **err.result)
+
+    if mode in ('get-cluster-id', 'get-cluster-ids') and params.get('name') in ('', None):
+        module.exit_json(msg="Cluster Name is needed to get ID of active clusters.")
+
+    if mode == 'terminate-all' and params.get('name') in ('', None):
+        module.fail_json(msg='Cluster name is required to terminate')
+
+    if (mode in CLUSTER_OPERATIONS and not batch) or mode in ('get-collection-id-by-name', 'add-instance-group', 'active-instances-by-collection', 'wait'):
+        if params.get('id') in ('', None) and params.get('name') in ('', None):
+            module.fail_json(msg='cluster name or cluster id is required for mode: ' + mode)
+
+    if mode == 'get-collection-id-by-name' and params.get('instance_collection_name') in ('', None):
+        module.fail_json(msg='instance_collection_name is required to get instance collection(group/fleet) id')
+
+    if mode == 'capacity':
+        if not params.get('capacity'):
+            module.fail_json(msg='capacity is required for mode: capacity')
+        for capacity_spec in params.get('capacity'):
+            if not isinstance(capacity_spec, dict) or (capacity_spec.get('name') in ('', None) and capacity_spec.get('type') in ('', None)):
+                module.fail_json(msg='Every capacity entry needs the name or type of an instance group/fleet')
+            for unit_name in ('on_demand', 'spot'):
+                if capacity_spec.get(unit_name) is not None and not str(capacity_spec.get(unit_name)).isdigit():
+                    module.fail_json(msg='capacity ' + unit_name + ' must be a non-negative integer, got: ' + str(capacity_spec.get(unit_name)))
+
+    if mode in ('put-auto-scaling-policy', 'remove-auto-scaling-policy') and params.get('instance_group_id') in ('', None) and params.get('instance_collection_name') in ('', None):
+        module.fail_json(msg='instance_collection_name or instance_group_id is required for mode: ' + mode)
+
+    if mode == 'put-auto-scaling-policy' and params.get('auto_scaling_policy') in ('', None):
+        module.fail_json(msg='auto_scaling_policy is required for mode: ' + mode)
+
+    if mode == 'put-managed-scaling-policy' and params.get('managed_scaling_policy') in ('', None):
+        module.fail_json(msg='managed_scaling_policy is required for mode: ' + mode)
+
+    if mode == 'resize-instance-groups':
+        if not params.get('instance_groups'):
+            module.fail_json(msg='instance_groups is required for mode: resize-instance-groups')
+        for instance_group_name, value in params.get('instance_groups').items():
+            instance_count = get_instance_group_spec(value).get('instance_count')
+            if not str(instance_count).isdigit():
+                module.fail_json(msg='instance_groups ' + instance_group_name + ' needs a non-negative instance count, got: ' + str(instance_count))
+
+    if mode == 'add-steps':
+        if params.get('steps') in ('', None):
+            module.fail_json(msg='steps is required for mode: add-steps')
+        try:
+            load_steps(params)
+        except EmrOperationError as err:
+            module.fail_json(msg=err.msg, **err.result)
 
-def run_module():
-    # define the available arguments/parameters that a user can pass to
-    # the module
-    module_args = dict(
-        aws_access_key = dict(type='str', required=True, no_log=True),
-        aws_secret_key = dict(type='str', required=True, no_log=True),
-        security_token = dict(type='str', required=False, no_log=True),
-        region = dict(choices=['us-east-1', 'us-west-2', 'us-west-1', 'eu-west-1', 'eu-central-1', 'ap-southeast-1', 'ap-northeast-1', 'ap-southeast-2', 'ap-northeast-2', 'ap-south-1', 'sa-east-1'], required=True),
-        mode = dict(choices=['create', 'describe', 'get-cluster-id', 'get-cluster-ids', 'terminate', 'terminate-all', 'check-status', 'get-master-ip', 'get-core-ips', 'get-slave-ips', 'get-collection-id-by-name', 'add-instance-group', 'scale-out', 'scale-in', 'active-instances-by-collection'], required=True),
-        name = dict(type='str'),
-        id = dict(type='str'),
-        auto_scaling_role = dict(type='str', default='EMR_AutoScaling_DefaultRole'),
-        applications = dict(type='list', default=['Hadoop', 'Spark']),
-        log_url = dict(type='str'),
-        release_label = dict(type='str', default='emr-5.8.0'),
-        service_role = dict(type='str', default='iam-role-emr'),
-        ec2_service_role = dict(type='str', default='iam-role-emr-ec2'),
-        scale_down_behavior = dict(type='str', default='TERMINATE_AT_TASK_COMPLETION'),
-        tags = dict(type='list'),
-        ec2_key_file_name = dict(type='str', default=''),
-        emr_master_security_group = dict(type='str'),
-        emr_slave_security_group = dict(type='str'),
-        emr_service_security_group = dict(type='str'),
-        key_alive_when_no_steps = dict(type='bool', default=True),
-        termination_protection = dict(type='bool', default=True),
-        ec2_subnet = dict(type='str'),
-        ec2_subnets = dict(type='list'),
-        bootstrap_actions = dict(type='path'),
-        configurations = dict(type='path'),
-        instances = dict(type='path'),
-        instance_collection_name = dict(type='str'),
-        instance_group_id = dict(type='str'),
-        scale_out_instance_type = dict(type='str', default='m4.large'),
-        scale_out_instance_count = dict(type='int', default=1),
-        scale_in_instance_count = dict(type='int'),
-        enable_fleet = dict(type='bool', default=False)
-    )
+    if mode == 'pool-release' and params.get('id') in ('', None):
+        module.fail_json(msg='id of the leased cluster is required for mode: pool-release')
+
+    if mode == 'wait-steps' and not params.get('step_ids'):
+        module.fail_json(msg='step_ids is required for mode: wait-steps')
+
+    on_demand_ratio = params.get('on_demand_ratio')
+    if mode in ('scale-out', 'scale-in') and on_demand_ratio is not None:
+        if on_demand_ratio < 0 or on_demand_ratio > 1:
+            module.fail_json(msg='on_demand_ratio must be between 0 and 1')
+        if params.get('scale_out_spot_count') is not None or params.get('scale_in_spot_count') is not None:
+            module.fail_json(msg='on_demand_ratio cannot be combined with scale_out_spot_count or scale_in_spot_count')
+        if mode == 'scale-in' and params.get('scale_in_instance_count') is None:
+            module.fail_json(msg='scale_in_instance_count is required to scale in with on_demand_ratio')
 
+    if not HAS_FUTURES and (batch or mode == 'cluster-facts' or (mode == 'terminate-all' and params.get('wait'))):
+        module.fail_json(msg='futures is required for mode ' + mode + ' with Python 2')
+
+def run_module():
     result = dict(
         changed=False
     )
 
+    parse_started = time()
     module = AnsibleModule(
-        argument_spec=module_args,
+        argument_spec=MODULE_ARGS,
         supports_check_mode=True
     )
 
     if module.check_mode:
         return result
 
-    if not HAS_BOTO3:
-        module.fail_json(msg='boto3 and botocore required for this module')
+    # exit_json/fail_json leave through SystemExit, so the trace is written in finally
+    start_tracing(module, parse_started, time())
+    try:
+        with trace_span('validate parameters'):
+            validate_params(module)
+
+        with trace_span('import botocore'):
+            has_botocore = import_botocore()
+        if not has_botocore:
+            module.fail_json(msg='botocore required for this module')
+
+        with trace_span('create client'):
+            emr_client = get_client(module.params.get('region'), module.params.get('aws_access_key'), module.params.get('aws_secret_key'), module.params.get('security_token'))
+        if tracer is not None:
+            tracer.attach(emr_client)
+
+        with trace_span('mode ' + module.params.get('mode')):
+            run_mode(module, emr_client)
+    finally:
+        stop_tracing()
+
+def report_api_stats(module, emr_client):
+    # Every exit of the module run carries the api_stats block
+    api_stats = ApiStats()
+    api_stats.attach(emr_client)
+    exit_json = module.exit_json
+    fail_json = module.fail_json
+
+    def exit_with_api_stats(**kwargs):
+        api_stats.detach(emr_client)
+        kwargs['api_stats'] = api_stats.summary()
+        exit_json(**kwargs)
+
+    def fail_with_api_stats(msg, **kwargs):
+        api_stats.detach(emr_client)
+        kwargs['api_stats'] = api_stats.summary()
+        fail_json(msg=msg, **kwargs)
+
+    module.exit_json = exit_with_api_stats
+    module.fail_json = fail_with_api_stats
+
+def run_mode(module, emr_client):
+    # Everything after client creation; the aws_emr action plugin calls it in-process with a cached client
+    if module.params.get('api_stats'):
+        report_api_stats(module, emr_client)
+
+    result = dict(
+        changed=False
+    )
 
     #Prepare params
-    aws_access_key = module.params.get('aws_access_key')
-    aws_secret_key = module.params.get('aws_secret_key')
-    security_token = module.params.get('security_token')
-    region = module.params.get('region')
     mode = module.params.get('mode')
     name = module.params.get('name')
     id = module.params.get('id')
-    auto_scaling_role = module.params.get('auto_scaling_role')
-    applications = module.params.get('applications')
-    log_url = module.params.get('log_url')
-    release_label = module.params.get('release_label')
-    service_role = module.params.get('service_role')
-    ec2_service_role = module.params.get('ec2_service_role')
-    scale_down_behavior = module.params.get('scale_down_behavior')
-    tags = module.params.get('tags')
-    ec2_key_file_name = module.params.get('ec2_key_file_name')
-    emr_master_security_group = module.params.get('emr_master_security_group')
-    emr_slave_security_group = module.params.get('emr_slave_security_group')
-    emr_service_security_group = module.params.get('emr_service_security_group')
-    key_alive_when_no_steps = module.params.get('key_alive_when_no_steps')
-    termination_protection = module.params.get('termination_protection')
-    ec2_subnet = module.params.get('ec2_subnet')
-    ec2_subnets = module.params.get('ec2_subnets')
-    bootstrap_actions = module.params.get('bootstrap_actions')
-    configurations = module.params.get('configurations')
-    instances = module.params.get('instances')
+    names = module.params.get('names')
+    ids = module.params.get('ids')
+    batch_concurrency = module.params.get('batch_concurrency')
+    snapshot_path = module.params.get('snapshot_path')
+    snapshot_max_age = module.params.get('snapshot_max_age')
     instance_collection_name = module.params.get('instance_collection_name')
-    instance_group_id = module.params.get('instance_group_id')
     scale_out_instance_type = module.params.get('scale_out_instance_type')
     scale_out_instance_count = module.params.get('scale_out_instance_count')
-    scale_in_instance_count = module.params.get('scale_in_instance_count')
-    enable_fleet = module.params.get('enable_fleet')
+    wait = module.params.get('wait')
+    wait_states = module.params.get('wait_states')
+    wait_timeout = module.params.get('wait_timeout')
 
-    emr_client = get_client(region, aws_access_key, aws_secret_key, security_token)
+    snapshot = None
+    if snapshot_path not in ('', None) and mode in SNAPSHOT_MODES:
+        snapshot = ClusterSnapshot(snapshot_path, module.params.get('region'), get_access_key(emr_client, module.params), snapshot_max_age)
 
     if mode == 'create':
-        #Validation Check
-        if name in ('', None):
-            module.fail_json(msg='name is required to create a cluster')
-
-        if log_url in ('', None):
-            module.fail_json(msg='log_url is required to create a cluster')
-
-        if ec2_key_file_name in ('', None):
-            module.fail_json(msg='ec2_key_file_name is required to create a cluster')
-
-        if emr_master_security_group in ('', None):
-            module.fail_json(msg='emr_master_security_group is required to create a cluster')
-
-        if emr_slave_security_group in ('', None):
-            module.fail_json(msg='emr_slave_security_group is required to create a cluster')
-
-        if emr_service_security_group in ('', None):
-            module.fail_json(msg='emr_service_security_group is required to create a cluster')
-
-        if (ec2_subnet in ('', None)) and (ec2_subnets is None or ec2_subnets == []):
-            module.fail_json(msg='ec2_subnet or ec2_subnets is required to create a cluster')
-
-        if instances is ('', None):
-            module.fail_json(msg='instances is required to create a cluster')
-
-        application_list = convert_application(applications)
-
-        tag_list = convert_tag(tags)
-
-        emr_config = []
-        if configurations not in ('', None):
-            config_file_path = to_bytes(configurations, errors='surrogate_or_strict')
-            with open(config_file_path) as json_file:
-                emr_config = json.load(json_file)
-
-        bootstrap_list = []
-        if bootstrap_actions not in ('', None):
-            bootstrap_file_path = to_bytes(bootstrap_actions, errors='surrogate_or_strict')
-            with open(bootstrap_file_path) as boot_file:
-                bootstrap_list = json.load(boot_file)
+        try:
+            result.update(create_cluster(emr_client, module.params))
+        except EmrOperationError as err:
+            module.fail_json(msg=err.msg, **err.result)
 
-        instance_config = {}
-        instance_list = []
-        instance_file_path = to_bytes(instances, errors='surrogate_or_strict')
-        with open(instance_file_path) as instance_file:
-            instance_list = json.load(instance_file)
-        if enable_fleet:
-            instance_config['InstanceFleets'] = instance_list
-            instance_config['Ec2SubnetIds'] = ec2_subnets
-        else:
-            instance_config['InstanceGroups'] = instance_list
-            instance_config['Ec2SubnetId'] = ec2_subnet
-        instance_config['Ec2KeyName'] = ec2_key_file_name
-        instance_config['ServiceAccessSecurityGroup'] = emr_service_security_group
-        instance_config['EmrManagedMasterSecurityGroup'] = emr_master_security_group
-        instance_config['EmrManagedSlaveSecurityGroup'] = emr_slave_security_group
-        instance_config['KeepJobFlowAliveWhenNoSteps'] = key_alive_when_no_steps
-        instance_config['TerminationProtected'] = termination_protection
-
-        if enable_fleet:
-            cluster_id = emr_client.run_job_flow(
-                Applications=application_list,
-                Name=name,
-                LogUri=log_url,
-                ReleaseLabel=release_label,
-                ServiceRole=service_role,
-                JobFlowRole=ec2_service_role,
-                BootstrapActions=bootstrap_list,
-                Configurations=emr_config,
-                ScaleDownBehavior=scale_down_behavior,
-                Instances=instance_config,
-                VisibleToAllUsers=True,
-                Tags=tag_list
-            ).get("JobFlowId")
+    if mode in ('pool-acquire', 'pool-release'):
+        try:
+            if mode == 'pool-acquire':
+                result.update(acquire_pool_cluster(emr_client, module.params))
+            else:
+                result.update(release_pool_cluster(emr_client, module.params))
+        except EmrOperationError as err:
+            module.fail_json(msg=err.msg, **err.result)
+
+    if mode in CLUSTER_OPERATIONS:
+        operation = CLUSTER_OPERATIONS[mode]
+        if ids or names:
+            cluster_ids = list(ids or [])
+            if names:
+                name_to_id = get_cluster_ids_by_names(emr_client, names)
+                result['missing_names'] = [cluster_name for cluster_name in names if cluster_name not in name_to_id]
+                for cluster_name in names:
+                    if cluster_name in name_to_id and name_to_id[cluster_name] not in cluster_ids:
+                        cluster_ids.append(name_to_id[cluster_name])
+            result['clusters'] = run_batch_operation(emr_client, operation, cluster_ids, module.params, batch_concurrency)
+            result['failed_ids'] = [cluster_id for cluster_id in cluster_ids if result['clusters'][cluster_id].get('failed')]
+            result['changed'] = any(cluster_result.get('changed') for cluster_result in result['clusters'].values())
         else:
-            cluster_id = emr_client.run_job_flow(
-                AutoScalingRole=auto_scaling_role,
-                Applications=application_list,
-                Name=name,
-                LogUri=log_url,
-                ReleaseLabel=release_label,
-                ServiceRole=service_role,
-                JobFlowRole=ec2_service_role,
-                BootstrapActions=bootstrap_list,
-                Configurations=emr_config,
-                ScaleDownBehavior=scale_down_behavior,
-                Instances=instance_config,
-                VisibleToAllUsers=True,
-                Tags=tag_list
-            ).get("JobFlowId")
-
-        result['changed'] = True
-        result['id'] = cluster_id
-
-    if mode == 'describe':
-        cluster = describle_cluster(emr_client, id)
-        if cluster is not None:
-            result['cluster'] = cluster
-            result['changed'] = True
+            if id in ('', None):
+                id = resolve_cluster_id(emr_client, name, snapshot)
+                if id is None:
+                    module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
+            try:
+                if snapshot is not None:
+                    result.update(build_ip_result(mode, snapshot.get_cluster_details(emr_client, id).get('ips')))
+                else:
+                    result.update(operation(emr_client, id, module.params))
+            except EmrOperationError as err:
+                result.update(err.result)
+                if err.failed:
+                    module.fail_json(msg=err.msg, **result)
+                module.exit_json(msg=err.msg, **result)
 
     if mode == 'get-cluster-id':
-        if name in ('', None):
-            module.exit_json(msg="Cluster Name is needed to get ID of active clusters.")
-        id = get_cluster_id(emr_client, name)
+        id = resolve_cluster_id(emr_client, name, snapshot)
         result['changed'] = True
         result['id'] = id
 
     if mode == 'get-cluster-ids':
-        if name in ('', None):
-            module.exit_json(msg="Cluster Name is needed to get ID of active clusters.")
         id_list = get_cluster_ids(emr_client, name)
         if len(id_list) == 0:
             module.exit_json(msg='Not active cluster by name: ' + name + ' was found')
         result['changed'] = True
         result['id'] = id_list
 
-    if mode == 'terminate':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='Cluster name or id is required to terminate')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-        result['response'] = terminate_emr(emr_client, id)
-        result['changed'] = True
-        result['cluster_id'] = id
-
     if mode == 'terminate-all':
-        if name in ('', None):
-            module.fail_json(msg='Cluster name is required to terminate')
         id_list = get_cluster_ids(emr_client, name)
-        for cluster_id in id_list:
-            terminate_emr(emr_client, cluster_id)
-        result['changed'] = True
+        result['clusters'] = terminate_emr_clusters(emr_client, id_list)
+        if wait:
+            submitted_ids = [cluster_id for cluster_id in id_list if not result['clusters'][cluster_id].get('failed')]
+            wait_results = run_batch_operation(emr_client, wait_for_termination_operation, submitted_ids, module.params, batch_concurrency)
+            for cluster_id in submitted_ids:
+                result['clusters'][cluster_id].update(wait_results[cluster_id])
+        result['failed_ids'] = [cluster_id for cluster_id in id_list if result['clusters'][cluster_id].get('failed')]
+        result['changed'] = any(cluster_result.get('changed') for cluster_result in result['clusters'].values())
         result['id'] = id_list
 
-    if mode == 'check-status':
-        cluster = describle_cluster(emr_client, id)
-        if cluster is not None:
-            result['changed'] = True
-            result['state'] = get_cluster_state(cluster)
-            result['state_changed_reason'] = get_cluster_state_change_reason(cluster)
-        else:
-            result['msg'] = "Cluster of given cluster ID was not found."
-
-    if mode == 'get-master-ip':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='name or id is required to get master ip')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-        if is_instance_fleet_enalbed(cluster):
-            master_instance_list = list_instance_by_fleet_type(emr_client, id, 'MASTER')
-        else:
-            master_instance_list = list_instance_by_group_type(emr_client, id, ['MASTER'])
-        if master_instance_list is not None:
-            private_ip_list = get_private_ip_address(master_instance_list)
-            if len(private_ip_list) > 0:
-                result['master_private_ip'] = private_ip_list[0]
-
-    if mode == 'get-core-ips':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='name or id is required to get core ips')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-        if is_instance_fleet_enalbed(cluster):
-            core_instance_list = list_instance_by_fleet_type(emr_client, id, 'CORE')
-        else:
-            core_instance_list = list_instance_by_group_type(emr_client, id, ['CORE'])
-        if core_instance_list is not None:
-            result['core_private_ips'] = get_private_ip_address(core_instance_list)
-
-    if mode == 'get-slave-ips':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='name or id is required to get task ips')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-        if is_instance_fleet_enalbed(cluster):
-            slave_instance_list = list_instance_by_fleet_type(emr_client, id, 'TASK') + list_instance_by_fleet_type(emr_client, id, 'CORE')
-        else:
-            slave_instance_list = list_instance_by_group_type(emr_client, id, ['CORE', 'TASK'])
-        if slave_instance_list is not None:
-            result['slave_private_ips'] = get_private_ip_address(slave_instance_list)
-
     if mode == 'get-collection-id-by-name':
         if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='name or id is required to get group id')
-            id = get_cluster_id(emr_client, name)
+            id = resolve_cluster_id(emr_client, name, snapshot)
             if id is None:
                 module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
 
-        if instance_collection_name in ('', None):
-            module.fail_json(msg='instance_collection_name is required to get instance collection(group/fleet) id')
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-        if is_instance_fleet_enalbed(cluster):
-            instance_collection_list = list_instance_fleets(emr_client, id)
+        if snapshot is not None:
+            instance_collection_list = snapshot.get_cluster_details(emr_client, id).get('collections')
         else:
-            instance_collection_list = list_instance_groups(emr_client, id)
+            cluster = describle_cluster(emr_client, id)
+            if cluster is None:
+                module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
+            if is_instance_fleet_enalbed(cluster):
+                instance_collection_list = list_instance_fleets(emr_client, id)
+            else:
+                instance_collection_list = list_instance_groups(emr_client, id)
+        instance_collection_id = None
         for instance_collection in instance_collection_list:
             if instance_collection.get('Name') == instance_collection_name:
                 instance_collection_id = instance_collection.get('Id')
-        if instance_group_id in ('', None):
+        if instance_collection_id in ('', None):
             module.exit_json(msg='No instance collection was found', **result)
         result['instance_collection_id'] = instance_collection_id
         result['changed'] = True
 
     if mode == 'add-instance-group':
         if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='name or id is required to add an instance group to scale out')
             id = get_cluster_id(emr_client, name)
             if id is None:
                 module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
         result['msg'] = add_scale_out_instance_group(emr_client, id, instance_collection_name, scale_out_instance_type, scale_out_instance_count)
         result['changed'] = True
 
-    if mode == 'scale-out':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='cluster name or cluster id is required to scale out')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-
-        if is_instance_fleet_enalbed(cluster):
-            # For instance fleet
-            instance_collection_list = list_instance_fleets(emr_client, id)
-            instance_collection_id = ''
-            for instance_collection in instance_collection_list:
-                if instance_collection.get('InstanceFleetType') == 'TASK':
-                    instance_collection_id = instance_collection.get('Id')
-                    target_on_demand_capacity = instance_collection.get('TargetOnDemandCapacity')
-                    target_spot_capacity = instance_collection.get('TargetSpotCapacity')
-            if instance_collection_id in ('', None):
-                module.exit_json(msg="Task Instance Fleet does not exists.")
-            result['target_instance_count'] = target_on_demand_capacity + scale_out_instance_count
-            result['response'] = resize_instance_fleet(emr_client, id, instance_collection_id, scale_out_instance_count + target_on_demand_capacity, target_spot_capacity)
-            result['operation'] = "Instance group exists. Resize"
-
-        else:
-            # For instance group
-            instance_collection_list = list_instance_groups(emr_client, id)
-            instance_collection_id = ''
-            for instance_collection in instance_collection_list:
-                if instance_collection.get('Name') == instance_collection_name:
-                    instance_collection_id = instance_collection.get('Id')
-            if instance_collection_id in ('', None):
-                result['response'] = add_scale_out_instance_group(emr_client, id, instance_collection_name, scale_out_instance_type, scale_out_instance_count)
-                result['operation'] = "Instance collection does not exists. Add new instance collection to scale out"
-            else:
-                result['response'] = resize_instance_group(emr_client, id, instance_collection_id, scale_out_instance_count)
-                result['operation'] = "Instance group exists. Resize"
-            result['changed'] = True
-
-    if mode == 'scale-in':
-        if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='cluster name or cluster id is required to scale in')
-            id = get_cluster_id(emr_client, name)
-            if id is None:
-                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
-
-        cluster = describle_cluster(emr_client, id)
-        if cluster is None:
-            module.exit_json(msg='No active EMR cluster was founded by Id: ' + id + '.' )
-
-        if is_instance_fleet_enalbed(cluster):
-            # For instance fleet
-            instance_collection_list = list_instance_fleets(emr_client, id)
-            instance_collection_id = ''
-            for instance_collection in instance_collection_list:
-                if instance_collection.get('InstanceFleetType') == 'TASK':
-                    instance_collection_id = instance_collection.get('Id')
-                    target_on_demand_capacity = instance_collection.get('TargetOnDemandCapacity')
-                    target_spot_capacity = instance_collection.get('TargetSpotCapacity')
-            if instance_collection_id in ('', None):
-                module.exit_json(msg="Task Instance Fleet does not exists.")
-            if scale_in_instance_count is None:
-                final_target = 0
-            else:
-                final_target = target_on_demand_capacity - scale_in_instance_count
-                if final_target < 0:
-                    final_target = 0
-            result['target_instance_count'] = final_target
-            result['response'] = resize_instance_fleet(emr_client, id, instance_collection_id, final_target, target_spot_capacity)
-            result['operation'] = "Instance group exists. Resize"
-
-        else:
-            #For instance group
-            instance_group_list = list_instance_groups(emr_client, id)
-            instance_group_id = ''
-            for instance_group in instance_group_list:
-                if instance_group.get('Name') == instance_collection_name:
-                    instance_group_id = instance_group.get('Id')
-            if instance_group_id in ('', None):
-                module.exit_json(msg='The instance group to scale in does not exist', **result)
-            result['response'] = resize_instance_group(emr_client, id, instance_group_id, 0)
-            result['operation'] = "Instance group exists. Resize to 0"
-            result['changed'] = True
-
     if mode == 'active-instances-by-collection':
         if id in ('', None):
-            if name in ('', None):
-                module.fail_json(msg='cluster name or cluster id is required to get active instances by collection id.')
             id = get_cluster_id(emr_client, name)
             if id is None:
                 module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
@@ -1180,6 +3314,16 @@ def run_module():
                     result['active_instance_count'] = instance_collection.get('RunningInstanceCount')
         result['changed'] = True
 
+    if mode == 'wait':
+        if id in ('', None):
+            id = get_cluster_id(emr_client, name)
+            if id is None:
+                module.fail_json(msg='No active EMR cluster was founded by name: ' + name + '.' )
+        wait_result = wait_for_cluster_state(emr_client, id, wait_states or CLUSTER_READY_STATES, wait_timeout)
+        result['cluster_id'] = id
+        result['state'] = wait_result['state']
+        report_wait_result(module, result, wait_result)
+
     module.exit_json(**result)
 
 def main():
@@ -0,0 +1,132 @@
+# Fixtures of the aws_emr tests. The module runs against FakeEmrBackend (emr/benchmarks/fake_emr.py) with waits,
+# backoff, pacing and the lease pause shortened, so the tests check results and API call counts without AWS.
+
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'lib'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+
+import aws_emr
+from fake_emr import FakeEmrBackend
+
+INSTANCE_GROUPS = [
+    dict(Name='Master', InstanceRole='MASTER', InstanceType='m4.large', InstanceCount=1, Market='ON_DEMAND'),
+    dict(Name='Core', InstanceRole='CORE', InstanceType='m4.large', InstanceCount=2, Market='ON_DEMAND'),
+    dict(Name='Task', InstanceRole='TASK', InstanceType='m4.large', InstanceCount=2, Market='ON_DEMAND')
+]
+
+AUTO_SCALING_POLICY = dict(
+    Constraints=dict(MinCapacity=2, MaxCapacity=20),
+    Rules=[dict(
+        Name='ScaleOut',
+        Action=dict(SimpleScalingPolicyConfiguration=dict(ScalingAdjustment=2, CoolDown=300)),
+        Trigger=dict(CloudWatchAlarmDefinition=dict(ComparisonOperator='LESS_THAN', MetricName='YARNMemoryAvailablePercentage', Period=300, Threshold=15))
+    )]
+)
+
+MANAGED_SCALING_POLICY = dict(ComputeLimits=dict(UnitType='Instances', MinimumCapacityUnits=2, MaximumCapacityUnits=40))
+
+STEPS = [
+    dict(Name='step-%d' % index, HadoopJarStep=dict(Jar='command-runner.jar', Args=['spark-submit', 's3://tests/step-%d.py' % index]))
+    for index in range(300)
+]
+
+# JSON files written for every test, {<name>} in the module arguments is replaced with the file path
+SPEC_FILES = dict(
+    instances=INSTANCE_GROUPS, auto_scaling_policy=AUTO_SCALING_POLICY, managed_scaling_policy=MANAGED_SCALING_POLICY, steps=STEPS, job_steps=STEPS[:5]
+)
+
+CREATE_ARGS = dict(
+    mode='create', name='EMR-TEST', log_url='s3://tests/logs', ec2_key_file_name='tests',
+    emr_master_security_group='sg-1', emr_slave_security_group='sg-2', emr_service_security_group='sg-3',
+    ec2_subnet='subnet-1', termination_protection=False
+)
+
+
+class ModuleExit(Exception):
+    def __init__(self, result):
+        super(ModuleExit, self).__init__(result.get('msg'))
+        self.result = result
+
+
+class FakeModule(object):
+    # The part of AnsibleModule used by aws_emr.run_mode; exit_json and fail_json raise ModuleExit with the result
+    check_mode = False
+
+    def __init__(self, params):
+        self.params = params
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs['failed'] = True
+        kwargs['msg'] = msg
+        raise ModuleExit(kwargs)
+
+
+def build_params(module_args, spec_paths):
+    # The params AnsibleModule would pass: defaults of MODULE_ARGS, fake credentials and the given arguments
+    params = dict((param_name, param_spec.get('default')) for param_name, param_spec in aws_emr.MODULE_ARGS.items())
+    params.update(aws_access_key='AKIAFAKEEMRBACKEND', aws_secret_key='fake', region='us-east-1', instances=spec_paths['instances'])
+    for param_name, value in module_args.items():
+        if isinstance(value, str) and value.startswith('{') and value[1:-1] in spec_paths:
+            value = spec_paths[value[1:-1]]
+        params[param_name] = value
+    return params
+
+
+@pytest.fixture(autouse=True)
+def fast_module(monkeypatch):
+    aws_emr.import_botocore()
+    monkeypatch.setattr(aws_emr, 'WAIT_MIN_INTERVAL', 0.001)
+    monkeypatch.setattr(aws_emr, 'WAIT_MAX_INTERVAL', 0.001)
+    monkeypatch.setattr(aws_emr, 'POOL_LEASE_SETTLE', 0)
+    monkeypatch.setattr(aws_emr, 'get_backoff_delay', lambda attempt: 0.001)
+    monkeypatch.setattr(aws_emr, 'api_token_bucket', aws_emr.TokenBucket(1e9, 1e9))
+    aws_emr.spec_cache.clear()
+
+
+@pytest.fixture
+def backend():
+    return FakeEmrBackend(seed=1)
+
+
+@pytest.fixture
+def emr_client(backend):
+    return backend.create_client()
+
+
+@pytest.fixture
+def spec_paths(tmpdir):
+    paths = {}
+    for spec_name, spec in SPEC_FILES.items():
+        spec_file = tmpdir.join(spec_name + '.json')
+        spec_file.write(json.dumps(spec))
+        paths[spec_name] = str(spec_file)
+    return paths
+
+
+@pytest.fixture
+def create_args():
+    return dict(CREATE_ARGS)
+
+
+@pytest.fixture
+def run_module(backend, emr_client, spec_paths):
+    # Runs one task like AnsibleModule would and returns its result; backend.calls has the calls of that task only
+    def run(**module_args):
+        backend.calls.clear()
+        module = FakeModule(build_params(module_args, spec_paths))
+        try:
+            aws_emr.validate_params(module)
+            aws_emr.run_mode(module, emr_client)
+        except ModuleExit as err:
+            return err.result
+        return {}
+    return run
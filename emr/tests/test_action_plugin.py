@@ -0,0 +1,256 @@
+import os
+import subprocess
+import sys
+from time import sleep, time
+
+import pytest
+
+import aws_emr
+
+pytest.importorskip('ansible')
+from ansible.plugins.action import ActionBase
+from ansible.plugins.loader import action_loader
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'action_plugins')
+
+# Stands in for aws_emr.py in the helper, which would otherwise need EMR to run a task
+HELPER_MODULE = '''
+import os
+
+MODULE_ARGS = dict(mode=dict(type='str', required=True))
+
+def validate_params(module):
+    pass
+
+def import_botocore():
+    return True
+
+def get_client(*args, **kwargs):
+    return None
+
+def run_mode(module, emr_client):
+    module.exit_json(changed=False, mode=module.params['mode'], pid=os.getpid())
+'''
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Templar(object):
+    def template(self, value):
+        return value
+
+
+@pytest.fixture
+def plugin():
+    action_loader.add_directory(PLUGIN_DIR)
+    return sys.modules[action_loader.get('aws_emr', class_only=True).__module__]
+
+
+@pytest.fixture
+def runner(plugin, emr_client, monkeypatch):
+    client_calls = []
+
+    def get_client(*args, **kwargs):
+        client_calls.append((args, kwargs))
+        return emr_client
+    monkeypatch.setattr(aws_emr, 'get_client', get_client)
+    runner = plugin.ModuleRunner(aws_emr)
+    runner.client_calls = client_calls
+    return runner
+
+
+@pytest.fixture
+def module_args():
+    return dict(aws_access_key='AKIAEXAMPLE', aws_secret_key='secret-key', region='us-east-1', mode='describe')
+
+
+@pytest.fixture
+def action(plugin, monkeypatch):
+    # An ActionModule of a local task, whose module runs are recorded instead of executed
+    monkeypatch.setattr(ActionBase, 'run', lambda self, tmp=None, task_vars=None: {})
+    action = plugin.ActionModule.__new__(plugin.ActionModule)
+    action._connection = Namespace(transport='local')
+    action._play_context = Namespace(check_mode=False)
+    action._task = Namespace(args=dict(mode='describe', id='j-EXAMPLE'), async_val=0, environment=[])
+    action._templar = Templar()
+    action.executed = []
+    action._execute_module = lambda module_name, module_args, task_vars: action.executed.append(module_args) or dict(executed=True)
+    action.in_process = []
+    monkeypatch.setattr(plugin, 'load_aws_emr_module', lambda path: aws_emr)
+    monkeypatch.setattr(action, 'find_module_path', lambda: 'aws_emr.py')
+    monkeypatch.setattr(plugin, 'run_with_helper', lambda *args: action.in_process.append(args[1]) or dict(in_process=True))
+    monkeypatch.setattr(plugin.ModuleRunner, 'run', lambda runner, module_args, environment: action.in_process.append(module_args) or dict(in_process=True))
+    return action
+
+
+def test_in_process_task(runner, backend, module_args):
+    cluster_id = backend.add_cluster('plugin')
+
+    result = runner.run(dict(module_args, id=cluster_id))
+    assert not result.get('failed'), result.get('msg')
+    assert result['cluster']['Id'] == cluster_id
+    assert result['invocation']['module_args']['aws_secret_key'] == 'VALUE_SPECIFIED_IN_NO_LOG_PARAMETER'
+    assert result['invocation']['module_args']['batch_concurrency'] == 8
+
+    runner.run(dict(module_args, id=cluster_id))
+    assert len(runner.client_calls) == 1
+
+
+@pytest.mark.parametrize('invalid_args, message', [
+    (dict(mode=None), 'missing required arguments: mode'),
+    (dict(mode='resize'), 'value of mode must be one of'),
+    (dict(wait_timeout='soon'), 'wait_timeout'),
+    (dict(unknown=True), 'unknown'),
+])
+def test_in_process_validation_errors(runner, module_args, invalid_args, message):
+    task_args = dict(module_args, **invalid_args)
+    task_args = dict((name, value) for name, value in task_args.items() if value is not None)
+
+    result = runner.run(task_args)
+    assert result['failed']
+    assert message in result['msg']
+    assert 'secret-key' not in str(result)
+    assert runner.client_calls == []
+
+
+def test_task_environment_becomes_client_settings(runner, backend, module_args):
+    cluster_id = backend.add_cluster('plugin')
+    environment = dict(
+        AWS_PROFILE='emr', AWS_CONFIG_FILE='/etc/aws/config', AWS_CA_BUNDLE='/etc/ssl/ca.pem',
+        HTTPS_PROXY='http://proxy:3128', http_proxy='http://proxy:8080'
+    )
+    os_environment = dict(os.environ)
+
+    runner.run(dict(module_args, id=cluster_id), environment)
+    assert dict(os.environ) == os_environment
+    args, kwargs = runner.client_calls[0]
+    assert args == ('us-east-1', 'AKIAEXAMPLE', 'secret-key', None)
+    assert kwargs['session_vars'] == dict(profile='emr', config_file='/etc/aws/config', ca_bundle='/etc/ssl/ca.pem')
+    assert kwargs['proxies'] == dict(http='http://proxy:8080', https='http://proxy:3128')
+
+    # Another environment gets its own client
+    runner.run(dict(module_args, id=cluster_id), dict(environment, AWS_PROFILE='other'))
+    assert len(runner.client_calls) == 2
+    assert runner.client_calls[1][1]['session_vars']['profile'] == 'other'
+
+
+def test_client_settings_of_other_environments(plugin, module_args, monkeypatch):
+    monkeypatch.delenv('HTTPS_PROXY', raising=False)
+    monkeypatch.delenv('https_proxy', raising=False)
+    params = dict(module_args, aws_access_key='', aws_secret_key='')
+
+    credentials, session_vars, proxies = plugin.get_client_settings(params, dict(
+        AWS_ACCESS_KEY_ID='AKIAENV', AWS_SECRET_ACCESS_KEY='env-secret', AWS_SESSION_TOKEN='token',
+        AWS_DEFAULT_PROFILE='default-profile', AWS_PROFILE='profile'
+    ))
+    assert credentials == ('us-east-1', 'AKIAENV', 'env-secret', 'token')
+    assert session_vars == dict(profile='default-profile')
+    # Without proxy variables in the task botocore reads those of the process
+    assert proxies is None
+
+    credentials, session_vars, proxies = plugin.get_client_settings(module_args, dict(
+        HTTPS_PROXY='http://proxy:3128', NO_PROXY='localhost,.amazonaws.com'
+    ))
+    assert credentials[1] == 'AKIAEXAMPLE'
+    assert proxies == {}
+
+
+def test_get_client_uses_the_given_settings(tmpdir, monkeypatch):
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE', 'AWS_DEFAULT_PROFILE'):
+        monkeypatch.delenv(name, raising=False)
+    credentials_path = tmpdir.join('credentials')
+    credentials_path.write('[emr]\naws_access_key_id = AKIAFILE\naws_secret_access_key = file-secret\n')
+    proxies = dict(https='http://proxy:3128')
+
+    emr_client = aws_emr.get_client(
+        'us-east-1', None, None, None, session_vars=dict(profile='emr', credentials_file=str(credentials_path)), proxies=proxies
+    )
+    assert aws_emr.get_access_key(emr_client, dict(aws_access_key=None)) == 'AKIAFILE'
+    assert emr_client.meta.config.proxies == proxies
+
+
+def test_fallback_to_module_execution(action, plugin, monkeypatch):
+    assert action.run(task_vars={}) == dict(in_process=True)
+    assert action.run(task_vars=dict(aws_emr_helper=False)) == dict(in_process=True)
+
+    action._connection = Namespace(transport='ssh')
+    assert action.run(task_vars={}) == dict(executed=True)
+    action._connection = Namespace(transport='local')
+
+    action._play_context = Namespace(check_mode=True)
+    assert action.run(task_vars={}) == dict(executed=True)
+    action._play_context = Namespace(check_mode=False)
+
+    assert action.run(task_vars=dict(ansible_python_interpreter='/opt/other/bin/python')) == dict(executed=True)
+    assert action.run(task_vars=dict(ansible_python_interpreter=sys.executable)) == dict(in_process=True)
+
+    action._task.environment = [dict(AWS_STS_REGIONAL_ENDPOINTS='regional')]
+    assert action.run(task_vars={}) == dict(executed=True)
+    action._task.environment = [dict(AWS_PROFILE='emr', HTTPS_PROXY='http://proxy:3128')]
+    assert action.run(task_vars={}) == dict(in_process=True)
+    action._task.environment = []
+
+    action._task.args['trace_path'] = '/tmp/trace.json'
+    assert action.run(task_vars={}) == dict(executed=True)
+    del action._task.args['trace_path']
+
+    monkeypatch.setattr(plugin, 'load_aws_emr_module', lambda path: aws_emr.nonexistent)
+    assert action.run(task_vars={}) == dict(executed=True)
+    assert len(action.executed) == 6 and len(action.in_process) == 4
+
+
+@pytest.fixture
+def helper(plugin, tmpdir, monkeypatch):
+    # Helpers of an ansible-playbook run played by a sleeping process, with tasks run by HELPER_MODULE
+    monkeypatch.setattr(plugin, 'HELPER_DIR', str(tmpdir.join('helper')))
+    module_path = tmpdir.join('aws_emr.py')
+    module_path.write(HELPER_MODULE)
+    owner = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    started = []
+    start_helper = plugin.start_helper
+
+    def counted_start_helper(*args):
+        started.append(args)
+        start_helper(*args)
+    monkeypatch.setattr(plugin, 'start_helper', counted_start_helper)
+
+    def run_task(mode, idle_timeout=60):
+        return plugin.run_with_helper(str(module_path), dict(mode=mode), {}, idle_timeout, owner.pid)
+    yield Namespace(run_task=run_task, started=started, owner=owner, address=lambda: plugin.get_helper_address(str(module_path), owner.pid))
+    if owner.poll() is None:
+        owner.kill()
+        owner.wait()
+
+
+def wait_for_exit(address):
+    deadline = time() + 10
+    while os.path.exists(address + '.sock') and time() < deadline:
+        sleep(0.1)
+    return not os.path.exists(address + '.sock')
+
+
+def test_helper_is_reused(helper):
+    first_result = helper.run_task('describe')
+    second_result = helper.run_task('check-status')
+    assert first_result['mode'] == 'describe' and second_result['mode'] == 'check-status'
+    assert first_result['pid'] == second_result['pid'] != os.getpid()
+    assert len(helper.started) == 1
+
+
+def test_helper_exits_when_idle(helper):
+    first_result = helper.run_task('describe', idle_timeout=1)
+    assert wait_for_exit(helper.address())
+
+    second_result = helper.run_task('describe', idle_timeout=1)
+    assert second_result['pid'] != first_result['pid']
+    assert len(helper.started) == 2
+
+
+def test_helper_exits_with_its_owner(helper):
+    helper.run_task('describe')
+    helper.owner.kill()
+    helper.owner.wait()
+    assert wait_for_exit(helper.address())
@@ -0,0 +1,76 @@
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+from fake_emr import FakeApiError
+
+
+def fail_first_calls(backend, monkeypatch, operation_name, errors):
+    # The first calls of operation_name raise errors, in order, then the backend answers
+    errors = list(errors)
+    handler = getattr(backend, operation_name)
+
+    def failing_handler(params):
+        if errors:
+            raise errors.pop(0)
+        return handler(params)
+    monkeypatch.setattr(backend, operation_name, failing_handler)
+
+
+def test_calls_by_operation(run_module, backend):
+    cluster_id = backend.add_cluster('stats', instance_count=121)
+
+    result = run_module(mode='get-slave-ips', id=cluster_id, api_stats=True)
+    api_stats = result['api_stats']
+    assert api_stats['calls_by_operation'] == dict(backend.calls)
+    assert api_stats['calls_by_operation']['ListInstances'] == 3
+    assert api_stats['calls'] == sum(backend.calls.values())
+    assert api_stats['errors_by_code'] == {}
+    assert api_stats['retries'] == 0
+    assert api_stats['latency_ms']['p50'] is not None
+    assert api_stats['latency_ms']['max'] >= api_stats['latency_ms']['p50']
+
+
+def test_api_stats_are_off_by_default(run_module, backend):
+    cluster_id = backend.add_cluster('stats')
+
+    result = run_module(mode='describe', id=cluster_id)
+    assert 'api_stats' not in result
+
+
+def test_throttled_calls_are_counted_again(run_module, backend, monkeypatch):
+    cluster_id = backend.add_cluster('stats')
+    fail_first_calls(backend, monkeypatch, 'DescribeCluster', [
+        FakeApiError('ThrottlingException', 'Rate exceeded'),
+        FakeApiError('InternalServerError', 'Internal error', 500),
+    ])
+
+    result = run_module(mode='describe', id=cluster_id, api_stats=True)
+    api_stats = result['api_stats']
+    assert api_stats['calls_by_operation'] == dict(DescribeCluster=3)
+    assert api_stats['errors_by_code'] == dict(ThrottlingException=1, InternalServerError=1)
+    assert api_stats['retries'] == 2
+    assert api_stats['backoff_seconds'] > 0
+
+
+def test_connection_errors(run_module, backend, emr_client):
+    cluster_id = backend.add_cluster('stats')
+    errors = [EndpointConnectionError(endpoint_url='https://emr.invalid'), ReadTimeoutError(endpoint_url='https://emr.invalid')]
+
+    def fail_first_attempts(**kwargs):
+        if errors:
+            raise errors.pop(0)
+    emr_client.meta.events.register_first('before-parameter-build.emr.DescribeCluster', fail_first_attempts)
+
+    result = run_module(mode='describe', id=cluster_id, api_stats=True)
+    assert not result.get('failed'), result.get('msg')
+    api_stats = result['api_stats']
+    assert api_stats['connection_errors'] == dict(EndpointConnectionError=1, ReadTimeoutError=1)
+    assert api_stats['retries'] == 2
+    assert api_stats['calls_by_operation'] == dict(DescribeCluster=1)
+
+
+def test_failed_run_reports_api_stats(run_module, backend):
+    backend.add_cluster('stats')
+
+    result = run_module(mode='describe', name='missing', api_stats=True)
+    assert result['failed']
+    assert result['api_stats']['calls_by_operation'] == dict(backend.calls)
+    assert result['api_stats']['errors_by_code'] == {}
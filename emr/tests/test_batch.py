@@ -0,0 +1,60 @@
+import aws_emr
+from botocore.exceptions import EndpointConnectionError, ParamValidationError
+
+
+def fail_cluster(emr_client, cluster_id, error):
+    # Every describe_cluster of cluster_id raises error before it is sent
+    def fail_call(params, **kwargs):
+        if params.get('ClusterId') == cluster_id:
+            raise error
+    emr_client.meta.events.register_first('before-parameter-build.emr.DescribeCluster', fail_call)
+
+
+def test_describe_many_ids(run_module, backend):
+    cluster_ids = [backend.add_cluster('batch-%d' % index) for index in range(5)]
+
+    result = run_module(mode='describe', ids=cluster_ids, batch_concurrency=3)
+    assert not result.get('failed'), result.get('msg')
+    assert sorted(result['clusters']) == sorted(cluster_ids)
+    assert all(result['clusters'][cluster_id]['cluster']['Id'] == cluster_id for cluster_id in cluster_ids)
+    assert result['failed_ids'] == []
+    assert backend.calls['DescribeCluster'] == 5
+
+
+def test_names_are_resolved_with_one_scan(run_module, backend):
+    cluster_ids = [backend.add_cluster('batch-%d' % index) for index in range(3)]
+
+    result = run_module(mode='check-status', names=['batch-0', 'batch-2', 'missing'])
+    assert sorted(result['clusters']) == sorted([cluster_ids[0], cluster_ids[2]])
+    assert result['missing_names'] == ['missing']
+    assert backend.calls['DescribeCluster'] == 2
+
+
+def test_client_error_fails_only_its_cluster(run_module, backend):
+    cluster_id = backend.add_cluster('batch')
+
+    result = run_module(mode='describe', ids=[cluster_id, 'j-MISSING'])
+    assert result['failed_ids'] == ['j-MISSING']
+    assert not result['clusters'][cluster_id].get('failed')
+    assert result['clusters']['j-MISSING']['failed']
+
+
+def test_connection_error_past_the_deadline_fails_only_its_cluster(run_module, backend, emr_client, monkeypatch):
+    monkeypatch.setattr(aws_emr, 'get_backoff_delay', lambda attempt: aws_emr.RETRY_DEADLINE + 1)
+    cluster_ids = [backend.add_cluster('batch-%d' % index) for index in range(3)]
+    fail_cluster(emr_client, cluster_ids[1], EndpointConnectionError(endpoint_url='https://emr.invalid'))
+
+    result = run_module(mode='describe', ids=cluster_ids)
+    assert result['failed_ids'] == [cluster_ids[1]]
+    assert 'Could not connect to the endpoint URL' in result['clusters'][cluster_ids[1]]['msg']
+    assert not result['clusters'][cluster_ids[0]].get('failed')
+    assert not result['clusters'][cluster_ids[2]].get('failed')
+
+
+def test_invalid_parameters_fail_only_their_cluster(run_module, backend, emr_client):
+    cluster_ids = [backend.add_cluster('batch-%d' % index) for index in range(2)]
+    fail_cluster(emr_client, cluster_ids[0], ParamValidationError(report='Invalid length for parameter ClusterId'))
+
+    result = run_module(mode='describe', ids=cluster_ids)
+    assert result['failed_ids'] == [cluster_ids[0]]
+    assert 'Invalid length for parameter ClusterId' in result['clusters'][cluster_ids[0]]['msg']
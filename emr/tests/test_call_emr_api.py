@@ -0,0 +1,98 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+import aws_emr
+from fake_emr import FakeApiError
+
+
+def fail_first_calls(emr_client, count, error):
+    failures = []
+
+    def fail_call(**kwargs):
+        if len(failures) < count:
+            failures.append(kwargs)
+            raise error
+    emr_client.meta.events.register_first('before-call.emr.*', fail_call)
+    return failures
+
+
+def test_connection_errors_of_idempotent_calls_are_retried(backend, emr_client):
+    backend.add_cluster('api')
+    failures = fail_first_calls(emr_client, 2, EndpointConnectionError(endpoint_url='https://emr.invalid'))
+    api_stats = aws_emr.ApiStats()
+    api_stats.attach(emr_client)
+
+    response = aws_emr.call_emr_api(emr_client.list_clusters)
+    assert len(response['Clusters']) == 1
+    assert len(failures) == 2
+    assert backend.calls['ListClusters'] == 1
+    assert api_stats.connection_errors == {'EndpointConnectionError': 2}
+    assert api_stats.retries == 2
+
+
+def test_connection_errors_of_other_calls_are_raised(backend, emr_client):
+    cluster_id = backend.add_cluster('api')
+    failures = fail_first_calls(emr_client, 1, EndpointConnectionError(endpoint_url='https://emr.invalid'))
+
+    with pytest.raises(EndpointConnectionError):
+        aws_emr.call_emr_api(emr_client.add_tags, idempotent=False, ResourceId=cluster_id, Tags=[dict(Key='team', Value='data')])
+    assert len(failures) == 1
+    assert backend.calls['AddTags'] == 0
+
+
+def test_throttling_is_retried(backend, emr_client, monkeypatch):
+    backend.add_cluster('api')
+    list_clusters = backend.ListClusters
+    attempts = []
+
+    def throttle_once(params):
+        attempts.append(params)
+        if len(attempts) == 1:
+            raise FakeApiError('ThrottlingException', 'Rate exceeded')
+        return list_clusters(params)
+    monkeypatch.setattr(backend, 'ListClusters', throttle_once)
+
+    response = aws_emr.call_emr_api(emr_client.list_clusters)
+    assert len(response['Clusters']) == 1
+    assert backend.calls['ListClusters'] == 2
+
+
+def test_client_errors_are_not_retried(backend, emr_client):
+    with pytest.raises(ClientError):
+        aws_emr.call_emr_api(emr_client.describe_cluster, ClusterId='j-MISSING')
+    assert backend.calls['DescribeCluster'] == 1
+
+
+def test_server_errors_are_retried_for_idempotent_calls_only(backend, emr_client, monkeypatch):
+    cluster_id = backend.add_cluster('api')
+    describe_cluster = backend.DescribeCluster
+    add_tags = backend.AddTags
+    attempts = []
+
+    def fail_once(handler):
+        def fail_first_attempt(params):
+            attempts.append(params)
+            if len(attempts) == 1:
+                raise FakeApiError('InternalServerError', 'Internal error', 500)
+            return handler(params)
+        return fail_first_attempt
+    monkeypatch.setattr(backend, 'DescribeCluster', fail_once(describe_cluster))
+    monkeypatch.setattr(backend, 'AddTags', fail_once(add_tags))
+
+    assert aws_emr.call_emr_api(emr_client.describe_cluster, ClusterId=cluster_id)['Cluster']['Id'] == cluster_id
+    assert backend.calls['DescribeCluster'] == 2
+
+    del attempts[:]
+    with pytest.raises(ClientError):
+        aws_emr.call_emr_api(emr_client.add_tags, idempotent=False, ResourceId=cluster_id, Tags=[dict(Key='team', Value='data')])
+    assert backend.calls['AddTags'] == 1
+
+
+def test_retries_stop_at_the_deadline(backend, emr_client, monkeypatch):
+    monkeypatch.setattr(aws_emr, 'get_backoff_delay', lambda attempt: 0.02)
+    failures = fail_first_calls(emr_client, 1000, EndpointConnectionError(endpoint_url='https://emr.invalid'))
+
+    with pytest.raises(EndpointConnectionError):
+        aws_emr.call_emr_api(emr_client.list_clusters, retry_deadline=0.1)
+    assert 2 <= len(failures) <= 6
+    assert backend.calls['ListClusters'] == 0
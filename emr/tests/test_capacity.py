@@ -0,0 +1,215 @@
+def get_collection(backend, cluster_id, role):
+    return [collection for collection in backend.clusters[cluster_id]['Collections'] if collection['Role'] == role][0]
+
+
+def count_running(backend, cluster_id, collection):
+    return sum(
+        1 for instance in backend.clusters[cluster_id]['Instances']
+        if instance['CollectionId'] == collection['Id'] and instance['State'] == 'RUNNING'
+    )
+
+
+def test_group_scale_out_and_in(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+    task_group = get_collection(backend, cluster_id, 'TASK')
+
+    result = run_module(mode='scale-out', id=cluster_id, instance_collection_name='Task', scale_out_instance_count=6, wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert count_running(backend, cluster_id, task_group) == 6
+    assert backend.calls['ModifyInstanceGroups'] == 1
+    assert result['wait']['state'] == 'RUNNING'
+    assert result['wait']['target_capacity'] == 6 and result['wait']['provisioned_capacity'] == 6
+    assert result['wait']['time_to_capacity'] is not None
+    assert result['wait']['capacity_timeline'][-1]['provisioned'] == 6
+
+    result = run_module(mode='scale-in', id=cluster_id, instance_collection_name='Task', wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert count_running(backend, cluster_id, task_group) == 0
+    assert backend.calls['ModifyInstanceGroups'] == 1
+    assert result['wait']['provisioned_capacity'] == 0
+
+
+def test_scale_out_without_wait_returns_right_away(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+    task_group = get_collection(backend, cluster_id, 'TASK')
+
+    result = run_module(mode='scale-out', id=cluster_id, instance_collection_name='Task', scale_out_instance_count=6)
+    assert result['changed'] and 'wait' not in result
+    assert count_running(backend, cluster_id, task_group) == 2
+    assert backend.calls['ListInstanceGroups'] == 1
+
+
+def test_scale_out_times_out_with_the_provisioned_capacity(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+
+    result = run_module(mode='scale-out', id=cluster_id, instance_collection_name='Task', scale_out_instance_count=6, wait=True, wait_timeout=0)
+    assert result['failed']
+    assert result['msg'].startswith('Timed out after')
+    assert 'with 2 of 6 capacity provisioned' in result['msg']
+    assert result['wait']['time_to_capacity'] is None
+
+
+def test_scale_in_of_a_missing_group_does_not_fail(run_module, backend):
+    cluster_id = backend.add_cluster('groups')
+
+    result = run_module(mode='scale-in', id=cluster_id, instance_collection_name='Missing')
+    assert not result.get('failed')
+    assert backend.calls['ModifyInstanceGroups'] == 0
+
+
+def test_capacity_without_changes_makes_no_modify_call(run_module, backend):
+    cluster_id = backend.add_cluster('groups')
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=[dict(type='MASTER', on_demand=1)])
+    assert not result.get('failed'), result.get('msg')
+    assert not result['changed']
+    assert backend.calls['ModifyInstanceGroups'] == 0
+
+
+def test_capacity_changes_all_groups_in_one_call(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+    capacity = [dict(type='CORE', on_demand=4), dict(name='Task', on_demand=0)]
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=capacity, wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed']
+    assert [(entry['name'], entry['previous_on_demand'], entry['on_demand'], entry['changed']) for entry in result['capacity']] == [
+        ('Core', 2, 4, True), ('Task', 2, 0, True)
+    ]
+    assert count_running(backend, cluster_id, get_collection(backend, cluster_id, 'CORE')) == 4
+    assert count_running(backend, cluster_id, get_collection(backend, cluster_id, 'TASK')) == 0
+    assert backend.calls['ModifyInstanceGroups'] == 1
+
+    # The same play again is at its target
+    result = run_module(mode='capacity', id=cluster_id, capacity=capacity)
+    assert not result['changed']
+    assert not any(entry['changed'] for entry in result['capacity'])
+    assert backend.calls['ModifyInstanceGroups'] == 0
+
+
+def test_capacity_of_fleets(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=[dict(type='TASK', on_demand=2, spot=3)])
+    assert result['changed']
+    task_fleet = get_collection(backend, cluster_id, 'TASK')
+    assert (task_fleet['Requested'], task_fleet['SpotRequested']) == (2, 3)
+    assert backend.calls['ModifyInstanceFleet'] == 1
+
+
+def test_invalid_capacity_entries(run_module, backend):
+    cluster_id = backend.add_cluster('groups')
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=[dict(name='Missing', on_demand=1)])
+    assert result['msg'] == 'No active instance group/fleet was found by name Missing'
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=[dict(type='TASK', spot=2)])
+    assert result['msg'] == 'Instance group Task runs ON_DEMAND instances only'
+
+    result = run_module(mode='capacity', id=cluster_id, capacity=[dict(type='TASK', on_demand=1), dict(name='Task', on_demand=2)])
+    assert result['msg'] == 'Instance group/fleet Task is given more than once in capacity'
+    assert backend.calls['ModifyInstanceGroups'] == 0
+
+
+def test_fleet_scale_in_waits_for_the_new_capacity(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+    task_fleet = get_collection(backend, cluster_id, 'TASK')
+    assert count_running(backend, cluster_id, task_fleet) == 4
+
+    result = run_module(mode='scale-in', id=cluster_id, wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed']
+    # The fleet keeps its old capacity until the resize takes effect, the wait must not take it for the target
+    assert count_running(backend, cluster_id, task_fleet) == 0
+    assert backend.calls['ModifyInstanceFleet'] == 1
+    assert backend.calls['ListInstanceFleets'] > backend.transition_calls
+
+
+def test_fleet_scale_out_waits_for_the_new_capacity(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+    task_fleet = get_collection(backend, cluster_id, 'TASK')
+
+    result = run_module(mode='scale-out', id=cluster_id, scale_out_instance_count=6, wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert count_running(backend, cluster_id, task_fleet) == 10
+    assert backend.calls['ModifyInstanceFleet'] == 1
+
+
+def test_fleet_scale_out_with_spot_capacity(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+    task_fleet = get_collection(backend, cluster_id, 'TASK')
+
+    result = run_module(mode='scale-out', id=cluster_id, scale_out_instance_count=2, scale_out_spot_count=3)
+    assert (result['previous_on_demand_capacity'], result['previous_spot_capacity']) == (4, 0)
+    assert (result['target_on_demand_capacity'], result['target_spot_capacity']) == (6, 3)
+    assert (task_fleet['Requested'], task_fleet['SpotRequested']) == (6, 3)
+
+    result = run_module(mode='scale-in', id=cluster_id, scale_in_instance_count=1, scale_in_spot_count=5)
+    assert (result['target_on_demand_capacity'], result['target_spot_capacity']) == (5, 0)
+
+
+def test_fleet_scale_out_by_on_demand_ratio(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+
+    result = run_module(mode='scale-out', id=cluster_id, scale_out_instance_count=10, on_demand_ratio=0.3)
+    assert (result['target_on_demand_capacity'], result['target_spot_capacity']) == (4 + 3, 7)
+
+
+def test_core_fleet_scale_out(run_module, backend):
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9)
+    core_fleet = get_collection(backend, cluster_id, 'CORE')
+
+    result = run_module(mode='scale-out', id=cluster_id, instance_fleet_type='CORE', scale_out_instance_count=2)
+    assert result['instance_fleet_type'] == 'CORE'
+    assert core_fleet['Requested'] == 6
+    assert get_collection(backend, cluster_id, 'TASK')['Requested'] == 4
+
+
+def test_weighted_fleet_scale_out_in_instances(run_module, backend):
+    # Every instance type of the fleets counts 4 units
+    cluster_id = backend.add_cluster('fleet', fleet=True, instance_count=9, weighted_capacity=4)
+
+    result = run_module(mode='scale-out', id=cluster_id, scale_out_instance_count=2, scale_unit='instances')
+    assert (result['previous_on_demand_capacity'], result['target_on_demand_capacity']) == (16, 24)
+    assert result['estimated_instance_count'] == dict(min=6, max=6)
+
+    result = run_module(mode='scale-out', id=cluster_id, scale_out_instance_count=2)
+    assert result['target_on_demand_capacity'] == 26
+    assert result['estimated_instance_count'] == dict(min=7, max=7)
+
+
+def test_resize_instance_groups_in_three_calls(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+    instance_groups = dict(('Task-%d' % index, dict(instance_count=index + 1, instance_type='r5.%dxlarge' % (index + 1), market='SPOT')) for index in range(7))
+    instance_groups['Task'] = 3
+
+    result = run_module(mode='resize-instance-groups', id=cluster_id, instance_groups=instance_groups, scale_out_instance_type='m4.large')
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed']
+    # One listing, one add_instance_groups for the 7 new groups, one modify_instance_groups for the existing one
+    assert dict(backend.calls) == dict(ListInstanceGroups=1, AddInstanceGroups=1, ModifyInstanceGroups=1)
+    entries = dict((entry['name'], entry) for entry in result['instance_groups'])
+    assert entries['Task']['operation'] == 'resize' and entries['Task']['previous_instance_count'] == 2
+    assert all(entries['Task-%d' % index]['operation'] == 'add' for index in range(7))
+    groups = dict((collection['Name'], collection) for collection in backend.clusters[cluster_id]['Collections'])
+    assert all(groups['Task-%d' % index]['Id'] == entries['Task-%d' % index]['id'] for index in range(7))
+    assert groups['Task']['Requested'] == 3
+
+    # Every group at its count
+    result = run_module(mode='resize-instance-groups', id=cluster_id, instance_groups=instance_groups, scale_out_instance_type='m4.large')
+    assert not result['changed']
+    assert all(entry['operation'] == 'none' for entry in result['instance_groups'])
+    assert dict(backend.calls) == dict(ListInstanceGroups=1)
+
+
+def test_resize_instance_groups_and_wait(run_module, backend):
+    cluster_id = backend.add_cluster('groups', instance_count=5)
+
+    result = run_module(mode='resize-instance-groups', id=cluster_id, instance_groups=dict(Task=4, Core=3, Extra=0), wait=True)
+    assert not result.get('failed'), result.get('msg')
+    entries = dict((entry['name'], entry) for entry in result['instance_groups'])
+    assert entries['Extra']['operation'] == 'none' and 'wait' not in entries['Extra']
+    assert entries['Task']['wait']['provisioned_capacity'] == 4
+    assert entries['Core']['wait']['provisioned_capacity'] == 3
+    assert count_running(backend, cluster_id, get_collection(backend, cluster_id, 'TASK')) == 4
+    assert backend.calls['ModifyInstanceGroups'] == 1 and backend.calls['AddInstanceGroups'] == 0
@@ -0,0 +1,47 @@
+from time import time
+
+
+def test_cluster_facts(run_module, backend):
+    cluster_id = backend.add_cluster('facts', instance_count=5, step_count=3, tags=[dict(Key='team', Value='data')])
+
+    result = run_module(mode='cluster-facts', id=cluster_id)
+    assert not result.get('failed'), result.get('msg')
+    facts = result['cluster_facts']
+    assert facts['id'] == cluster_id and facts['name'] == 'facts' and facts['state'] == 'WAITING'
+    assert facts['applications'] == ['Hadoop', 'Spark']
+    assert facts['tags'] == dict(team='data')
+    assert facts['instance_count'] == 5
+    assert len(facts['core_private_ips']) == 2 and len(facts['task_private_ips']) == 2
+    assert facts['master_private_ip'] is not None
+    assert sorted(collection['name'] for collection in facts['instance_collections']) == ['Core', 'Master', 'Task']
+    assert [step['name'] for step in facts['steps']] == ['step-2', 'step-1', 'step-0']
+    assert len(facts['bootstrap_actions']) == 1
+    assert backend.calls == dict(DescribeCluster=1, ListInstances=1, ListInstanceGroups=1, ListSteps=1, ListBootstrapActions=1)
+
+
+def test_step_limit_stops_the_step_listing(run_module, backend):
+    cluster_id = backend.add_cluster('facts', step_count=120)
+
+    result = run_module(mode='cluster-facts', id=cluster_id, step_limit=10)
+    assert [step['name'] for step in result['cluster_facts']['steps']] == ['step-%d' % index for index in range(119, 109, -1)]
+    assert backend.calls['ListSteps'] == 1
+
+
+def test_calls_run_concurrently(run_module, backend):
+    cluster_id = backend.add_cluster('facts')
+    backend.latency = 0.1
+
+    started = time()
+    run_module(mode='cluster-facts', id=cluster_id)
+    # Five calls in a row would take 0.5 seconds, describe_cluster and the listings overlap
+    assert time() - started < 0.4
+    assert sum(backend.calls.values()) == 5
+
+
+def test_facts_of_many_clusters(run_module, backend):
+    cluster_ids = [backend.add_cluster('facts-%d' % index) for index in range(3)]
+
+    result = run_module(mode='cluster-facts', ids=cluster_ids)
+    assert result['failed_ids'] == []
+    assert all(result['clusters'][cluster_id]['cluster_facts']['id'] == cluster_id for cluster_id in cluster_ids)
+    assert backend.calls['DescribeCluster'] == 3
@@ -0,0 +1,52 @@
+DAY = 86400
+LIST_PAGE_SIZE = 50
+
+
+def add_old_clusters(backend, count, age=5 * DAY):
+    return [backend.add_cluster('old-%d' % index, age=age + index, step_count=0) for index in range(count)]
+
+
+def test_recent_cluster_is_found_in_the_first_window(run_module, backend):
+    add_old_clusters(backend, 120)
+    cluster_id = backend.add_cluster('lookup', age=60)
+
+    result = run_module(mode='get-cluster-id', name='lookup')
+    assert result['id'] == cluster_id
+    assert backend.calls['ListClusters'] == 1
+
+
+def test_older_cluster_widens_the_window(run_module, backend):
+    add_old_clusters(backend, 20)
+    cluster_id = backend.add_cluster('lookup', age=10 * DAY)
+
+    result = run_module(mode='get-cluster-id', name='lookup')
+    assert result['id'] == cluster_id
+    # 1, 7 and 30 days back
+    assert backend.calls['ListClusters'] == 3
+
+
+def test_newest_cluster_of_the_name_wins(run_module, backend):
+    backend.add_cluster('lookup', age=3 * DAY)
+    newest_id = backend.add_cluster('lookup', age=2 * DAY)
+
+    result = run_module(mode='get-cluster-id', name='lookup')
+    assert result['id'] == newest_id
+
+
+def test_lookup_without_limit_scans_once(run_module, backend):
+    add_old_clusters(backend, 120)
+    cluster_ids = [backend.add_cluster('lookup', age=age) for age in (60, 3 * DAY, 40 * DAY)]
+
+    result = run_module(mode='get-cluster-ids', name='lookup')
+    assert result['id'] == list(reversed(cluster_ids))
+    # 123 active clusters in pages of 50, without a list_clusters per window
+    assert backend.calls['ListClusters'] == 3
+
+
+def test_terminated_clusters_are_not_found(run_module, backend):
+    backend.add_cluster('lookup', state='TERMINATED', age=60)
+
+    result = run_module(mode='get-cluster-ids', name='lookup')
+    assert 'id' not in result
+    assert result['msg'] == 'Not active cluster by name: lookup was found'
+    assert backend.calls['ListClusters'] == 1
@@ -0,0 +1,184 @@
+import json
+
+import pytest
+
+import aws_emr
+from fake_emr import FakeApiError
+
+INSTANCE_FLEETS = [
+    dict(Name='Master', InstanceFleetType='MASTER', TargetOnDemandCapacity=1, InstanceTypeConfigs=[dict(InstanceType='m4.large')]),
+    dict(Name='Core', InstanceFleetType='CORE', TargetOnDemandCapacity=2, InstanceTypeConfigs=[dict(InstanceType='m4.large', WeightedCapacity=2)])
+]
+
+
+def test_unknown_application_is_a_warning(run_module, create_args):
+    result = run_module(applications=['Hadoop', 'Spark', 'Sparkling'], **create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert len(result['warnings']) == 1
+    assert 'Sparkling' in result['warnings'][0]
+
+
+def test_malformed_application_name_fails(run_module, backend, create_args):
+    result = run_module(applications=['Hadoop', 'Spark 2'], **create_args)
+    assert result['failed']
+    assert 'application names are letters, digits and dashes, got: Spark 2' in result['errors']
+    assert sum(backend.calls.values()) == 0
+
+
+def test_spec_files_are_checked_before_any_call(run_module, backend, create_args, tmpdir):
+    fleets_path = tmpdir.join('fleets.json')
+    fleets_path.write(json.dumps(INSTANCE_FLEETS))
+
+    result = run_module(instances=str(fleets_path), release_label='5.30.0', **create_args)
+    assert result['failed']
+    assert result['errors'] == [
+        'instances: the file describes instance fleets (InstanceFleetType), set enable_fleet to use it',
+        'release_label must look like emr-5.8.0, got: 5.30.0'
+    ]
+
+    result = run_module(instances=str(fleets_path), enable_fleet=True, **create_args)
+    assert result['errors'] == ['ec2_subnets is required to create a cluster with instance fleets']
+
+    result = run_module(instances='{auto_scaling_policy}', **create_args)
+    assert result['errors'][0] == 'instances: must be a non-empty list'
+    assert sum(backend.calls.values()) == 0
+
+
+def test_fleet_create(run_module, backend, create_args, tmpdir):
+    fleets_path = tmpdir.join('fleets.json')
+    fleets_path.write(json.dumps(INSTANCE_FLEETS))
+
+    result = run_module(instances=str(fleets_path), enable_fleet=True, ec2_subnets=['subnet-1', 'subnet-2'], **create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert backend.clusters[result['id']]['InstanceCollectionType'] == 'INSTANCE_FLEET'
+
+
+def test_spec_files_are_parsed_once(spec_paths):
+    instances = aws_emr.load_json_file(spec_paths['instances'], 'instances')
+    instances[0]['InstanceCount'] = 7
+
+    # The cached spec is handed out as a copy, the change above does not leak into the next task
+    assert aws_emr.load_json_file(spec_paths['instances'], 'instances')[0]['InstanceCount'] == 1
+    assert len(aws_emr.spec_cache) == 1
+
+
+def record_run_job_flow(backend, monkeypatch):
+    requests = []
+    run_job_flow = backend.RunJobFlow
+
+    def recorded_run_job_flow(params):
+        requests.append(params)
+        return run_job_flow(params)
+    monkeypatch.setattr(backend, 'RunJobFlow', recorded_run_job_flow)
+    return requests
+
+
+def test_transient_cluster_terminates_after_its_steps(run_module, backend, create_args, monkeypatch):
+    requests = record_run_job_flow(backend, monkeypatch)
+
+    result = run_module(release_label='emr-5.30.0', steps='{job_steps}', key_alive_when_no_steps=False, wait=True, **create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert len(result['step_ids']) == 5
+    assert result['wait']['state'] == 'TERMINATED'
+    assert result['steps_wait']['ended_count'] == 5
+    assert all(step['State'] == 'COMPLETED' for step in backend.clusters[result['id']]['Steps'])
+    # The steps go with run_job_flow and the cluster ends by itself
+    assert len(requests[0]['Steps']) == 5
+    assert requests[0]['Instances']['KeepJobFlowAliveWhenNoSteps'] is False
+    assert 'AutoTerminationPolicy' not in requests[0]
+    assert backend.calls['AddJobFlowSteps'] == 0
+    assert backend.calls['TerminateJobFlows'] == 0
+
+
+def test_idle_timeout_becomes_the_auto_termination_policy(run_module, backend, create_args, emr_client, monkeypatch):
+    if not aws_emr.has_auto_termination(emr_client):
+        pytest.skip('botocore without AutoTerminationPolicy')
+    requests = record_run_job_flow(backend, monkeypatch)
+
+    result = run_module(release_label='emr-5.30.0', idle_timeout=3600, **create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert requests[0]['AutoTerminationPolicy'] == dict(IdleTimeout=3600)
+
+
+def test_idle_timeout_needs_a_recent_botocore(run_module, backend, create_args, monkeypatch):
+    monkeypatch.setattr(aws_emr, 'has_auto_termination', lambda emr_client: False)
+
+    result = run_module(release_label='emr-5.30.0', idle_timeout=3600, **create_args)
+    assert result['failed']
+    assert result['msg'].startswith('idle_timeout needs botocore 1.21.31 or later')
+    assert sum(backend.calls.values()) == 0
+
+
+def test_idle_timeout_is_checked_before_any_call(run_module, backend, create_args):
+    result = run_module(release_label='emr-5.29.0', idle_timeout=30, **create_args)
+    assert result['failed']
+    assert result['errors'] == [
+        'idle_timeout must be between 60 and 604800 seconds, got: 30',
+        'idle_timeout needs release emr-5.30.0 or later (emr-6.1.0 or later on 6.x), got: emr-5.29.0'
+    ]
+    assert sum(backend.calls.values()) == 0
+
+
+def test_create_and_reuse_by_fingerprint(run_module, backend, create_args):
+    result = run_module(**create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed'] and not result['reused']
+    assert dict(Key=aws_emr.FINGERPRINT_TAG, Value=result['fingerprint']) in backend.clusters[result['id']]['Tags']
+    assert backend.calls['RunJobFlow'] == 1
+
+    reused = run_module(**create_args)
+    assert not reused['changed'] and reused['reused']
+    assert reused['id'] == result['id']
+    assert reused['fingerprint'] == result['fingerprint']
+    assert backend.calls['RunJobFlow'] == 0
+
+
+def test_create_without_reuse_makes_another_cluster(run_module, backend, create_args):
+    first = run_module(**create_args)
+    second = run_module(reuse_cluster=False, **create_args)
+    assert second['changed'] and second['id'] != first['id']
+    assert backend.calls['RunJobFlow'] == 1
+
+
+def test_validation_error_is_not_retried(run_module, backend, create_args):
+    # Parameter validation fails before run_job_flow is sent, only the lookup for a cluster to reuse was made
+    result = run_module(tags=[{'team': 1}], **create_args)
+    assert result['failed']
+    assert result['msg'].startswith('Failed to create cluster ' + create_args['name'])
+    assert set(backend.calls) == set(['ListClusters'])
+
+
+def test_server_error_after_the_cluster_was_created_is_not_retried(run_module, backend, create_args, monkeypatch):
+    run_job_flow = backend.RunJobFlow
+    attempts = []
+
+    def run_job_flow_then_fail(params):
+        response = run_job_flow(params)
+        attempts.append(response['JobFlowId'])
+        if len(attempts) == 1:
+            raise FakeApiError('InternalServerError', 'Internal error', 500)
+        return response
+    monkeypatch.setattr(backend, 'RunJobFlow', run_job_flow_then_fail)
+
+    result = run_module(**create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert result['id'] == attempts[0]
+    assert len(attempts) == 1
+    assert len([cluster for cluster in backend.clusters.values() if cluster['Name'] == create_args['name']]) == 1
+
+
+def test_server_error_before_the_cluster_was_created_is_retried(run_module, backend, create_args, monkeypatch):
+    run_job_flow = backend.RunJobFlow
+    attempts = []
+
+    def fail_then_run_job_flow(params):
+        attempts.append(params['Name'])
+        if len(attempts) == 1:
+            raise FakeApiError('InternalServerError', 'Internal error', 500)
+        return run_job_flow(params)
+    monkeypatch.setattr(backend, 'RunJobFlow', fail_then_run_job_flow)
+
+    result = run_module(**create_args)
+    assert not result.get('failed'), result.get('msg')
+    assert len(attempts) == 2
+    assert backend.clusters[result['id']]['Name'] == create_args['name']
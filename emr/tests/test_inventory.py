@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+
+import pytest
+
+import aws_emr
+
+pytest.importorskip('ansible')
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import inventory_loader
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inventory_plugins')
+
+
+@pytest.fixture
+def inventory_plugin(monkeypatch, emr_client):
+    # The plugin gets the aws_emr module of the tests and the client of the fake backend for every region
+    inventory_loader.add_directory(PLUGIN_DIR)
+    plugin = inventory_loader.get('aws_emr')
+    monkeypatch.setattr(sys.modules[type(plugin).__module__], 'load_aws_emr_module', lambda path: aws_emr)
+    monkeypatch.setattr(aws_emr, 'get_client', lambda region, access_key, secret_key, security_token: emr_client)
+    return plugin
+
+
+@pytest.fixture
+def parse_inventory(inventory_plugin, backend, tmpdir):
+    def parse(**config):
+        backend.calls.clear()
+        config_path = tmpdir.join('emr.aws_emr.yml')
+        config_path.write(json.dumps(dict(dict(plugin='aws_emr', regions=['us-east-1'], cache_path=str(tmpdir.join('cache.json'))), **config)))
+        inventory = InventoryData()
+        inventory_plugin.parse(inventory, DataLoader(), str(config_path))
+        return inventory
+    return parse
+
+
+def get_instances(backend, cluster_id, role):
+    cluster = backend.clusters[cluster_id]
+    collection_ids = [collection['Id'] for collection in cluster['Collections'] if collection['Role'] == role]
+    return [instance for instance in cluster['Instances'] if instance['CollectionId'] in collection_ids]
+
+
+def get_group_hosts(inventory, group_name):
+    return sorted(host.name for host in inventory.groups[group_name].get_hosts())
+
+
+def test_hosts_and_groups(parse_inventory, backend):
+    cluster_id = backend.add_cluster('EMR-EXAMPLE', instance_count=5)
+    backend.add_cluster('other', fleet=True)
+    backend.add_cluster('gone', state='TERMINATED')
+
+    inventory = parse_inventory()
+    master = get_instances(backend, cluster_id, 'MASTER')[0]
+    task_ips = sorted(instance['PrivateIpAddress'] for instance in get_instances(backend, cluster_id, 'TASK'))
+    assert get_group_hosts(inventory, 'emr_EMR_EXAMPLE_master') == [master['PrivateIpAddress']]
+    assert get_group_hosts(inventory, 'emr_EMR_EXAMPLE_task') == task_ips
+    assert get_group_hosts(inventory, 'emr_EMR_EXAMPLE_Task') == task_ips
+    assert len(get_group_hosts(inventory, 'emr_EMR_EXAMPLE')) == 5
+    assert len(get_group_hosts(inventory, 'emr_master')) == 2
+    assert 'emr_gone' not in inventory.groups
+
+    host_vars = inventory.get_host(master['PrivateIpAddress']).vars
+    assert host_vars['emr_cluster_id'] == cluster_id
+    assert host_vars['emr_role'] == 'MASTER'
+    assert host_vars['emr_instance_id'] == master['Ec2InstanceId']
+    # One listing of the active clusters, then one list_instances per cluster
+    assert backend.calls['ListClusters'] == 1
+    assert backend.calls['ListInstances'] == 2
+
+
+def test_cluster_names_filter(parse_inventory, backend):
+    backend.add_cluster('EMR-EXAMPLE')
+    backend.add_cluster('other')
+
+    inventory = parse_inventory(cluster_names=['EMR-EXAMPLE'])
+    assert 'emr_EMR_EXAMPLE' in inventory.groups
+    assert 'emr_other' not in inventory.groups
+    assert backend.calls['ListInstances'] == 1
+
+
+def test_cached_inventory(parse_inventory, backend):
+    backend.add_cluster('EMR-EXAMPLE')
+    parse_inventory()
+
+    inventory = parse_inventory()
+    assert len(get_group_hosts(inventory, 'emr_EMR_EXAMPLE')) == 3
+    assert sum(backend.calls.values()) == 0
+
+    parse_inventory(cache_ttl=0)
+    assert backend.calls['ListClusters'] == 1
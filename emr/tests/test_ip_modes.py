@@ -0,0 +1,56 @@
+import pytest
+
+
+def get_ips(backend, cluster_id, role):
+    cluster = backend.clusters[cluster_id]
+    collection_ids = [collection['Id'] for collection in cluster['Collections'] if collection['Role'] == role]
+    return [
+        instance['PrivateIpAddress'] for instance in cluster['Instances']
+        if instance['CollectionId'] in collection_ids and instance['State'] != 'TERMINATED'
+    ]
+
+
+@pytest.mark.parametrize('fleet', [False, True])
+def test_ips_from_one_instance_listing(run_module, backend, fleet):
+    # 1 master, 60 core and 60 task instances are 3 pages of list_instances
+    cluster_id = backend.add_cluster('ips', fleet=fleet, instance_count=121)
+    collections_call = 'ListInstanceFleets' if fleet else 'ListInstanceGroups'
+
+    result = run_module(mode='get-slave-ips', id=cluster_id)
+    assert sorted(result['slave_private_ips']) == sorted(get_ips(backend, cluster_id, 'CORE') + get_ips(backend, cluster_id, 'TASK'))
+    assert len(result['slave_private_ips']) == 120
+    assert backend.calls['ListInstances'] == 3
+    assert backend.calls[collections_call] == 1
+    assert backend.calls['DescribeCluster'] == 0
+
+    result = run_module(mode='get-core-ips', id=cluster_id)
+    assert sorted(result['core_private_ips']) == sorted(get_ips(backend, cluster_id, 'CORE'))
+
+    result = run_module(mode='get-master-ip', id=cluster_id)
+    assert result['master_private_ip'] == get_ips(backend, cluster_id, 'MASTER')[0]
+
+
+def test_terminated_instances_are_left_out(run_module, backend):
+    cluster_id = backend.add_cluster('ips', instance_count=5)
+    task_group = [collection for collection in backend.clusters[cluster_id]['Collections'] if collection['Role'] == 'TASK'][0]
+    backend.resize_instances(backend.clusters[cluster_id], task_group, 0)
+
+    result = run_module(mode='get-slave-ips', id=cluster_id)
+    assert sorted(result['slave_private_ips']) == sorted(get_ips(backend, cluster_id, 'CORE'))
+
+
+def test_ips_by_name(run_module, backend):
+    cluster_id = backend.add_cluster('ips')
+
+    result = run_module(mode='get-master-ip', name='ips')
+    assert result['master_private_ip'] == get_ips(backend, cluster_id, 'MASTER')[0]
+
+
+def test_cluster_without_instances(run_module, backend):
+    cluster_id = backend.add_cluster('ips', state='STARTING', instance_count=0)
+    for instance in backend.clusters[cluster_id]['Instances']:
+        instance['State'] = 'TERMINATED'
+
+    result = run_module(mode='get-slave-ips', id=cluster_id)
+    assert result['slave_private_ips'] == []
+    assert backend.calls['ListInstanceGroups'] == 0
@@ -0,0 +1,36 @@
+import argparse
+import json
+
+import pytest
+
+import mode_benchmark
+
+
+@pytest.fixture
+def benchmark_spec_paths(tmpdir):
+    paths = {}
+    for spec_name, spec in mode_benchmark.SPEC_FILES.items():
+        spec_file = tmpdir.join(spec_name + '.json')
+        spec_file.write(json.dumps(spec))
+        paths[spec_name] = str(spec_file)
+    return paths
+
+
+def build_options(**kwargs):
+    options = dict(seed=0, throttle_rate=0.0, latency_ms=0.0, api_rate=0.0)
+    options.update(kwargs)
+    return argparse.Namespace(**options)
+
+
+@pytest.mark.parametrize('scenario_name,module_args', mode_benchmark.SCENARIOS, ids=[scenario[0] for scenario in mode_benchmark.SCENARIOS])
+def test_scenario_runs(scenario_name, module_args, benchmark_spec_paths):
+    result = mode_benchmark.run_scenario(build_options(), 50, 10, module_args, benchmark_spec_paths)
+    assert not result['failed'], result['msg']
+    assert result['api_calls'] == sum(result['calls'].values())
+
+
+def test_throttled_scenario_retries(benchmark_spec_paths):
+    result = mode_benchmark.run_scenario(build_options(throttle_rate=0.3), 500, 10, dict(mode='get-cluster-ids', name='{name}'), benchmark_spec_paths)
+    assert not result['failed'], result['msg']
+    assert result['throttled'] > 0
+    assert result['api_calls'] > result['throttled']
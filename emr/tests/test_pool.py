@@ -0,0 +1,70 @@
+from time import time
+
+import pytest
+
+import aws_emr
+
+POOL_NAME = 'EMR-TEST-POOL'
+
+
+@pytest.fixture
+def pool_args(create_args):
+    return dict(create_args, mode='pool-acquire', name=POOL_NAME)
+
+
+def test_acquire_release_and_reuse(run_module, backend, pool_args):
+    # Only WAITING clusters are leased, so the new cluster is waited for
+    acquired = run_module(lease_id='lease-1', wait=True, **pool_args)
+    assert not acquired.get('failed'), acquired.get('msg')
+    assert acquired['created'] and acquired['lease_id'] == 'lease-1'
+    assert backend.calls['RunJobFlow'] == 1
+    assert aws_emr.get_tag_value(dict(Tags=backend.clusters[acquired['id']]['Tags']), aws_emr.LEASE_TAG) == 'lease-1'
+
+    released = run_module(mode='pool-release', id=acquired['id'], lease_id='lease-1')
+    assert not released.get('failed'), released.get('msg')
+    assert released['terminated_ids'] == []
+
+    reacquired = run_module(lease_id='lease-2', **pool_args)
+    assert not reacquired.get('failed'), reacquired.get('msg')
+    assert not reacquired['created'] and reacquired['id'] == acquired['id']
+    assert backend.calls['RunJobFlow'] == 0
+
+
+def test_leased_and_expired_clusters_are_not_acquired(run_module, backend, pool_args):
+    leased_id = backend.add_cluster(POOL_NAME, tags=[dict(Key=aws_emr.POOL_TAG, Value=POOL_NAME), dict(Key=aws_emr.LEASE_TAG, Value='other')])
+    expired_id = backend.add_cluster(POOL_NAME, tags=[
+        dict(Key=aws_emr.POOL_TAG, Value=POOL_NAME), dict(Key=aws_emr.RELEASED_AT_TAG, Value=str(int(time() - 7200)))
+    ])
+
+    acquired = run_module(**pool_args)
+    assert not acquired.get('failed'), acquired.get('msg')
+    assert acquired['created'] and acquired['id'] not in (leased_id, expired_id)
+    assert acquired['terminated_ids'] == [expired_id]
+    assert backend.clusters[leased_id]['State'] == 'WAITING'
+
+
+def test_lease_taken_meanwhile_is_given_up(run_module, backend, pool_args, monkeypatch):
+    idle_id = backend.add_cluster(POOL_NAME, tags=[dict(Key=aws_emr.POOL_TAG, Value=POOL_NAME)])
+    describe_cluster = backend.DescribeCluster
+
+    def describe_cluster_leased(params):
+        # Another play leases the cluster between the listing and the lease
+        response = describe_cluster(params)
+        if backend.calls['DescribeCluster'] > 1:
+            backend.clusters[idle_id]['Tags'] = backend.clusters[idle_id]['Tags'] + [dict(Key=aws_emr.LEASE_TAG, Value='other')]
+        return response
+    monkeypatch.setattr(backend, 'DescribeCluster', describe_cluster_leased)
+
+    acquired = run_module(**pool_args)
+    assert not acquired.get('failed'), acquired.get('msg')
+    assert acquired['created'] and acquired['id'] != idle_id
+    assert backend.calls['AddTags'] == 0
+
+
+def test_release_of_another_lease_fails(run_module, backend, pool_args):
+    acquired = run_module(lease_id='lease-1', **pool_args)
+
+    released = run_module(mode='pool-release', id=acquired['id'], lease_id='lease-2')
+    assert released['failed']
+    assert released['msg'] == 'Cluster ' + acquired['id'] + ' is leased by lease-1'
+    assert backend.calls['RemoveTags'] == 0
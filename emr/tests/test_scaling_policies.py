@@ -0,0 +1,66 @@
+import aws_emr
+
+
+def test_put_auto_scaling_policy_is_idempotent(run_module, backend):
+    cluster_id = backend.add_cluster('scaling')
+
+    result = run_module(mode='put-auto-scaling-policy', id=cluster_id, instance_collection_name='Task', auto_scaling_policy='{auto_scaling_policy}')
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed']
+    assert backend.calls['PutAutoScalingPolicy'] == 1
+
+    # EMR fills in the defaults of the rules, the policy read back is still the one that was put
+    result = run_module(mode='put-auto-scaling-policy', id=cluster_id, instance_collection_name='Task', auto_scaling_policy='{auto_scaling_policy}')
+    assert not result.get('failed'), result.get('msg')
+    assert not result['changed']
+    assert backend.calls['PutAutoScalingPolicy'] == 0
+
+
+def test_put_managed_scaling_policy_is_idempotent(run_module, backend):
+    cluster_id = backend.add_cluster('scaling')
+
+    result = run_module(mode='put-managed-scaling-policy', id=cluster_id, managed_scaling_policy='{managed_scaling_policy}')
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed']
+    assert backend.calls['PutManagedScalingPolicy'] == 1
+
+    result = run_module(mode='put-managed-scaling-policy', id=cluster_id, managed_scaling_policy='{managed_scaling_policy}')
+    assert not result['changed']
+    assert backend.calls['PutManagedScalingPolicy'] == 0
+
+
+def test_describe_and_remove_scaling_policies(run_module, backend):
+    cluster_id = backend.add_cluster('scaling')
+    run_module(mode='put-auto-scaling-policy', id=cluster_id, instance_collection_name='Task', auto_scaling_policy='{auto_scaling_policy}')
+    run_module(mode='put-managed-scaling-policy', id=cluster_id, managed_scaling_policy='{managed_scaling_policy}')
+
+    result = run_module(mode='describe-scaling-policies', id=cluster_id)
+    assert result['managed_scaling_policy']['ComputeLimits']['MaximumCapacityUnits'] == 40
+    assert [policy['name'] for policy in result['auto_scaling_policies']] == ['Task']
+
+    for mode in ('remove-auto-scaling-policy', 'remove-managed-scaling-policy'):
+        result = run_module(mode=mode, id=cluster_id, instance_collection_name='Task')
+        assert not result.get('failed'), result.get('msg')
+        assert result['changed']
+        result = run_module(mode=mode, id=cluster_id, instance_collection_name='Task')
+        assert not result['changed']
+
+    result = run_module(mode='describe-scaling-policies', id=cluster_id)
+    assert result['managed_scaling_policy'] is None
+    assert result['auto_scaling_policies'] == []
+    assert backend.calls['RemoveAutoScalingPolicy'] == 0 and backend.calls['RemoveManagedScalingPolicy'] == 0
+
+
+def test_managed_scaling_needs_a_recent_botocore(run_module, backend, monkeypatch):
+    cluster_id = backend.add_cluster('scaling')
+    monkeypatch.setattr(aws_emr, 'has_managed_scaling', lambda emr_client: False)
+
+    result = run_module(mode='put-managed-scaling-policy', id=cluster_id, managed_scaling_policy='{managed_scaling_policy}')
+    assert result['failed']
+    assert result['msg'].startswith('Managed scaling needs botocore 1.15.43 or later')
+    assert backend.calls['PutManagedScalingPolicy'] == 0
+
+    # Describing still works, without the managed scaling policy
+    result = run_module(mode='describe-scaling-policies', id=cluster_id)
+    assert result['managed_scaling_policy'] is None
+    assert backend.calls['GetManagedScalingPolicy'] == 0
@@ -0,0 +1,91 @@
+import pytest
+
+import aws_emr
+
+LIST_PAGE_SIZE = 50
+
+
+def count_active(backend):
+    return sum(1 for cluster in backend.clusters.values() if cluster['State'] in aws_emr.ACTIVE_CLUSTER_STATES)
+
+
+def list_pages(backend):
+    return (count_active(backend) + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+
+
+def test_refresh_lists_active_clusters_only(run_module, backend, tmpdir):
+    backend.add_clusters(999)
+    target_id = backend.add_cluster('snapshot-target')
+    snapshot_path = str(tmpdir.join('snapshot.json'))
+
+    result = run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path)
+    assert result['id'] == target_id
+    assert backend.calls['ListClusters'] == list_pages(backend)
+    assert backend.calls['DescribeCluster'] == 0
+
+    result = run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path)
+    assert result['id'] == target_id
+    assert sum(backend.calls.values()) == 0
+
+
+def test_stale_snapshot_describes_clusters_that_left_the_active_states(run_module, backend, tmpdir):
+    backend.add_clusters(199)
+    target_id = backend.add_cluster('snapshot-target')
+    gone_id = backend.add_cluster('snapshot-gone')
+    snapshot_path = str(tmpdir.join('snapshot.json'))
+    run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path)
+
+    backend.clusters[gone_id]['State'] = 'TERMINATED'
+    result = run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path, snapshot_max_age=0)
+    assert result['id'] == target_id
+    assert backend.calls['ListClusters'] == list_pages(backend)
+    assert backend.calls['DescribeCluster'] == 1
+
+
+def test_missing_name_refreshes_once(run_module, backend, tmpdir):
+    backend.add_clusters(199)
+    snapshot_path = str(tmpdir.join('snapshot.json'))
+    run_module(mode='get-cluster-id', name='cluster-0', snapshot_path=snapshot_path)
+
+    new_id = backend.add_cluster('snapshot-new')
+    result = run_module(mode='get-cluster-id', name='snapshot-new', snapshot_path=snapshot_path)
+    assert result['id'] == new_id
+    assert backend.calls['ListClusters'] == list_pages(backend)
+    assert backend.calls['DescribeCluster'] == 0
+
+
+def test_snapshots_are_kept_per_access_key(run_module, backend, tmpdir):
+    target_id = backend.add_cluster('snapshot-target')
+    snapshot_path = str(tmpdir.join('snapshot.json'))
+    run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path)
+
+    result = run_module(mode='get-cluster-id', name='snapshot-target', snapshot_path=snapshot_path, aws_access_key='AKIAOTHERACCOUNT')
+    assert result['id'] == target_id
+    assert backend.calls['ListClusters'] == 1
+
+
+@pytest.fixture
+def clean_environment(monkeypatch, tmpdir):
+    # Credentials only from what the test sets, no profile files and no instance metadata
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE', 'AWS_DEFAULT_PROFILE'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('AWS_CONFIG_FILE', str(tmpdir.join('config')))
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(tmpdir.join('credentials')))
+    monkeypatch.setenv('AWS_EC2_METADATA_DISABLED', 'true')
+
+
+def test_access_key_of_the_client_credentials(clean_environment, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIAENVIRONMENT')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'secret')
+
+    emr_client = aws_emr.get_client('us-east-1', None, None, None)
+    assert aws_emr.get_access_key(emr_client, dict(aws_access_key=None)) == 'AKIAENVIRONMENT'
+    assert aws_emr.get_access_key(emr_client, dict(aws_access_key='AKIAPARAMETER')) == 'AKIAPARAMETER'
+
+    emr_client = aws_emr.get_client('us-east-1', 'AKIAEXPLICIT', 'secret', None)
+    assert aws_emr.get_access_key(emr_client, dict(aws_access_key=None)) == 'AKIAEXPLICIT'
+
+
+def test_access_key_without_credentials(clean_environment):
+    emr_client = aws_emr.get_client('us-east-1', None, None, None)
+    assert aws_emr.get_access_key(emr_client, dict(aws_access_key='')) == 'default'
@@ -0,0 +1,146 @@
+import json
+from time import time
+
+import aws_emr
+
+
+def test_add_steps_in_batches(run_module, backend):
+    cluster_id = backend.add_cluster('steps', step_count=0)
+
+    result = run_module(mode='add-steps', id=cluster_id, steps='{steps}')
+    assert not result.get('failed'), result.get('msg')
+    assert len(result['step_ids']) == 300
+    assert result['step_ids'] == [step['Id'] for step in reversed(backend.clusters[cluster_id]['Steps'])]
+    assert backend.calls['AddJobFlowSteps'] == 2
+
+
+def test_add_steps_by_name_with_action_on_failure(run_module, backend, tmpdir):
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    steps_path = tmpdir.join('failing_steps.json')
+    steps_path.write(json.dumps([
+        dict(Name='extract', HadoopJarStep=dict(Jar='command-runner.jar')),
+        dict(Name='load', ActionOnFailure='CANCEL_AND_WAIT', HadoopJarStep=dict(Jar='command-runner.jar'))
+    ]))
+
+    result = run_module(mode='add-steps', name='steps', steps=str(steps_path), action_on_failure='TERMINATE_CLUSTER')
+    assert not result.get('failed'), result.get('msg')
+    assert result['cluster_id'] == cluster_id
+    steps = dict((step['Name'], step) for step in backend.clusters[cluster_id]['Steps'])
+    assert steps['extract']['ActionOnFailure'] == 'TERMINATE_CLUSTER'
+    assert steps['load']['ActionOnFailure'] == 'CANCEL_AND_WAIT'
+    assert backend.calls['AddJobFlowSteps'] == 1
+
+
+def test_invalid_steps_are_not_sent(run_module, backend, tmpdir):
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    steps_path = tmpdir.join('invalid_steps.json')
+    steps_path.write(json.dumps([dict(Name='extract', ActionOnFailure='RETRY', HadoopJarStep=dict(Args=['spark-submit']))]))
+
+    result = run_module(mode='add-steps', id=cluster_id, steps=str(steps_path))
+    assert result['failed']
+    assert result['errors'] == [
+        'steps[0]: ActionOnFailure must be one of ' + ', '.join(aws_emr.STEP_ACTIONS_ON_FAILURE),
+        'steps[0]: HadoopJarStep.Jar is required'
+    ]
+    assert backend.calls['AddJobFlowSteps'] == 0
+
+
+class FakeClock(object):
+    # Stands in for time and sleep of aws_emr, so waits measured in minutes take no time
+    def __init__(self):
+        self.now = time()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_wait_steps_until_completed(run_module, backend):
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    step_ids = run_module(mode='add-steps', id=cluster_id, steps='{job_steps}')['step_ids']
+
+    result = run_module(mode='wait-steps', id=cluster_id, step_ids=step_ids)
+    assert not result.get('failed'), result.get('msg')
+    assert all(step['State'] == 'COMPLETED' for step in backend.clusters[cluster_id]['Steps'])
+    assert [step['id'] for step in result['steps']] == step_ids
+    assert all(step['duration'] is not None for step in result['steps'])
+    assert result['wait']['ended_count'] == 5
+    assert backend.calls['AddJobFlowSteps'] == 0
+
+
+def test_wait_steps_fails_fast_with_the_log_files(run_module, backend):
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    step_ids = run_module(mode='add-steps', id=cluster_id, steps='{job_steps}')['step_ids']
+    backend.step_failure_rate = 1.0
+
+    result = run_module(mode='wait-steps', id=cluster_id, step_ids=step_ids, fail_fast=True, log_url='s3://tests/logs/')
+    assert result['failed']
+    assert result['msg'].startswith('Step step-0 (' + step_ids[0] + ') ended in state FAILED with 1 of 5 steps ended')
+    failure = result['steps'][0]['failure']
+    assert failure['message'] == 'Step failed with exitCode 1.'
+    assert failure['log_files']['stderr'] == 's3://tests/logs/' + cluster_id + '/steps/' + step_ids[0] + '/stderr.gz'
+    assert [step['state'] for step in result['steps'][1:]] == ['PENDING'] * 4
+
+
+def test_step_listed_late_is_waited_for(run_module, backend, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(aws_emr, 'time', clock.time)
+    monkeypatch.setattr(aws_emr, 'sleep', clock.sleep)
+    monkeypatch.setattr(aws_emr, 'WAIT_MIN_INTERVAL', 1)
+    monkeypatch.setattr(aws_emr, 'WAIT_MAX_INTERVAL', 5)
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    step_ids = backend.AddJobFlowSteps(dict(JobFlowId=cluster_id, Steps=[dict(Name='late', HadoopJarStep=dict(Jar='command-runner.jar'))]))['StepIds']
+    list_steps = backend.ListSteps
+    listed_at = clock.now + 20
+
+    def list_steps_late(params):
+        # list_steps does not show the step in the first 20 seconds
+        if clock.now < listed_at:
+            return dict(Steps=[])
+        return list_steps(params)
+    monkeypatch.setattr(backend, 'ListSteps', list_steps_late)
+
+    result = run_module(mode='wait-steps', id=cluster_id, step_ids=step_ids)
+    assert not result.get('failed'), result.get('msg')
+    assert backend.clusters[cluster_id]['Steps'][0]['State'] == 'COMPLETED'
+    assert result['wait']['timeline'][0] == dict(state='PENDING', elapsed=0.0)
+    assert 'NOT_FOUND' not in [entry['state'] for entry in result['wait']['timeline']]
+
+
+def test_missing_step_is_pending_during_the_grace_period(run_module, backend, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(aws_emr, 'time', clock.time)
+    monkeypatch.setattr(aws_emr, 'sleep', clock.sleep)
+    monkeypatch.setattr(aws_emr, 'WAIT_MIN_INTERVAL', 1)
+    monkeypatch.setattr(aws_emr, 'WAIT_MAX_INTERVAL', 5)
+    cluster_id = backend.add_cluster('steps', step_count=0)
+    polled_at = []
+    list_steps = backend.ListSteps
+
+    def record_poll(params):
+        polled_at.append(clock.now)
+        return list_steps(params)
+    monkeypatch.setattr(backend, 'ListSteps', record_poll)
+
+    result = run_module(mode='wait-steps', id=cluster_id, step_ids=['s-MISSING'])
+    assert result['failed']
+    assert result['msg'] == 'Steps not found in cluster ' + cluster_id + ': s-MISSING'
+    # PENDING for every poll within the grace period, NOT_FOUND from the first poll after it
+    timeline = result['wait']['timeline']
+    assert [entry['state'] for entry in timeline] == ['PENDING', 'NOT_FOUND']
+    assert timeline[0]['elapsed'] == 0
+    assert aws_emr.STEP_NOT_FOUND_GRACE <= timeline[1]['elapsed'] <= aws_emr.STEP_NOT_FOUND_GRACE + 5
+    assert polled_at[-2] - polled_at[0] < aws_emr.STEP_NOT_FOUND_GRACE <= polled_at[-1] - polled_at[0]
+    assert len(polled_at) > 2
+
+
+def test_missing_step_fails_right_away_without_grace_period(run_module, backend, monkeypatch):
+    monkeypatch.setattr(aws_emr, 'STEP_NOT_FOUND_GRACE', 0)
+    cluster_id = backend.add_cluster('steps', step_count=0)
+
+    result = run_module(mode='wait-steps', id=cluster_id, step_ids=['s-MISSING'])
+    assert result['failed']
+    assert [entry['state'] for entry in result['wait']['timeline']] == ['NOT_FOUND']
+    assert backend.calls['ListSteps'] == 1
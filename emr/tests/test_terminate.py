@@ -0,0 +1,50 @@
+from fake_emr import FakeApiError
+
+
+def test_terminate_all_in_chunks(run_module, backend):
+    cluster_ids = [backend.add_cluster('terminate', termination_protected=True) for _ in range(120)]
+
+    result = run_module(mode='terminate-all', name='terminate')
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed'] and result['failed_ids'] == []
+    assert sorted(result['id']) == sorted(cluster_ids)
+    assert all(backend.clusters[cluster_id]['State'] == 'TERMINATING' for cluster_id in cluster_ids)
+    # 120 clusters are 3 chunks of up to 50 ids, two calls each
+    assert backend.calls['SetTerminationProtection'] == 3
+    assert backend.calls['TerminateJobFlows'] == 3
+
+
+def test_rejected_chunk_falls_back_to_single_clusters(run_module, backend, monkeypatch):
+    cluster_ids = [backend.add_cluster('terminate') for _ in range(4)]
+    rejected_id = cluster_ids[2]
+    terminate_job_flows = backend.TerminateJobFlows
+
+    def reject_one_cluster(params):
+        if rejected_id in params['JobFlowIds']:
+            raise FakeApiError('ValidationException', 'Cluster ' + rejected_id + ' cannot be terminated')
+        return terminate_job_flows(params)
+    monkeypatch.setattr(backend, 'TerminateJobFlows', reject_one_cluster)
+
+    result = run_module(mode='terminate-all', name='terminate')
+    assert result['failed_ids'] == [rejected_id]
+    assert result['clusters'][rejected_id]['msg'] == 'Termination failed due to ValidationException'
+    assert all(backend.clusters[cluster_id]['State'] == 'TERMINATING' for cluster_id in cluster_ids if cluster_id != rejected_id)
+    assert backend.clusters[rejected_id]['State'] == 'WAITING'
+    # The rejected chunk, then every cluster on its own
+    assert backend.calls['TerminateJobFlows'] == 1 + 4
+
+
+def test_terminate_all_and_wait(run_module, backend):
+    cluster_ids = [backend.add_cluster('terminate') for _ in range(3)]
+
+    result = run_module(mode='terminate-all', name='terminate', wait=True)
+    assert not result.get('failed'), result.get('msg')
+    assert all(backend.clusters[cluster_id]['State'] == 'TERMINATED' for cluster_id in cluster_ids)
+    assert backend.calls['TerminateJobFlows'] == 1
+
+
+def test_terminate_all_without_clusters(run_module, backend):
+    result = run_module(mode='terminate-all', name='terminate')
+    assert not result.get('failed'), result.get('msg')
+    assert not result['changed'] and result['id'] == []
+    assert backend.calls['TerminateJobFlows'] == 0
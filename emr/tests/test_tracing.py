@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+
+import pytest
+
+import aws_emr
+import merge_traces
+from conftest import FakeModule, ModuleExit, build_params
+from fake_emr import FakeApiError
+
+
+@pytest.fixture
+def run_main(emr_client, spec_paths, monkeypatch):
+    # Runs aws_emr.run_module, the module's main, with the task arguments in place of the ones of stdin
+    monkeypatch.setattr(aws_emr, 'get_client', lambda *args, **kwargs: emr_client)
+
+    def run(**module_args):
+        monkeypatch.setattr(aws_emr, 'AnsibleModule', lambda **kwargs: FakeModule(build_params(module_args, spec_paths)))
+        try:
+            aws_emr.run_module()
+        except ModuleExit as err:
+            return err.result
+        return {}
+    return run
+
+
+def load_trace(trace_dir):
+    trace_files = os.listdir(str(trace_dir))
+    assert len(trace_files) == 1
+    with open(os.path.join(str(trace_dir), trace_files[0])) as trace_file:
+        return json.load(trace_file)['traceEvents']
+
+
+def get_spans(events, category=None):
+    return [event for event in events if event['ph'] == 'X' and category in (None, event['cat'])]
+
+
+def test_trace_of_a_module_run(run_main, backend, tmpdir):
+    cluster_id = backend.add_cluster('traced')
+    trace_dir = tmpdir.join('traces')
+
+    result = run_main(mode='describe', id=cluster_id, trace_path=str(trace_dir))
+    assert result['cluster']['Id'] == cluster_id
+    events = load_trace(trace_dir)
+    process_names = [event['args']['name'] for event in events if event['ph'] == 'M' and event['name'] == 'process_name']
+    assert process_names == ['aws_emr describe ' + cluster_id]
+    span_names = [span['name'] for span in get_spans(events, 'module')]
+    assert span_names == ['validate parameters', 'import botocore', 'create client', 'mode describe']
+    assert [span['name'] for span in get_spans(events, 'startup')][-2:] == ['load module', 'parse arguments']
+    api_spans = get_spans(events, 'api')
+    assert [span['name'] for span in api_spans] == ['DescribeCluster']
+    assert api_spans[0]['args'] == dict(status=200)
+    # Spans are sorted and the API call lies within the mode span
+    timestamps = [span['ts'] for span in get_spans(events)]
+    assert timestamps == sorted(timestamps)
+    mode_span = get_spans(events, 'module')[-1]
+    assert mode_span['ts'] <= api_spans[0]['ts'] <= api_spans[0]['ts'] + api_spans[0]['dur'] <= mode_span['ts'] + mode_span['dur']
+    assert aws_emr.tracer is None
+
+
+def test_trace_of_retried_calls(run_main, backend, tmpdir, monkeypatch):
+    cluster_id = backend.add_cluster('traced')
+    describe_cluster = backend.DescribeCluster
+    errors = [FakeApiError('ThrottlingException', 'Rate exceeded')]
+
+    def throttle_once(params):
+        if errors:
+            raise errors.pop(0)
+        return describe_cluster(params)
+    monkeypatch.setattr(backend, 'DescribeCluster', throttle_once)
+
+    run_main(mode='describe', id=cluster_id, trace_path=str(tmpdir.join('traces')))
+    events = load_trace(tmpdir.join('traces'))
+    assert [span['args'] for span in get_spans(events, 'api')] == [dict(status=400, error='ThrottlingException'), dict(status=200)]
+    assert [span['name'] for span in get_spans(events, 'wait')] == ['backoff DescribeCluster']
+
+
+def test_trace_of_a_failed_run(run_main, backend, tmpdir):
+    result = run_main(mode='describe', name='missing', trace_path=str(tmpdir.join('traces')))
+    assert result['failed']
+    events = load_trace(tmpdir.join('traces'))
+    assert get_spans(events, 'api')[0]['name'] == 'ListClusters'
+    assert aws_emr.tracer is None
+
+
+def test_trace_dir_from_the_environment(run_main, backend, tmpdir, monkeypatch):
+    cluster_id = backend.add_cluster('traced')
+    monkeypatch.setenv(aws_emr.TRACE_DIR_ENV, str(tmpdir.join('traces')))
+
+    run_main(mode='check-status', id=cluster_id)
+    assert len(get_spans(load_trace(tmpdir.join('traces')), 'api')) == 1
+
+
+def test_no_trace_by_default(run_main, backend, tmpdir, monkeypatch):
+    monkeypatch.delenv(aws_emr.TRACE_DIR_ENV, raising=False)
+    monkeypatch.chdir(str(tmpdir.mkdir('work')))
+    cluster_id = backend.add_cluster('traced')
+
+    run_main(mode='describe', id=cluster_id)
+    assert os.listdir('.') == []
+    assert aws_emr.tracer is None
+
+
+def test_merge_traces(run_main, backend, tmpdir, monkeypatch, capsys):
+    cluster_ids = [backend.add_cluster('traced-%d' % index) for index in range(2)]
+    trace_dir = tmpdir.join('traces')
+    for cluster_id in cluster_ids:
+        run_main(mode='describe', id=cluster_id, trace_path=str(trace_dir))
+    merged_path = tmpdir.join('merged.json')
+
+    monkeypatch.setattr(sys, 'argv', ['merge_traces.py', str(trace_dir), '-o', str(merged_path)])
+    merge_traces.main()
+    events = json.loads(merged_path.read())['traceEvents']
+    # Every run gets its own process row, in the order the runs started
+    process_names = dict((event['pid'], event['args']['name']) for event in events if event['name'] == 'process_name')
+    assert process_names == {1: 'aws_emr describe ' + cluster_ids[0], 2: 'aws_emr describe ' + cluster_ids[1]}
+    assert len(get_spans(events, 'api')) == 2
+    assert 'runs: 2' in capsys.readouterr().out
@@ -0,0 +1,52 @@
+def test_wait_until_the_cluster_is_ready(run_module, backend):
+    cluster_id = backend.add_cluster('wait', state='STARTING')
+
+    result = run_module(mode='wait', id=cluster_id)
+    assert not result.get('failed'), result.get('msg')
+    assert result['state'] == 'WAITING'
+    assert [entry['state'] for entry in result['wait']['timeline']] == ['STARTING', 'BOOTSTRAPPING', 'WAITING']
+    # STARTING and BOOTSTRAPPING take transition_calls reads each, the last one returns the next state
+    assert backend.calls['DescribeCluster'] == 2 * backend.transition_calls
+
+
+def test_wait_by_name(run_module, backend):
+    cluster_id = backend.add_cluster('wait', state='STARTING')
+
+    result = run_module(mode='wait', name='wait')
+    assert not result.get('failed'), result.get('msg')
+    assert result['cluster_id'] == cluster_id
+    assert result['state'] == 'WAITING'
+
+
+def test_wait_for_given_states(run_module, backend):
+    cluster_id = backend.add_cluster('wait', state='TERMINATING')
+
+    result = run_module(mode='wait', id=cluster_id, wait_states=['TERMINATED'])
+    assert not result.get('failed'), result.get('msg')
+    assert result['state'] == 'TERMINATED'
+
+
+def test_wait_fails_when_the_cluster_terminates(run_module, backend):
+    cluster_id = backend.add_cluster('wait', state='TERMINATING')
+
+    result = run_module(mode='wait', id=cluster_id)
+    assert result['failed']
+    assert result['msg'].startswith('Wait ended in state TERMINATED')
+    assert result['wait']['state'] == 'TERMINATED'
+
+
+def test_wait_times_out(run_module, backend):
+    cluster_id = backend.add_cluster('wait', state='STARTING')
+
+    result = run_module(mode='wait', id=cluster_id, wait_timeout=0)
+    assert result['failed']
+    assert result['msg'] == 'Timed out after 0.0 seconds in state STARTING'
+    assert backend.calls['DescribeCluster'] == 1
+
+
+def test_ready_cluster_is_read_once(run_module, backend):
+    cluster_id = backend.add_cluster('wait')
+
+    result = run_module(mode='wait', id=cluster_id)
+    assert result['state'] == 'WAITING'
+    assert backend.calls['DescribeCluster'] == 1